@@ -0,0 +1,156 @@
+"""Control de admisión para las rutas de escritura de la API.
+
+Una ráfaga de POST grandes puede ocupar todos los hilos de los workers y
+dejar sin servicio a las lecturas. Este módulo pone límites antes de que
+la petición llegue a la base de datos:
+
+- Tamaño máximo del cuerpo (`MAX_BODY_BYTES`, aplicado por Flask con
+  `MAX_CONTENT_LENGTH` antes de leer el JSON) y de registros por petición
+  (`MAX_RECORDS_PER_REQUEST`): responden `413`.
+- Límite por cliente con token bucket (`WRITE_RATE` peticiones/s con
+  ráfagas de hasta `WRITE_BURST`): responde `429` con `Retry-After`.
+- Presupuesto de escrituras en curso por worker (`WRITE_CONCURRENCY`): si
+  está agotado responde `503` con `Retry-After` en lugar de encolar. Como
+  es menor que `API_THREADS`, siempre quedan hilos libres para lecturas.
+
+Los contadores son por proceso: con N workers el límite efectivo por
+cliente es N veces `WRITE_RATE`.
+
+El cliente se identifica por `request.remote_addr`. Detrás de nginx,
+`init_app` envuelve la app en `ProxyFix` para tomar de `X-Forwarded-For`
+sólo las `TRUSTED_PROXIES` entradas que agregan los proxies propios (las
+últimas): las anteriores las pone el cliente y podrían cambiar en cada
+petición para esquivar el límite.
+"""
+import math
+import os
+import threading
+import time
+from functools import wraps
+from typing import Any, Callable, Dict, Tuple
+
+from flask import jsonify, request
+
+MAX_BODY_BYTES: int = int(os.getenv('MAX_BODY_BYTES', str(10 * 1024 * 1024)))
+MAX_RECORDS_PER_REQUEST: int = int(os.getenv('MAX_RECORDS_PER_REQUEST', '5000'))
+WRITE_RATE: float = float(os.getenv('WRITE_RATE', '5'))
+WRITE_BURST: float = float(os.getenv('WRITE_BURST', '20'))
+WRITE_CONCURRENCY: int = int(os.getenv('WRITE_CONCURRENCY', '4'))
+BUSY_RETRY_AFTER: int = int(os.getenv('BUSY_RETRY_AFTER', '1'))
+# Proxies de confianza delante de la API (nginx = 1); 0 si se expone directamente
+TRUSTED_PROXIES: int = int(os.getenv('TRUSTED_PROXIES', '1'))
+
+_MAX_TRACKED_CLIENTS = 10000
+
+_buckets: Dict[str, Tuple[float, float]] = {}
+_buckets_lock = threading.Lock()
+_write_slots = threading.BoundedSemaphore(max(1, WRITE_CONCURRENCY))
+_counters = {'in_flight': 0, 'admitted': 0, 'rate_limited': 0, 'busy': 0, 'too_large': 0}
+_counters_lock = threading.Lock()
+
+
+def _count(name: str, delta: int = 1) -> None:
+    with _counters_lock:
+        _counters[name] += delta
+
+
+def client_key() -> str:
+    """Identifica al cliente por su IP (la que vio el proxy de confianza, ver `init_app`)."""
+    return request.remote_addr or 'unknown'
+
+
+def take_token(key: str, now: float | None = None) -> float:
+    """Consume un token del bucket de `key`.
+
+    @returns 0 si se admitió, o los segundos hasta que haya un token disponible.
+    """
+    now = time.monotonic() if now is None else now
+    with _buckets_lock:
+        tokens, last = _buckets.get(key, (WRITE_BURST, now))
+        tokens = min(WRITE_BURST, tokens + (now - last) * WRITE_RATE)
+        if tokens >= 1:
+            _buckets[key] = (tokens - 1, now)
+            wait = 0.0
+        else:
+            _buckets[key] = (tokens, now)
+            wait = (1 - tokens) / WRITE_RATE if WRITE_RATE > 0 else float(BUSY_RETRY_AFTER)
+        if len(_buckets) > _MAX_TRACKED_CLIENTS:
+            # Olvidar clientes inactivos (su bucket ya estaría lleno)
+            idle = (WRITE_BURST / WRITE_RATE) if WRITE_RATE > 0 else 0
+            for k in [k for k, (_, t) in _buckets.items() if now - t >= idle]:
+                del _buckets[k]
+    return wait
+
+
+def _reject(status: int, message: str, retry_after: float):
+    resp = jsonify({'error': message, 'retry_after': math.ceil(retry_after)})
+    resp.status_code = status
+    resp.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return resp
+
+
+def too_many_records(count: int):
+    """Respuesta 413 si `count` supera `MAX_RECORDS_PER_REQUEST`, o None si se admite."""
+    if count <= MAX_RECORDS_PER_REQUEST:
+        return None
+    _count('too_large')
+    resp = jsonify({'error': f'Too many records ({count}, max {MAX_RECORDS_PER_REQUEST})'})
+    resp.status_code = 413
+    return resp
+
+
+def admit_write(view: Callable[..., Any]) -> Callable[..., Any]:
+    """Decorador para rutas de escritura: rate limit por cliente y presupuesto de concurrencia."""
+
+    @wraps(view)
+    def _wrapped(*args: Any, **kwargs: Any) -> Any:
+        if request.content_length is not None and request.content_length > MAX_BODY_BYTES:
+            # Rechazo antes de gastar un token o un hueco de escritura
+            _count('too_large')
+            resp = jsonify({'error': f'Payload too large (max {MAX_BODY_BYTES} bytes)'})
+            resp.status_code = 413
+            return resp
+        wait = take_token(client_key())
+        if wait > 0:
+            _count('rate_limited')
+            return _reject(429, 'Write rate limit exceeded', wait)
+        if not _write_slots.acquire(blocking=False):
+            _count('busy')
+            return _reject(503, 'Too many writes in progress', BUSY_RETRY_AFTER)
+        _count('admitted')
+        _count('in_flight')
+        try:
+            return view(*args, **kwargs)
+        finally:
+            _count('in_flight', -1)
+            _write_slots.release()
+
+    return _wrapped
+
+
+def init_app(app: Any) -> None:
+    """Aplica el tamaño máximo de cuerpo (413 en JSON) y confía sólo en `TRUSTED_PROXIES` saltos de X-Forwarded-For."""
+    app.config['MAX_CONTENT_LENGTH'] = MAX_BODY_BYTES
+    if TRUSTED_PROXIES > 0:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES)
+
+    @app.errorhandler(413)
+    def _payload_too_large(_err: Any):
+        _count('too_large')
+        return jsonify({'error': f'Payload too large (max {MAX_BODY_BYTES} bytes)'}), 413
+
+
+def stats() -> Dict[str, Any]:
+    with _counters_lock:
+        counters = dict(_counters)
+    return {
+        'write_concurrency': WRITE_CONCURRENCY,
+        'write_rate': WRITE_RATE,
+        'write_burst': WRITE_BURST,
+        'max_records': MAX_RECORDS_PER_REQUEST,
+        'max_body_bytes': MAX_BODY_BYTES,
+        'trusted_proxies': TRUSTED_PROXIES,
+        **counters,
+    }
@@ -0,0 +1,166 @@
+"""Detección incremental de anomalías por celda y tipo de crimen.
+
+Cada celda es `(lat redondeada a 2 decimales, lon redondeada, primary_type)`,
+la misma grilla que usan los puntos calientes del mapa. Por celda se
+guardan dos conteos con decaimiento exponencial:
+
+- `fast`: vida media `ANOMALY_FAST_HALF_LIFE_H` (tasa actual).
+- `slow`: vida media `ANOMALY_SLOW_HALF_LIFE_H` (línea base).
+
+Sumar un evento cuesta O(1): se decae el conteo desde `last_ts` hasta el
+instante del evento y se suma 1 (un evento anterior a `last_ts` suma su
+peso ya decaído). Un conteo con decaimiento λ estima la tasa como
+`conteo * λ`, así que no hace falta volver a recorrer el historial.
+
+Una celda se marca como anómala cuando su conteo reciente supera lo que
+predice la línea base con un z-score de Poisson >= `ANOMALY_Z` y tiene al
+menos `ANOMALY_MIN_COUNT` eventos recientes. El "ahora" es el reloj del
+stream (el evento más reciente ingerido), para que cargar datos históricos
+también produzca alertas coherentes. Las fechas futuras se toman como el
+momento de la ingesta: un solo registro mal fechado adelantaría el reloj y
+decaería todas las celdas reales, callando las alertas hasta esa fecha.
+
+Una celda nueva no tiene línea base: su primera ráfaga también forma el
+conteo `slow` y, con los valores por defecto, 5 eventos juntos dan z ≈ 4.4.
+Por eso sólo se evalúan las celdas cuyo primer evento (`first_ts`) tiene al
+menos `ANOMALY_WARMUP_H` horas (por defecto, una vida media de la línea
+base); así la primera sincronización de una base vacía no marca todas las
+celdas con actividad reciente. Las celdas guardadas antes de registrar
+`first_ts` se consideran maduras.
+
+Las bajas de registros no descuentan eventos: el efecto de un registro
+borrado desaparece solo al decaer.
+"""
+import math
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+ANOMALY_FAST_HALF_LIFE_H: float = float(os.getenv('ANOMALY_FAST_HALF_LIFE_H', '6'))
+ANOMALY_SLOW_HALF_LIFE_H: float = float(os.getenv('ANOMALY_SLOW_HALF_LIFE_H', '168'))
+ANOMALY_Z: float = float(os.getenv('ANOMALY_Z', '3'))
+ANOMALY_MIN_COUNT: float = float(os.getenv('ANOMALY_MIN_COUNT', '5'))
+# Antigüedad mínima de una celda (desde su primer evento) para evaluarla
+ANOMALY_WARMUP_H: float = float(os.getenv('ANOMALY_WARMUP_H', str(ANOMALY_SLOW_HALF_LIFE_H)))
+GRID_DECIMALS: int = 2
+
+_FAST_LAMBDA = math.log(2) / (ANOMALY_FAST_HALF_LIFE_H * 3600)
+_SLOW_LAMBDA = math.log(2) / (ANOMALY_SLOW_HALF_LIFE_H * 3600)
+
+CellKey = Tuple[float, float, str]
+
+
+def event_ts(value: Any) -> Optional[float]:
+    """Instante del evento en segundos epoch (fechas sin zona se toman como UTC)."""
+    if value is None:
+        return None
+    if hasattr(value, 'to_pydatetime'):
+        value = value.to_pydatetime()
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def cell_key(rec: Dict[str, Any]) -> Optional[CellKey]:
+    """Celda de un registro, o None si no tiene coordenadas."""
+    try:
+        lat = float(rec.get('latitude'))
+        lon = float(rec.get('longitude'))
+    except (TypeError, ValueError):
+        return None
+    if math.isnan(lat) or math.isnan(lon):
+        return None
+    return (round(lat, GRID_DECIMALS), round(lon, GRID_DECIMALS), str(rec.get('primary_type') or 'UNKNOWN'))
+
+
+def new_cell() -> Dict[str, Any]:
+    return {'fast': 0.0, 'slow': 0.0, 'last_ts': None, 'first_ts': None, 'total': 0}
+
+
+def add_event(cell: Dict[str, Any], ts: float) -> None:
+    """Suma un evento en `ts` a la celda (O(1), admite eventos fuera de orden)."""
+    last = cell['last_ts']
+    if last is None:
+        cell['fast'], cell['slow'], cell['last_ts'] = 1.0, 1.0, ts
+        cell['first_ts'] = ts
+    elif ts >= last:
+        dt = ts - last
+        cell['fast'] = cell['fast'] * math.exp(-_FAST_LAMBDA * dt) + 1.0
+        cell['slow'] = cell['slow'] * math.exp(-_SLOW_LAMBDA * dt) + 1.0
+        cell['last_ts'] = ts
+    else:
+        dt = last - ts
+        cell['fast'] += math.exp(-_FAST_LAMBDA * dt)
+        cell['slow'] += math.exp(-_SLOW_LAMBDA * dt)
+        if cell.get('first_ts') is not None:
+            cell['first_ts'] = min(cell['first_ts'], ts)
+    cell['total'] += 1
+
+
+def group_events(records: Iterable[Dict[str, Any]], default_ts: float) -> Dict[CellKey, List[float]]:
+    """Agrupa los registros por celda con el instante de cada evento.
+
+    @param default_ts Instante de la ingesta: se usa para los registros sin
+        fecha y como tope de las fechas futuras.
+    """
+    events: Dict[CellKey, List[float]] = {}
+    for rec in records:
+        key = cell_key(rec)
+        if key is None:
+            continue
+        ts = event_ts(rec.get('date'))
+        events.setdefault(key, []).append(default_ts if ts is None else min(ts, default_ts))
+    return events
+
+
+def score(cell: Dict[str, Any], now: float) -> Dict[str, float]:
+    """Tasas actual y base (eventos/hora) de la celda vistas desde `now`, y su z-score."""
+    dt = max(0.0, now - cell['last_ts'])
+    fast = cell['fast'] * math.exp(-_FAST_LAMBDA * dt)
+    slow = cell['slow'] * math.exp(-_SLOW_LAMBDA * dt)
+    current_rate = fast * _FAST_LAMBDA
+    baseline_rate = slow * _SLOW_LAMBDA
+    # Conteo reciente esperado si la celda siguiera su línea base
+    expected = baseline_rate / _FAST_LAMBDA
+    z = (fast - expected) / math.sqrt(expected + 1.0)
+    return {
+        'recent_count': fast,
+        'current_rate_per_h': current_rate * 3600,
+        'baseline_rate_per_h': baseline_rate * 3600,
+        'ratio': current_rate / baseline_rate if baseline_rate > 0 else float('inf'),
+        'z': z,
+    }
+
+
+def detect(
+    cells: Iterable[Tuple[CellKey, Dict[str, Any]]],
+    now: float,
+    min_z: float = ANOMALY_Z,
+    min_count: float = ANOMALY_MIN_COUNT,
+    limit: int = 50,
+    warmup_h: float = ANOMALY_WARMUP_H,
+) -> List[Dict[str, Any]]:
+    """Celdas anómalas ordenadas por z-score descendente (sin las celdas todavía en calentamiento)."""
+    flagged = []
+    for (lat, lon, primary_type), cell in cells:
+        first = cell.get('first_ts')
+        if first is not None and now - first < warmup_h * 3600:
+            continue
+        s = score(cell, now)
+        if s['recent_count'] >= min_count and s['z'] >= min_z:
+            flagged.append({
+                'latitude': lat,
+                'longitude': lon,
+                'primary_type': primary_type,
+                'total': cell['total'],
+                **{k: round(v, 3) if math.isfinite(v) else None for k, v in s.items()},
+            })
+    flagged.sort(key=lambda a: a['z'], reverse=True)
+    return flagged[:limit]
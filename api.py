@@ -1,13 +1,78 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, send_file, stream_with_context
 from flask_cors import CORS
-from typing import Any, Dict, List
+from werkzeug.exceptions import RequestEntityTooLarge
+from typing import Any, Callable, Dict, List
+import os
+import hmac
+import math
 import json
 from datetime import datetime
 
+import admission
+import clustering
 import db_postgres as db
+import export
+import profiling
+import querylog
+import retention
+import shared_cache
+import tracing
+import sources
+import validation
 
 app = Flask(__name__)
 CORS(app)
+admission.init_app(app)
+
+# Token para las rutas /admin/* (cabecera X-Admin-Token); vacío las desactiva
+ADMIN_API_TOKEN: str = os.getenv('ADMIN_API_TOKEN', '')
+# Máximo de ids aceptados por /records/batch-get y /records/batch-delete
+MAX_BATCH_IDS: int = int(os.getenv('MAX_BATCH_IDS', '10000'))
+# Máximo de errores por fila incluidos en la respuesta de POST /records
+MAX_REPORTED_ERRORS: int = int(os.getenv('MAX_REPORTED_ERRORS', '100'))
+# Máximo de entradas del registro de cambios por página de /records/changes
+MAX_CHANGES_PAGE: int = int(os.getenv('MAX_CHANGES_PAGE', '5000'))
+
+
+@app.before_request
+def _read_floor():
+    # Read-your-writes across workers: clients echo X-Write-LSN from a write as X-Min-LSN
+    db.set_read_floor(request.headers.get('X-Min-LSN'))
+
+
+@app.before_request
+def _start_trace():
+    # One trace per request; a client-supplied X-Trace-Id is adopted so both sides share the id
+    rule = request.url_rule.rule if request.url_rule is not None else request.path
+    g.trace = tracing.begin(f'{request.method} {rule}', request.headers.get(tracing.TRACE_HEADER))
+    # Profiling mode (PROFILING_ENABLED or POST /admin/profiling): one cProfile per request,
+    # except the admin routes, which would rotate out the profiles being inspected
+    if not request.path.startswith('/admin/'):
+        g.profile = profiling.start()
+
+
+@app.after_request
+def _write_lsn_header(resp: Response) -> Response:
+    lsn = db.thread_write_lsn()
+    if lsn:
+        resp.headers['X-Write-LSN'] = lsn
+    trace_id = tracing.current_trace_id()
+    if trace_id:
+        resp.headers[tracing.TRACE_HEADER] = trace_id
+    g.trace_status = resp.status_code
+    return resp
+
+
+@app.teardown_request
+def _end_trace(exc):
+    token = g.pop('trace', None)
+    status = g.pop('trace_status', 500 if exc is not None else None)
+    rule = request.url_rule.rule if request.url_rule is not None else request.path
+    profiling.stop(g.pop('profile', None), 'api', f'{request.method} {rule}', status=status)
+    if exc is not None:
+        tracing.end(token, status=status, error=type(exc).__name__)
+    else:
+        tracing.end(token, status=status)
 
 
 def _serialize_row(row: Dict[str, Any]) -> Dict[str, Any]:
@@ -24,9 +89,205 @@ def _serialize_row(row: Dict[str, Any]) -> Dict[str, Any]:
     return out
 
 
+@tracing.traced('serialize')
+def _serialize_rows(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [_serialize_row(r) for r in rows]
+
+
+def _batch_ids_from_request() -> List[Any] | None:
+    """Accept either a JSON list of ids or {"ids": [...]}."""
+    payload = request.get_json(silent=True)
+    if isinstance(payload, dict):
+        payload = payload.get('ids')
+    if not isinstance(payload, list):
+        return None
+    return payload
+
+
+def _bool_arg(name: str) -> bool | None:
+    """Parse an optional boolean query parameter (None when absent)."""
+    raw = request.args.get(name)
+    if raw is None:
+        return None
+    return raw.lower() in ('1', 'true', 'yes')
+
+
+def _admin_denied():
+    """None if the request carries the admin token, otherwise the error response."""
+    if not ADMIN_API_TOKEN:
+        return jsonify({'error': 'Not found'}), 404
+    supplied = request.headers.get('X-Admin-Token', '')
+    if not hmac.compare_digest(supplied.encode(), ADMIN_API_TOKEN.encode()):
+        return jsonify({'error': 'Forbidden'}), 403
+    return None
+
+
+def _cached_json(key: str, build: Callable[[], Any]) -> Response:
+    """Serve a JSON response from the cross-worker cache, building it on a miss.
+
+    Entries are keyed on the database write counter too, so writes made
+    outside the API (dashboard, loadgen, retention) invalidate them as well.
+    """
+    key = f'{key}:v{db.data_version()}'
+    with tracing.span('cache.get'):
+        payload = shared_cache.get(key)
+    if payload is not None:
+        resp = Response(payload, mimetype='application/json')
+        resp.headers['X-Cache'] = 'HIT'
+        return resp
+    # Read the version before querying so a concurrent write invalidates this fill
+    version = shared_cache.current_version()
+    with tracing.span('build'):
+        data = build()
+    with tracing.span('jsonify'):
+        resp = jsonify(data)
+    with tracing.span('cache.put'):
+        shared_cache.put(key, resp.get_data(), version)
+    resp.headers['X-Cache'] = 'MISS'
+    return resp
+
+
 @app.route('/health', methods=['GET'])
 def health():
-    return jsonify({'status': 'ok'})
+    # /health?deep=1 also checks the database (first call initializes the schema)
+    if not _bool_arg('deep'):
+        return jsonify({'status': 'ok'})
+    check = db.check_ready()
+    extra = {
+        'cache': shared_cache.stats(),
+        'admission': admission.stats(),
+        'clustering': clustering.stats(),
+        'routing': db.routing_stats(),
+        'retention': retention.last_report(),
+        'queries': querylog.stats(),
+    }
+    if not check['ok']:
+        return jsonify({'status': 'degraded', 'db': check, **extra}), 503
+    return jsonify({'status': 'ok', 'db': check, **extra})
+
+
+@app.route('/admin/slow-queries', methods=['GET'])
+def get_slow_queries():
+    # Slow statements seen by this worker, newest first: /admin/slow-queries?limit=50 (X-Admin-Token)
+    denied = _admin_denied()
+    if denied:
+        return denied
+    try:
+        limit = max(int(request.args.get('limit', 50)), 1)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    entries = querylog.recent(limit)
+    if _bool_arg('clear'):
+        querylog.clear()
+    return jsonify({'pid': os.getpid(), 'stats': querylog.stats(), 'count': len(entries), 'queries': entries})
+
+
+@app.route('/admin/traces', methods=['GET'])
+def get_traces():
+    # Recent traces of this worker plus per-stage self time: /admin/traces?limit=50&percentile=99&name=GET /records
+    denied = _admin_denied()
+    if denied:
+        return denied
+    try:
+        limit = max(int(request.args.get('limit', 50)), 1)
+        percentile = min(max(float(request.args.get('percentile', 0)), 0), 100)
+    except ValueError:
+        return jsonify({'error': 'limit and percentile must be numbers'}), 400
+    return jsonify({
+        'pid': os.getpid(),
+        'traces': tracing.recent(limit),
+        'stages': tracing.stage_summary(percentile, name=request.args.get('name') or None),
+    })
+
+
+@app.route('/admin/traces/<string:trace_id>', methods=['GET'])
+def get_trace(trace_id: str):
+    # Full span tree; ?format=text returns the flame view as plain text
+    denied = _admin_denied()
+    if denied:
+        return denied
+    finished = tracing.get(trace_id)
+    if finished is None:
+        return jsonify({'error': 'Not found'}), 404
+    if request.args.get('format') == 'text':
+        return Response(tracing.flame(finished) + '\n', mimetype='text/plain')
+    return jsonify(finished)
+
+
+@app.route('/admin/profiling', methods=['GET', 'POST'])
+def profiling_mode():
+    # GET: mode and stored profiles; POST {"enabled": true|false}: toggle for every process sharing PROFILE_DIR
+    denied = _admin_denied()
+    if denied:
+        return denied
+    if request.method == 'POST':
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict) or not isinstance(payload.get('enabled'), bool):
+            return jsonify({'error': 'Expected {"enabled": true|false}'}), 400
+        profiling.set_enabled(payload['enabled'])
+    try:
+        limit = max(int(request.args.get('limit', 50)), 1)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    return jsonify({'enabled': profiling.enabled(), 'profiles': profiling.list_profiles(limit)})
+
+
+@app.route('/admin/retention', methods=['GET', 'POST'])
+def retention_run():
+    # GET: last report; POST {"dry_run": bool, "compact": bool}: run archival/compaction now (blocks until done)
+    denied = _admin_denied()
+    if denied:
+        return denied
+    if request.method == 'GET':
+        return jsonify({'report': retention.last_report()})
+    payload = request.get_json(silent=True)
+    if payload is None:
+        payload = {}
+    if not isinstance(payload, dict) or any(
+        not isinstance(payload.get(k, False), bool) for k in ('dry_run', 'compact')
+    ):
+        return jsonify({'error': 'Expected {"dry_run": true|false, "compact": true|false}'}), 400
+    try:
+        report = retention.run_retention(
+            dry_run=payload.get('dry_run', False),
+            compact=payload.get('compact', True),
+        )
+    except RuntimeError as e:
+        # Already running (RetentionBusy) or ARCHIVE_DIR is not durable storage
+        return jsonify({'error': str(e)}), 409
+    archived = sum(s.get('archived', 0) for s in report['sources'].values())
+    if archived or report.get('chicago_db', {}).get('duplicates_removed'):
+        shared_cache.bump_version()
+    return jsonify({'report': report})
+
+
+@app.route('/admin/profiles/<string:profile_id>', methods=['GET'])
+def get_profile(profile_id: str):
+    # Top-N hotspots by cumulative and own time
+    denied = _admin_denied()
+    if denied:
+        return denied
+    summary = profiling.get_profile(profile_id)
+    if summary is None:
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify(summary)
+
+
+@app.route('/admin/profiles/<string:profile_id>/download', methods=['GET'])
+def download_profile(profile_id: str):
+    # Raw pstats file for offline analysis (python -m pstats, snakeviz)
+    denied = _admin_denied()
+    if denied:
+        return denied
+    path = profiling.profile_path(profile_id)
+    if path is None:
+        return jsonify({'error': 'Not found'}), 404
+    return send_file(
+        os.path.abspath(path),
+        mimetype='application/octet-stream',
+        as_attachment=True,
+        download_name=f'{profile_id}.prof',
+    )
 
 
 @app.route('/records', methods=['GET'])
@@ -35,18 +296,172 @@ def get_records():
         limit = int(request.args.get('limit', 1000))
     except Exception:
         limit = 1000
+    replay = _bool_arg('replay')
+
+    def _build() -> Dict[str, Any]:
+        rows = db.fetch_latest_crimes(limit=limit, replay=replay)
+        rows = _serialize_rows(rows)
+        return {'count': len(rows), 'records': rows}
+
+    try:
+        return _cached_json(f'records:{limit}:{replay}', _build)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/records/search', methods=['GET'])
+def search_records():
+    # /records/search?q=robo centro&limit=50&offset=0 (ranked, every word must match)
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Missing query parameter q'}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 1000)
+        offset = max(int(request.args.get('offset', 0)), 0)
+    except ValueError:
+        return jsonify({'error': 'limit and offset must be integers'}), 400
+    replay = _bool_arg('replay')
+
+    def _build() -> Dict[str, Any]:
+        result = db.search_crimes(query, limit=limit, offset=offset, replay=replay)
+        rows = _serialize_rows(result['records'])
+        return {
+            'query': query,
+            'total': result['total'],
+            'limit': limit,
+            'offset': offset,
+            'count': len(rows),
+            'records': rows,
+        }
+
     try:
-        rows = db.fetch_latest_crimes(limit=limit)
-        rows = [_serialize_row(r) for r in rows]
-        return jsonify({'count': len(rows), 'records': rows})
+        return _cached_json(f'search:{query}:{limit}:{offset}:{replay}', _build)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/records/changes', methods=['GET'])
+def get_changes():
+    # Delta sync: /records/changes?since=<next_since of the previous page>&limit=1000
+    try:
+        since = max(int(request.args.get('since', 0)), 0)
+        limit = min(max(int(request.args.get('limit', 1000)), 1), MAX_CHANGES_PAGE)
+    except ValueError:
+        return jsonify({'error': 'since and limit must be integers'}), 400
+    try:
+        page = db.fetch_changes(since=since, limit=limit, replay=_bool_arg('replay'))
+        page['upserts'] = _serialize_rows(page['upserts'])
+        return jsonify(page)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/anomalies', methods=['GET'])
+def get_anomalies():
+    # Cells whose recent rate exceeds their baseline: /anomalies?limit=50&min_z=3&min_count=5
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 1000)
+        min_z = float(request.args['min_z']) if 'min_z' in request.args else None
+        min_count = float(request.args['min_count']) if 'min_count' in request.args else None
+    except ValueError:
+        return jsonify({'error': 'limit, min_z and min_count must be numbers'}), 400
+
+    def _build() -> Dict[str, Any]:
+        result = db.detect_anomalies(limit=limit, min_z=min_z, min_count=min_count)
+        return {'count': len(result['anomalies']), **result}
+
+    try:
+        return _cached_json(f'anomalies:{limit}:{min_z}:{min_count}', _build)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def _mobile_error(message: str, status: int):
+    """Error in the app's ApiResponse shape ({success, data, message})."""
+    return jsonify({'success': False, 'data': None, 'message': message}), status
+
+
+def _zones_loading():
+    """Empty, uncached zone list while this worker's index loads in the background."""
+    resp = jsonify({'success': True, 'data': [], 'message': 'Danger zones are still loading'})
+    resp.headers['Retry-After'] = str(max(1, math.ceil(clustering.CLUSTER_REFRESH_S)))
+    return resp
+
+
+@app.route('/ubicaciones', methods=['GET'])
+def get_ubicaciones():
+    # Danger zones for the Android app (nginx serves them under /api/ubicaciones)
+    try:
+        limit = min(max(int(request.args.get('limit', 500)), 1), 5000)
+    except ValueError:
+        return _mobile_error('limit must be an integer', 400)
+    nivel = request.args.get('nivel', '').strip().upper() or None
+
+    try:
+        if not clustering.warm():
+            return _zones_loading()
+    except Exception as e:
+        return _mobile_error(str(e), 500)
+
+    def _build() -> Dict[str, Any]:
+        zones = clustering.danger_zones()
+        if nivel:
+            zones = [z for z in zones if z['nivel_peligro'] == nivel]
+        return {'success': True, 'data': zones[:limit], 'message': None}
+
+    try:
+        return _cached_json(f'ubicaciones:{limit}:{nivel}', _build)
+    except Exception as e:
+        return _mobile_error(str(e), 500)
+
+
+@app.route('/ubicaciones/cercanas', methods=['GET'])
+def get_ubicaciones_cercanas():
+    # /ubicaciones/cercanas?lat=-16.4&lng=-71.53&radio=5000 (radio in meters)
+    try:
+        lat = float(request.args['lat'])
+        lng = float(request.args['lng'])
+        radio = min(max(float(request.args.get('radio', 5000)), 0.0), 100000.0)
+    except KeyError:
+        return _mobile_error('Missing query parameters lat and lng', 400)
+    except ValueError:
+        return _mobile_error('lat, lng and radio must be numbers', 400)
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return _mobile_error('lat/lng out of range', 400)
+
+    try:
+        if not clustering.warm():
+            return _zones_loading()
+    except Exception as e:
+        return _mobile_error(str(e), 500)
+
+    def _build() -> Dict[str, Any]:
+        return {'success': True, 'data': clustering.zones_near(lat, lng, radio), 'message': None}
+
+    try:
+        # Rounded to ~10 m so nearby phones share cache entries
+        return _cached_json(f'ubicaciones:near:{lat:.4f}:{lng:.4f}:{radio:.0f}', _build)
+    except Exception as e:
+        return _mobile_error(str(e), 500)
+
+
+@app.route('/ubicaciones/<string:zone_id>', methods=['GET'])
+def get_ubicacion(zone_id: str):
+    try:
+        if not clustering.warm():
+            return _mobile_error('Danger zones are still loading', 503)
+        zone = clustering.find_zone(zone_id)
+    except Exception as e:
+        return _mobile_error(str(e), 500)
+    if zone is None:
+        return _mobile_error('Zone not found', 404)
+    return jsonify({'success': True, 'data': zone, 'message': None})
+
+
 @app.route('/records/<string:crime_id>', methods=['GET'])
 def get_record(crime_id: str):
     try:
-        rec = db.fetch_crime_by_id(crime_id)
+        rec = db.fetch_crime_by_id(crime_id, replay=_bool_arg('replay'))
         if rec is None:
             return jsonify({'error': 'Not found'}), 404
         return jsonify(_serialize_row(rec))
@@ -55,11 +470,14 @@ def get_record(crime_id: str):
 
 
 @app.route('/records', methods=['POST'])
+@admission.admit_write
 def post_records():
     try:
         payload = request.get_json()
         if payload is None:
             return jsonify({'error': 'Invalid JSON payload'}), 400
+        # Ingest mode: ?mode=synthetic or {"mode": "synthetic", "records": [...]}
+        mode = request.args.get('mode', db.INGEST_REAL)
         # Accept either single object or list
         records: List[Dict[str, Any]] = []
         if isinstance(payload, list):
@@ -68,18 +486,64 @@ def post_records():
             # API clients might send a wrapper {"records": [...]}
             if 'records' in payload and isinstance(payload['records'], list):
                 records = payload['records']
+                mode = payload.get('mode', mode)
             else:
                 records = [payload]
         else:
             return jsonify({'error': 'Invalid payload format'}), 400
+        rejected = admission.too_many_records(len(records))
+        if rejected is not None:
+            return rejected
 
-        db.insert_crimes(records)
-        return jsonify({'status': 'ok', 'inserted': len(records)})
+        if mode not in db.INGEST_MODES:
+            return jsonify({'error': f'Invalid ingest mode {mode!r}, expected one of {db.INGEST_MODES}'}), 400
+
+        # Invalid rows are reported and skipped; the rest are still written
+        valid, errors = validation.validate_records(records)
+        report = {'rejected': len(errors), 'errors': errors[:MAX_REPORTED_ERRORS]}
+        if errors and not valid:
+            return jsonify({'error': 'No valid records', 'received': len(records), **report}), 422
+        stats = db.insert_crimes(valid, mode=mode)
+        if stats['inserted'] or stats['updated']:
+            shared_cache.bump_version()
+        return jsonify({'status': 'ok', 'received': len(records), **stats, **report})
+    except RequestEntityTooLarge:
+        raise
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/sources/webhook', methods=['POST'])
+@admission.admit_write
+def push_webhook():
+    # Records pushed here feed the dashboard's webhook source (sources.WebhookSpoolSource),
+    # not the database; accepts a list, {"records": [...]} or a single object
+    if not sources.SOURCE_WEBHOOK_DIR:
+        return jsonify({'error': 'Webhook source disabled (set SOURCE_WEBHOOK_DIR)'}), 404
+    try:
+        payload = request.get_json(silent=True)
+        records = sources.payload_records(payload)
+        if payload is None or not records:
+            return jsonify({'error': 'Invalid JSON payload'}), 400
+        rejected = admission.too_many_records(len(records))
+        if rejected is not None:
+            return rejected
+        valid, errors = validation.validate_records(records)
+        report = {'rejected': len(errors), 'errors': errors[:MAX_REPORTED_ERRORS]}
+        if not valid:
+            return jsonify({'error': 'No valid records', 'received': len(records), **report}), 422
+        spooled = sources.spool_webhook(valid)
+        return jsonify({'status': 'accepted', 'received': len(records), 'spooled': spooled, **report}), 202
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @app.route('/records/<string:crime_id>', methods=['PUT'])
+@admission.admit_write
 def put_record(crime_id: str):
     try:
         payload = request.get_json()
@@ -87,23 +551,220 @@ def put_record(crime_id: str):
             return jsonify({'error': 'Invalid JSON payload'}), 400
         # ensure id set
         payload['id'] = crime_id
-        db.insert_crimes([payload])
+        valid, errors = validation.validate_records([payload])
+        if errors:
+            return jsonify({'error': 'Invalid record', 'errors': errors[0]['errors']}), 422
+        stats = db.insert_crimes(valid, mode=request.args.get('mode', db.INGEST_REAL))
+        if stats['inserted'] or stats['updated']:
+            shared_cache.bump_version()
         return jsonify({'status': 'ok'})
+    except RequestEntityTooLarge:
+        raise
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @app.route('/records/<string:crime_id>', methods=['DELETE'])
+@admission.admit_write
 def delete_record(crime_id: str):
     try:
         deleted = db.delete_crime_by_id(crime_id)
         if not deleted:
             return jsonify({'error': 'Not found'}), 404
+        shared_cache.bump_version()
         return jsonify({'status': 'deleted'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/records/batch-get', methods=['POST'])
+def batch_get_records():
+    ids = _batch_ids_from_request()
+    if ids is None:
+        return jsonify({'error': 'Expected a list of ids or {"ids": [...]}'}), 400
+    if len(ids) > MAX_BATCH_IDS:
+        return jsonify({'error': f'Too many ids (max {MAX_BATCH_IDS})'}), 413
+    try:
+        found = db.fetch_crimes_by_ids(ids, replay=_bool_arg('replay'))
+        results = [
+            {'id': i, 'status': 'found', 'record': _serialize_row(rec)} if rec is not None
+            else {'id': i, 'status': 'not_found'}
+            for i, rec in found.items()
+        ]
+        count = sum(1 for rec in found.values() if rec is not None)
+        return jsonify({'count': count, 'results': results})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/records/batch-delete', methods=['POST'])
+@admission.admit_write
+def batch_delete_records():
+    ids = _batch_ids_from_request()
+    if ids is None:
+        return jsonify({'error': 'Expected a list of ids or {"ids": [...]}'}), 400
+    if len(ids) > MAX_BATCH_IDS:
+        return jsonify({'error': f'Too many ids (max {MAX_BATCH_IDS})'}), 413
+    try:
+        status = db.delete_crimes_by_ids(ids)
+        results = [{'id': i, 'status': 'deleted' if ok else 'not_found'} for i, ok in status.items()]
+        deleted = sum(1 for ok in status.values() if ok)
+        if deleted:
+            shared_cache.bump_version()
+        return jsonify({'deleted': deleted, 'results': results})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def _export_params() -> Dict[str, Any]:
+    """Filters shared by GET /export and POST /export/jobs (query string or JSON body).
+
+    @raises ValueError With a client-facing message when a filter has the wrong type.
+    """
+    source: Dict[str, Any] = dict(request.args)
+    body = request.get_json(silent=True)
+    if isinstance(body, dict):
+        source.update(body)
+    params = {
+        'format': str(source.get('format', 'csv')).lower(),
+        'primary_type': source.get('primary_type') or None,
+        'since': source.get('since') or None,
+        'until': source.get('until') or None,
+        'mode': source.get('mode') or None,
+        'limit': None,
+    }
+    for name in ('primary_type', 'since', 'until', 'mode'):
+        if params[name] is not None and not isinstance(params[name], str):
+            raise ValueError(f'{name} must be a string')
+    raw_limit = source.get('limit')
+    if raw_limit not in (None, ''):
+        # str() first so JSON true/1.5/[10] are rejected instead of coerced
+        try:
+            params['limit'] = int(str(raw_limit).strip())
+        except ValueError:
+            raise ValueError('limit must be an integer') from None
+        if params['limit'] < 1:
+            raise ValueError('limit must be positive')
+    return params
+
+
+def _export_job(params: Dict[str, Any]):
+    """Return (cache_key, frame_factory) for the given export filters."""
+    import pandas as pd
+
+    filters = {k: v for k, v in params.items() if k != 'format'}
+    key = json.dumps({'filters': filters, 'version': db.data_version()}, sort_keys=True)
+
+    def _frames():
+        for batch in db.iter_crimes(**filters):
+            yield pd.DataFrame(batch, columns=db.CRIME_COLUMNS)
+
+    return key, _frames
+
+
+@app.route('/archive', methods=['GET'])
+def get_archive():
+    # Rows moved out of the hot table: /archive?since=2023-01-01&until=2023-02-01&mode=real&limit=1000
+    try:
+        limit = min(max(int(request.args.get('limit', 1000)), 1), MAX_CHANGES_PAGE)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    mode = request.args.get('mode') or None
+    if mode is not None and mode not in db.INGEST_MODES:
+        return jsonify({'error': f'mode must be one of {list(db.INGEST_MODES)}'}), 400
+    try:
+        result = retention.query_archive(
+            since=request.args.get('since') or None,
+            until=request.args.get('until') or None,
+            mode=mode,
+            primary_type=request.args.get('primary_type') or None,
+            limit=limit,
+        )
+        return jsonify({'count': len(result['records']), **result})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/export', methods=['GET'])
+def export_records():
+    if _bool_arg('async'):
+        # Same admission control, concurrency cap and dedupe as POST /export/jobs
+        return create_export_job()
+    try:
+        params = _export_params()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    fmt = params['format']
+    if fmt not in export.available_formats():
+        return jsonify({'error': f'Unsupported format, expected one of {export.available_formats()}'}), 400
+    try:
+        key, frames = _export_job(params)
+        filename = f"crimes_{datetime.utcnow().strftime('%Y%m%d')}.{export.EXPORT_FORMATS[fmt]['ext']}"
+        return Response(
+            stream_with_context(export.iter_export_cached(key, frames, fmt)),
+            mimetype=export.EXPORT_FORMATS[fmt]['mime'],
+            headers={'Content-Disposition': f'attachment; filename={filename}'},
+        )
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/export/jobs', methods=['POST'])
+@admission.admit_write
+def create_export_job():
+    try:
+        params = _export_params()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    fmt = params['format']
+    if fmt not in export.available_formats():
+        return jsonify({'error': f'Unsupported format, expected one of {export.available_formats()}'}), 400
+    try:
+        key, frames = _export_job(params)
+        job_id = export.start_export_job(key, frames, fmt)
+        return jsonify({'job_id': job_id, 'status_url': f'/export/jobs/{job_id}'}), 202
+    except export.ExportBusy:
+        resp = jsonify({'error': 'Too many exports in progress', 'retry_after': admission.BUSY_RETRY_AFTER})
+        resp.headers['Retry-After'] = str(max(1, admission.BUSY_RETRY_AFTER))
+        return resp, 503
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/export/jobs/<string:job_id>', methods=['GET'])
+def get_export_job(job_id: str):
+    job = export.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Not found'}), 404
+    out = {k: v for k, v in job.items() if k != 'path'}
+    if job.get('status') == 'done':
+        out['download_url'] = f'/export/jobs/{job_id}/download'
+    return jsonify(out)
+
+
+@app.route('/export/jobs/<string:job_id>/download', methods=['GET'])
+def download_export_job(job_id: str):
+    job = export.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Not found'}), 404
+    if job.get('status') == 'expired':
+        return jsonify({'error': 'Export file expired, start a new job'}), 410
+    if job.get('status') != 'done':
+        return jsonify({'error': 'Export not ready', 'status': job.get('status')}), 409
+    fmt = job['format']
+    try:
+        return send_file(
+            os.path.abspath(job['path']),
+            mimetype=export.EXPORT_FORMATS[fmt]['mime'],
+            as_attachment=True,
+            download_name=f"crimes_{job_id[:8]}.{export.EXPORT_FORMATS[fmt]['ext']}",
+        )
+    except FileNotFoundError:
+        return jsonify({'error': 'Export file expired, start a new job'}), 410
+
+
 if __name__ == '__main__':
     # Para desarrollo
     app.run(host='0.0.0.0', port=5000)
@@ -0,0 +1,126 @@
+"""Benchmark del decodificador de respuestas Socrata (`data._records_to_dataframe`).
+
+Genera payloads sintéticos con la forma de la API de Chicago (fechas
+'2024-01-01T00:00:00.000', coordenadas como texto, `location` como objeto y
+algunos registros sin latitude/longitude de primer nivel) y compara el
+decodificador actual con la versión anterior (DataFrame desde dicts +
+inferencia de fechas + `apply` sobre `location`), verificando además que
+ambos producen las mismas fechas y coordenadas.
+
+Ejemplo:
+    python bench_decoder.py --sizes 5000 50000 --repeat 5
+
+@returns Imprime una tabla con medianas en milisegundos y el speedup.
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List
+
+import pandas as pd
+
+import data
+
+
+def legacy_records_to_dataframe(records: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Implementación anterior de `_records_to_dataframe`, como referencia."""
+    if not records:
+        return pd.DataFrame(columns=data.SCHEMA_COLUMNS)
+    df = pd.DataFrame(records)
+    for c in data.SCHEMA_COLUMNS:
+        if c not in df.columns:
+            df[c] = None
+    for col in ['date', 'updated_on']:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+    for coord in ['latitude', 'longitude']:
+        if coord in df.columns:
+            df[coord] = pd.to_numeric(df[coord], errors='coerce')
+    if 'location' in df.columns:
+        df['location'] = df['location'].apply(lambda x: str(x) if not pd.isna(x) else None)
+    return df[data.SCHEMA_COLUMNS]
+
+
+def make_payload(n: int, seed: int = 7) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    base = datetime(2024, 1, 1)
+    types = ['THEFT', 'BATTERY', 'ASSAULT', 'NARCOTICS', 'ROBBERY']
+    records = []
+    for i in range(n):
+        lat = 41.64 + rng.random() * 0.38
+        lon = -87.94 + rng.random() * 0.42
+        ts = base + timedelta(seconds=rng.randint(0, 365 * 86400))
+        rec = {
+            'id': str(13000000 + i),
+            'case_number': f'JH{100000 + i}',
+            'date': ts.strftime('%Y-%m-%dT%H:%M:%S.000'),
+            'block': f'0{rng.randint(0, 99):02d}XX W MADISON ST',
+            'iucr': '0820',
+            'primary_type': rng.choice(types),
+            'description': '$500 AND UNDER',
+            'location_description': 'STREET',
+            'arrest': rng.random() < 0.2,
+            'domestic': rng.random() < 0.1,
+            'beat': '0111',
+            'district': f'{rng.randint(1, 25):03d}',
+            'ward': str(rng.randint(1, 50)),
+            'community_area': str(rng.randint(1, 77)),
+            'fbi_code': '06',
+            'year': '2024',
+            'updated_on': (ts + timedelta(days=7)).strftime('%Y-%m-%dT%H:%M:%S.000'),
+            'x_coordinate': str(rng.randint(1100000, 1200000)),
+            'y_coordinate': str(rng.randint(1800000, 1950000)),
+            'location': {'latitude': f'{lat:.9f}', 'longitude': f'{lon:.9f}', 'human_address': '{}'},
+        }
+        # Algunos registros traen la posición sólo dentro de `location`, otros no la traen
+        roll = rng.random()
+        if roll < 0.9:
+            rec['latitude'] = f'{lat:.9f}'
+            rec['longitude'] = f'{lon:.9f}'
+        elif roll < 0.95:
+            del rec['location']
+        records.append(rec)
+    return records
+
+
+def _time(fn: Callable[[List[Dict[str, Any]]], pd.DataFrame], payload: List[Dict[str, Any]], repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(payload)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def check_equivalent(payload: List[Dict[str, Any]]) -> None:
+    old = legacy_records_to_dataframe(payload)
+    new = data._records_to_dataframe(payload)
+    assert list(new.columns) == list(old.columns)
+    for col in ('date', 'updated_on'):
+        assert new[col].equals(old[col].astype(new[col].dtype)), col
+    # Las filas con posición sólo en `location` ahora se recuperan; el resto coincide
+    has_top = old['latitude'].notna()
+    for col in ('latitude', 'longitude'):
+        assert (new.loc[has_top, col] == old.loc[has_top, col]).all(), col
+    assert new['latitude'].notna().sum() >= has_top.sum()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark del decodificador Socrata')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5000, 50000])
+    parser.add_argument('--repeat', type=int, default=5, help='Repeticiones por medición (mediana)')
+    args = parser.parse_args()
+
+    print(f"{'filas':>8} {'anterior ms':>12} {'actual ms':>10} {'speedup':>8}")
+    for n in args.sizes:
+        payload = make_payload(n)
+        check_equivalent(payload)
+        old_ms = _time(legacy_records_to_dataframe, payload, args.repeat)
+        new_ms = _time(data._records_to_dataframe, payload, args.repeat)
+        print(f'{n:>8} {old_ms:>12.1f} {new_ms:>10.1f} {old_ms / new_ms:>7.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,380 @@
+"""Zonas peligrosas precalculadas para el feed móvil (`/ubicaciones`).
+
+La app Android dibuja cada ubicación peligrosa como un círculo
+(`latitud`, `longitud`, `radio_metros`, `nivel_peligro`); mandarle miles de
+incidentes sueltos no escala. Este módulo los agrupa en zonas con un
+clustering por densidad acelerado con grilla:
+
+- Cada incidente cae en una celda de `CLUSTER_CELL_M` metros de lado. Por
+  celda se guardan agregados (conteo, suma de coordenadas, conteo por tipo
+  y un puntaje de recencia con decaimiento exponencial de vida media
+  `CLUSTER_HALF_LIFE_H`, ponderado por la gravedad del tipo).
+- Una celda con al menos `CLUSTER_MIN_POINTS` incidentes es densa. Las
+  celdas densas vecinas (8-vecindad) forman una zona y las celdas no
+  densas pegadas a una zona se le suman como borde, como en DBSCAN.
+- Por zona: centroide, radio que cubre todas sus celdas, tipos
+  dominantes, fecha del último incidente, puntaje y nivel ALTO/MEDIO/BAJO
+  según el percentil del puntaje entre todas las zonas.
+
+El índice vive en memoria de cada worker. La carga inicial de la tabla
+completa corre en un hilo aparte, sin tomar el lock: mientras tanto las
+peticiones ven el índice anterior (vacío la primera vez, `warm()` devuelve
+False) y al terminar se reemplaza de una vez. Después sólo se aplican los
+cambios del registro de cambios (`fetch_changes`) desde la última versión
+vista, así que un lote nuevo cuesta O(registros cambiados) y rearmar las
+zonas O(celdas), nunca O(incidentes). Se consulta la versión de datos como
+mucho cada `CLUSTER_REFRESH_S` segundos; esa consulta y la lectura de los
+cambios se hacen fuera del lock, que sólo protege la mezcla en memoria.
+"""
+import logging
+import math
+import os
+import threading
+import time
+import zlib
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import anomaly
+import db_postgres as db
+
+logger = logging.getLogger(__name__)
+
+CLUSTER_CELL_M: float = float(os.getenv('CLUSTER_CELL_M', '250'))
+CLUSTER_MIN_POINTS: int = int(os.getenv('CLUSTER_MIN_POINTS', '5'))
+CLUSTER_HALF_LIFE_H: float = float(os.getenv('CLUSTER_HALF_LIFE_H', '720'))
+CLUSTER_MIN_RADIUS_M: float = float(os.getenv('CLUSTER_MIN_RADIUS_M', '150'))
+CLUSTER_REFRESH_S: float = float(os.getenv('CLUSTER_REFRESH_S', '5'))
+
+EARTH_RADIUS_M = 6371000.0
+_CELL_DEG = CLUSTER_CELL_M / 111320.0
+_LAMBDA = math.log(2) / (CLUSTER_HALF_LIFE_H * 3600)
+
+# Misma clasificación que `calcularNivelPeligro` de la app Android
+_SEVERE_MARKERS = ('HOMICIDE', 'ROBBERY', 'ASSAULT', 'BATTERY', 'KIDNAPPING', 'SEXUAL', 'ROBO', 'ASALTO')
+_MEDIUM_MARKERS = ('BURGLARY', 'THEFT', 'HURTO', 'VIOLENCIA FAMILIAR')
+# Fracción de zonas (por puntaje) marcadas ALTO y, a continuación, MEDIO
+LEVEL_QUANTILES: Tuple[Tuple[str, float], ...] = (('ALTO', 0.2), ('MEDIO', 0.6))
+
+CellKey = Tuple[int, int]
+
+_lock = threading.Lock()
+_state: Dict[str, Any] = {
+    'loaded': False,
+    'loading': False,
+    'refreshing': False,
+    'load_error': None,
+    'since': 0,
+    'data_version': None,
+    'checked_at': 0.0,
+    'clock': 0.0,
+    'points': {},
+    'cells': {},
+    'zones': None,
+}
+
+
+def severity(primary_type: str) -> float:
+    """Peso de un incidente según su tipo (3 grave, 2 medio, 1 el resto)."""
+    t = (primary_type or '').upper()
+    if any(m in t for m in _SEVERE_MARKERS):
+        return 3.0
+    if any(m in t for m in _MEDIUM_MARKERS):
+        return 2.0
+    return 1.0
+
+
+def distance_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Distancia haversine en metros."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def grid_cell(lat: float, lon: float) -> CellKey:
+    """Celda de ~`CLUSTER_CELL_M` metros; el ancho en longitud se corrige por la latitud de la fila."""
+    row = math.floor(lat / _CELL_DEG)
+    scale = max(math.cos(math.radians((row + 0.5) * _CELL_DEG)), 1e-6)
+    return row, math.floor(lon * scale / _CELL_DEG)
+
+
+def _new_cell() -> Dict[str, Any]:
+    return {'n': 0, 'sum_lat': 0.0, 'sum_lon': 0.0, 'types': Counter(), 'heat': 0.0, 'heat_ts': None, 'last_ts': None}
+
+
+def _add_heat(cell: Dict[str, Any], ts: float, weight: float) -> None:
+    """Suma (o resta, con peso negativo) un evento al puntaje decaído de la celda."""
+    ref = cell['heat_ts']
+    if ref is None:
+        cell['heat'], cell['heat_ts'] = weight, ts
+    elif ts >= ref:
+        cell['heat'] = cell['heat'] * math.exp(-_LAMBDA * (ts - ref)) + weight
+        cell['heat_ts'] = ts
+    else:
+        cell['heat'] += weight * math.exp(-_LAMBDA * (ref - ts))
+    cell['heat'] = max(cell['heat'], 0.0)
+
+
+def _point(rec: Dict[str, Any]) -> Optional[Tuple[CellKey, float, float, str, float]]:
+    key = anomaly.cell_key(rec)
+    if key is None:
+        return None
+    lat, lon = float(rec['latitude']), float(rec['longitude'])
+    ts = anomaly.event_ts(rec.get('date'))
+    # Las fechas futuras cuentan como ahora: si no, adelantarían el reloj y decaerían todas las zonas
+    now = time.time()
+    return grid_cell(lat, lon), lat, lon, key[2], now if ts is None else min(ts, now)
+
+
+def _apply(index: Dict[str, Any], point: Tuple[CellKey, float, float, str, float], sign: int) -> None:
+    cells = index['cells']
+    key, lat, lon, primary_type, ts = point
+    cell = cells.get(key)
+    if cell is None:
+        cell = cells[key] = _new_cell()
+    cell['n'] += sign
+    cell['sum_lat'] += sign * lat
+    cell['sum_lon'] += sign * lon
+    cell['types'][primary_type] += sign
+    _add_heat(cell, ts, sign * severity(primary_type))
+    if sign > 0:
+        cell['last_ts'] = ts if cell['last_ts'] is None else max(cell['last_ts'], ts)
+        index['clock'] = max(index['clock'], ts)
+    elif cell['n'] <= 0:
+        del cells[key]
+    elif cell['types'][primary_type] <= 0:
+        del cell['types'][primary_type]
+
+
+def _upsert(index: Dict[str, Any], rec: Dict[str, Any]) -> None:
+    points = index['points']
+    old = points.pop(str(rec.get('id')), None)
+    if old is not None:
+        _apply(index, old, -1)
+    new = _point(rec)
+    if new is not None:
+        points[str(rec.get('id'))] = new
+        _apply(index, new, +1)
+
+
+def _delete(index: Dict[str, Any], crime_id: str) -> None:
+    old = index['points'].pop(str(crime_id), None)
+    if old is not None:
+        _apply(index, old, -1)
+
+
+def _load_all() -> None:
+    """Recorre la tabla completa en un índice nuevo y lo pone en `_state` de una vez (hilo `_start_load`)."""
+    try:
+        # La versión se lee antes de recorrer la tabla: los cambios concurrentes
+        # se vuelven a aplicar después y `_upsert` es idempotente
+        since = db.latest_change_version()
+        index: Dict[str, Any] = {'points': {}, 'cells': {}, 'clock': 0.0}
+        for batch in db.iter_crimes():
+            for rec in batch:
+                _upsert(index, rec)
+    except Exception as e:
+        logger.warning('No se pudo cargar el índice de zonas: %s', e)
+        with _lock:
+            _state.update(loading=False, load_error=str(e), checked_at=time.monotonic())
+        return
+    try:
+        # Lo escrito durante la carga; si falla, el próximo `refresh` sigue desde `since`
+        pages, since_after = _fetch_changes(since)
+        _merge(index, pages)
+        since = since_after
+    except Exception as e:
+        logger.warning('No se pudieron aplicar los cambios tras la carga de zonas: %s', e)
+    with _lock:
+        _state.update(index, since=since, loaded=True, loading=False, load_error=None, zones=None)
+        _state['data_version'] = None
+
+
+def _start_load() -> None:
+    """Lanza la carga completa en segundo plano si no hay una en curso (con `_lock` tomado)."""
+    if _state['loading']:
+        return
+    _state['loading'] = True
+    threading.Thread(target=_load_all, name='clustering-load', daemon=True).start()
+
+
+def _fetch_changes(since: int) -> Tuple[List[Dict[str, Any]], int]:
+    """Páginas del registro de cambios desde `since` (sin `_lock`: sólo lee la base)."""
+    pages = []
+    while True:
+        page = db.fetch_changes(since=since, replay=False)
+        pages.append(page)
+        since = page['next_since']
+        if not page['has_more']:
+            return pages, since
+
+
+def _merge(index: Dict[str, Any], pages: List[Dict[str, Any]]) -> bool:
+    """Aplica las páginas en orden al índice. @returns True si algo cambió."""
+    changed = False
+    for page in pages:
+        for rec in page['upserts']:
+            _upsert(index, rec)
+        for crime_id in page['deletes']:
+            _delete(index, crime_id)
+        changed = changed or bool(page['upserts'] or page['deletes'])
+    return changed
+
+
+def refresh(force: bool = False) -> None:
+    """Pone el índice al día con la base de datos.
+
+    Sin índice cargado (o con `force`) sólo lanza la carga completa en
+    segundo plano y vuelve enseguida; con índice aplica los cambios
+    pendientes. La versión y los cambios se leen sin `_lock`; el lock sólo
+    cubre la mezcla en memoria, así que las peticiones no esperan a la base.
+    Un solo hilo por worker consulta la base a la vez; los demás usan el
+    índice tal como está.
+    """
+    with _lock:
+        now = time.monotonic()
+        if not _state['loaded'] or force:
+            # Tras un fallo se reintenta como mucho cada CLUSTER_REFRESH_S segundos
+            if force or _state['load_error'] is None or now - _state['checked_at'] >= CLUSTER_REFRESH_S:
+                _start_load()
+            if not _state['loaded']:
+                return
+        if _state['refreshing'] or now - _state['checked_at'] < CLUSTER_REFRESH_S:
+            return
+        _state['checked_at'] = now
+        _state['refreshing'] = True
+        since, known = _state['since'], _state['data_version']
+    try:
+        version = db.data_version()
+        if version == known:
+            return
+        pages, next_since = _fetch_changes(since)
+        with _lock:
+            if _state['since'] != since:
+                # Una carga completa reemplazó el índice mientras tanto
+                return
+            if _merge(_state, pages):
+                _state['zones'] = None
+            _state['since'] = next_since
+            _state['data_version'] = version
+    finally:
+        with _lock:
+            _state['refreshing'] = False
+
+
+def warm() -> bool:
+    """Lanza la carga inicial si hace falta. @returns True si el índice ya está cargado."""
+    refresh()
+    with _lock:
+        return _state['loaded']
+
+
+def _components() -> List[List[CellKey]]:
+    """Celdas densas conectadas más sus celdas de borde no densas."""
+    cells = _state['cells']
+    dense = {k for k, c in cells.items() if c['n'] >= CLUSTER_MIN_POINTS}
+    seen: set = set()
+    groups = []
+    for start in dense:
+        if start in seen:
+            continue
+        seen.add(start)
+        stack, members = [start], []
+        while stack:
+            key = stack.pop()
+            members.append(key)
+            if key not in dense:
+                continue
+            row, col = key
+            for dr in (-1, 0, 1):
+                for dc in (-1, 0, 1):
+                    nb = (row + dr, col + dc)
+                    if nb not in seen and nb in cells:
+                        seen.add(nb)
+                        stack.append(nb)
+        groups.append(members)
+    return groups
+
+
+def _zone(members: List[CellKey], now: float) -> Dict[str, Any]:
+    cells = _state['cells']
+    parts = [cells[k] for k in members]
+    n = sum(c['n'] for c in parts)
+    lat = sum(c['sum_lat'] for c in parts) / n
+    lon = sum(c['sum_lon'] for c in parts) / n
+    # Cada celda se cubre con su centroide más media diagonal
+    reach = max(distance_m(lat, lon, c['sum_lat'] / c['n'], c['sum_lon'] / c['n']) for c in parts)
+    radius = max(CLUSTER_MIN_RADIUS_M, reach + CLUSTER_CELL_M * math.sqrt(2) / 2)
+    types: Counter = Counter()
+    for c in parts:
+        types.update(c['types'])
+    dominant = [{'tipo': t, 'cantidad': count} for t, count in types.most_common(3)]
+    score = sum(c['heat'] * math.exp(-_LAMBDA * max(0.0, now - c['heat_ts'])) for c in parts)
+    last_ts = max(c['last_ts'] for c in parts if c['last_ts'] is not None)
+    anchor = max(members, key=lambda k: (cells[k]['n'], k))
+    resumen = ', '.join(f"{d['tipo']} ({d['cantidad']})" for d in dominant)
+    return {
+        # Entero estable (la app lo pide como Int en /ubicaciones/{id}): la celda más densa
+        'id': str(zlib.crc32(f'{anchor[0]}:{anchor[1]}'.encode()) & 0x7FFFFFFF),
+        'latitud': round(lat, 6),
+        'longitud': round(lon, 6),
+        'tipo_crimen': dominant[0]['tipo'],
+        'descripcion': f'{n} incidentes: {resumen}',
+        'fecha': datetime.fromtimestamp(last_ts, timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+        'radio_metros': round(radius, 1),
+        'incidentes': n,
+        'tipos_dominantes': dominant,
+        'puntaje': round(score, 3),
+    }
+
+
+def _build_zones() -> List[Dict[str, Any]]:
+    now = _state['clock'] or time.time()
+    zones = [_zone(members, now) for members in _components()]
+    zones.sort(key=lambda z: z['puntaje'], reverse=True)
+    cuts = [(name, max(1, round(quantile * len(zones)))) for name, quantile in LEVEL_QUANTILES]
+    for i, zone in enumerate(zones):
+        zone['nivel_peligro'] = next((name for name, cut in cuts if i < cut), 'BAJO')
+    return zones
+
+
+def danger_zones() -> List[Dict[str, Any]]:
+    """Zonas peligrosas ordenadas por puntaje de recencia descendente."""
+    refresh()
+    with _lock:
+        if _state['zones'] is None:
+            _state['zones'] = _build_zones()
+        return _state['zones']
+
+
+def zones_near(lat: float, lon: float, radius_m: float) -> List[Dict[str, Any]]:
+    """Zonas cuyo círculo toca el radio pedido alrededor de `(lat, lon)`, de la más cercana a la más lejana."""
+    near = []
+    for zone in danger_zones():
+        d = distance_m(lat, lon, zone['latitud'], zone['longitud'])
+        if d - zone['radio_metros'] <= radius_m:
+            near.append({**zone, 'distancia_metros': round(d, 1)})
+    near.sort(key=lambda z: z['distancia_metros'])
+    return near
+
+
+def find_zone(zone_id: str) -> Optional[Dict[str, Any]]:
+    return next((z for z in danger_zones() if z['id'] == str(zone_id)), None)
+
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        return {
+            'loaded': _state['loaded'],
+            'loading': _state['loading'],
+            'load_error': _state['load_error'],
+            'data_version': _state['data_version'],
+            'change_version': _state['since'],
+            'points': len(_state['points']),
+            'cells': len(_state['cells']),
+            'zones': None if _state['zones'] is None else len(_state['zones']),
+            'cell_m': CLUSTER_CELL_M,
+            'min_points': CLUSTER_MIN_POINTS,
+        }
@@ -1,11 +1,17 @@
-import requests
+import numpy as np
 import pandas as pd
 import time
+import uuid
 import random
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional, Tuple
 import streamlit as st
 
+import retention
+import session_store
+import sources
+import tracing
+
 SCODA_URL: str = "https://data.cityofchicago.org/resource/ijzp-q8t2.json"
 DEFAULT_FROM_DATE: str = "2024-01-01T00:00:00"
 
@@ -31,6 +37,28 @@ LOCATIONS_AREQUIPA: List[str] = [
     'RESIDENCIA', 'BANCO', 'MERCADO', 'TRANSPORTE PÚBLICO', 'ESTACIONAMIENTO'
 ]
 
+# Definición de zonas de Arequipa con sus coordenadas
+AREQUIPA_ZONES: Dict[str, Dict[str, Any]] = {
+    "Centro Histórico": {
+        "bounds": [
+            (-16.424240, -71.556179),
+            (-16.424528, -71.556496),
+            (-16.423735, -71.557225),
+            (-16.423735, -71.557225)
+        ],
+        "center": (-16.424060, -71.556775)
+    },
+    "Yanahuara": {
+        "bounds": [
+            (-16.390, -71.545),
+            (-16.395, -71.550),
+            (-16.400, -71.545),
+            (-16.395, -71.540)
+        ],
+        "center": (-16.395, -71.545)
+    }
+}
+
 # Puntos preferidos para Universidad La Salle (lat, lon)
 LA_SALLE_POINTS: List[Tuple[float, float]] = [
     (-16.423975, -71.556786),
@@ -45,57 +73,171 @@ LA_SALLE_POINTS: List[Tuple[float, float]] = [
 ]
 
 
+def get_data_version() -> str:
+    """Versión de los datos de la sesión.
+
+    Cambia cada vez que se refrescan los datos de Chicago o se agregan/limpian
+    registros sintéticos, e incluye un token por sesión para que las cachés
+    compartidas (p. ej. exportaciones) no mezclen datos de sesiones distintas.
+    """
+    token = st.session_state.get('_data_token')
+    if token is None:
+        token = uuid.uuid4().hex[:12]
+        st.session_state['_data_token'] = token
+    return f"{token}:{st.session_state.get('_data_version', 0)}"
+
+
+def get_frame_version() -> Optional[str]:
+    """Versión de datos con la que se construyó el último DataFrame combinado (`get_last_frame`)."""
+    return st.session_state.get('_chicago_last_df_version')
+
+
+def get_last_frame() -> pd.DataFrame:
+    """Último DataFrame combinado de la sesión (vacío si todavía no se cargó)."""
+    frame = session_store.get(_COMBINED_KEY)
+    return frame if frame is not None else pd.DataFrame(columns=SCHEMA_COLUMNS)
+
+
+# Nombres de los DataFrames de la sesión en session_store
+_COMBINED_KEY = 'chicago_last_df'
+_AREQUIPA_KEY = 'arequipa_records'
+
+
+def _bump_data_version() -> None:
+    st.session_state['_data_version'] = st.session_state.get('_data_version', 0) + 1
+
+
+# Formato de fechas del portal Socrata (p. ej. '2024-01-01T00:00:00.000')
+SOCRATA_DATETIME_FORMAT: str = '%Y-%m-%dT%H:%M:%S.%f'
+_DATETIME_COLUMNS: Tuple[str, ...] = ('date', 'updated_on')
+_COORD_COLUMNS: Tuple[str, ...] = ('latitude', 'longitude')
+
+
+def _parse_datetimes(values: pd.Series) -> pd.Series:
+    """Fechas con el formato explícito de Socrata; sólo lo que no encaja pasa por ISO 8601."""
+    parsed = pd.to_datetime(values, format=SOCRATA_DATETIME_FORMAT, errors='coerce')
+    pending = parsed.isna() & values.notna()
+    if pending.any():
+        try:
+            parsed[pending] = pd.to_datetime(values[pending], format='ISO8601', errors='coerce')
+        except (ValueError, TypeError):
+            # Zonas horarias mezcladas: inferencia general, como antes
+            parsed = pd.to_datetime(values, errors='coerce')
+    return parsed
+
+
 def _records_to_dataframe(records: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Decodifica la respuesta JSON de Socrata directamente en columnas tipadas.
+
+    Cada columna del esquema se arma en una sola pasada sobre los registros
+    (los campos ausentes quedan en None), las fechas usan el formato
+    explícito de Socrata y las coordenadas se convierten en bloque. Si
+    faltan latitude/longitude se toman del objeto `location`.
+    """
     if not records:
         return pd.DataFrame(columns=SCHEMA_COLUMNS)
-    df = pd.DataFrame(records)
-    for c in SCHEMA_COLUMNS:
-        if c not in df.columns:
-            df[c] = None
-    for col in ['date', 'updated_on']:
-        if col in df.columns:
-            df[col] = pd.to_datetime(df[col], errors='coerce')
-    for coord in ['latitude', 'longitude']:
-        if coord in df.columns:
-            df[coord] = pd.to_numeric(df[coord], errors='coerce')
-    if 'location' in df.columns:
-        df['location'] = df['location'].apply(lambda x: str(x) if not pd.isna(x) else None)
-    return df[SCHEMA_COLUMNS]
+    n = len(records)
+    index = pd.RangeIndex(n)
+    columns: Dict[str, Any] = {
+        c: pd.Series([r.get(c) for r in records], index=index, dtype=object)
+        for c in SCHEMA_COLUMNS
+    }
+
+    for col in _DATETIME_COLUMNS:
+        columns[col] = _parse_datetimes(columns[col])
+
+    location = columns['location']
+    has_location = location.notna()
+    for coord in _COORD_COLUMNS:
+        values = pd.to_numeric(columns[coord], errors='coerce')
+        missing = values.isna() & has_location
+        if missing.any():
+            from_location = [
+                loc.get(coord) if isinstance(loc, dict) else None
+                for loc in location[missing]
+            ]
+            values[missing] = pd.to_numeric(pd.Series(from_location, index=values.index[missing]), errors='coerce')
+        columns[coord] = values.astype(float)
+
+    # Texto para que Arrow (st.dataframe) no reciba diccionarios; sólo se
+    # convierten las celdas con valor
+    text = location.copy()
+    text[has_location] = [str(loc) for loc in location[has_location]]
+    columns['location'] = text
+    return pd.DataFrame(columns, index=index, columns=SCHEMA_COLUMNS)
+
+
+def configured_sources(limit: int = 5000, refresh_interval: int = 60) -> List[sources.SourceAdapter]:
+    """Fuentes compartidas activas: el portal de Chicago y, si están configuradas, archivos y webhooks."""
+    adapters: List[sources.SourceAdapter] = [
+        sources.SocrataSource('chicago', SCODA_URL, limit, _records_to_dataframe, refresh_interval)
+    ]
+    if sources.SOURCE_DROP_DIR:
+        adapters.append(sources.FileDropSource('archivos', sources.SOURCE_DROP_DIR, _records_to_dataframe))
+    if sources.SOURCE_WEBHOOK_DIR:
+        adapters.append(sources.WebhookSpoolSource('webhook', sources.SOURCE_WEBHOOK_DIR, _records_to_dataframe))
+    return adapters
+
+
+def _report_source_errors(results: Dict[str, Dict[str, Any]]) -> None:
+    """Muestra una vez por sesión cada fallo nuevo de una fuente."""
+    seen = st.session_state.setdefault('_source_errors_seen', {})
+    for name, result in results.items():
+        if result['error'] and seen.get(name) != result['error_at']:
+            seen[name] = result['error_at']
+            if result['frame'] is not None:
+                st.warning(f'Fuente {name}: {result["error"]} (se muestran los últimos datos obtenidos)')
+            else:
+                st.error(f'Error obteniendo datos de {name}: {result["error"]}')
+
+
+@tracing.traced('data.fetch_latest')
+def fetch_latest(limit: int = 5000, force: bool = False, refresh_interval: int = 60) -> pd.DataFrame:
+    """Combina los registros sintéticos de la sesión con las fuentes compartidas (`sources.collect`).
+
+    Las fuentes se consultan en paralelo y sólo cuando les toca; si ninguna
+    cambió desde la última combinación se devuelve el mismo DataFrame.
+    """
+    session_frame = get_arequipa_records()
+    adapters = [sources.SessionFrameSource('arequipa', session_frame)]
+    adapters += configured_sources(limit, refresh_interval)
+    results = sources.collect(adapters, force=force)
+    _report_source_errors(results)
+
+    revisions = {name: r['revision'] for name, r in results.items() if r['shared']}
+    if st.session_state.get('_source_revisions') != revisions:
+        st.session_state['_source_revisions'] = revisions
+        _bump_data_version()
+    elif get_frame_version() == get_data_version():
+        # Sin cambios desde la última combinación: los fragmentos que se
+        # re-ejecutan solos reutilizan el mismo DataFrame sin recombinar
+        cached = session_store.get(_COMBINED_KEY)
+        if cached is not None:
+            return cached
+
+    with tracing.span('data.combine'):
+        if session_frame.empty:
+            # Sin datos propios de la sesión el resultado es el mismo para
+            # todas las sesiones con el mismo límite: se combina una sola vez
+            fingerprint = ('combined', limit, tuple(sorted(revisions.items())))
+            combined_df = session_store.intern(fingerprint, lambda: _combine_frames(results))
+            session_store.put(_COMBINED_KEY, combined_df, shared_key=fingerprint)
+        else:
+            combined_df = _combine_frames(results)
+            session_store.put(_COMBINED_KEY, combined_df)
+    st.session_state['_chicago_last_df_version'] = get_data_version()
+    return combined_df
 
 
-def fetch_latest(limit: int = 5000, force: bool = False, refresh_interval: int = 60) -> pd.DataFrame:
-    key_time = '_chicago_last_fetch_time'
-    key_df = '_chicago_last_df'
-    key_chicago = '_chicago_base_df'
-    now = time.time()
-    last = st.session_state.get(key_time, 0)
-    
-    # Verificar si necesitamos refrescar desde la API
-    need_refresh = force or (now - last >= refresh_interval) or (key_chicago not in st.session_state)
-    
-    if need_refresh:
-        params = {'$limit': limit, '$order': 'date DESC'}
-        try:
-            resp = requests.get(SCODA_URL, params=params, timeout=30)
-            resp.raise_for_status()
-            records = resp.json()
-            chicago_df = _records_to_dataframe(records)
-            st.session_state[key_chicago] = chicago_df
-            st.session_state[key_time] = now
-        except Exception as e:
-            st.error(f'Error fetching data from API: {e}')
-            # Si falla, usar datos anteriores si existen
-            chicago_df = st.session_state.get(key_chicago, pd.DataFrame(columns=SCHEMA_COLUMNS))
+def _combine_frames(results: Dict[str, Dict[str, Any]]) -> pd.DataFrame:
+    """Une los DataFrames de las fuentes que respondieron, del más reciente al más antiguo."""
+    frames = [r['frame'] for r in results.values() if r['frame'] is not None and not r['frame'].empty]
+    if not frames:
+        combined_df = pd.DataFrame(columns=SCHEMA_COLUMNS)
+    elif len(frames) == 1:
+        combined_df = frames[0].copy()
     else:
-        chicago_df = st.session_state.get(key_chicago, pd.DataFrame(columns=SCHEMA_COLUMNS))
-    
-    # Combinar con datos sintéticos de Arequipa si existen
-    arequipa_df = st.session_state.get('_arequipa_records', pd.DataFrame(columns=SCHEMA_COLUMNS))
-    
-    if not arequipa_df.empty:
-        combined_df = pd.concat([arequipa_df, chicago_df], ignore_index=True)
-    else:
-        combined_df = chicago_df
+        combined_df = pd.concat(frames, ignore_index=True)
 
     # Convertir columna 'year' a número para evitar error Arrow
     if 'year' in combined_df.columns:
@@ -104,11 +246,15 @@ def fetch_latest(limit: int = 5000, force: bool = False, refresh_interval: int =
     # Ordenar por fecha descendente
     if 'date' in combined_df.columns:
         combined_df = combined_df.sort_values('date', ascending=False)
+    return combined_df
 
 
-    
-    st.session_state[key_df] = combined_df
-    return combined_df
+def fetch_chicago(limit: int = 5000, force: bool = False) -> pd.DataFrame:
+    """Sólo los registros del portal de Chicago (sin sintéticos, archivos ni webhooks)."""
+    result = sources.collect(configured_sources(limit)[:1], force=force)['chicago']
+    if result['frame'] is None:
+        raise RuntimeError(result['error'] or 'el portal de Chicago no respondió a tiempo')
+    return result['frame']
 
 
 def _point_in_polygon(point: Tuple[float, float], polygon: List[Tuple[float, float]]) -> bool:
@@ -132,6 +278,101 @@ def _point_in_polygon(point: Tuple[float, float], polygon: List[Tuple[float, flo
     return inside
 
 
+def _points_in_polygon(lat: np.ndarray, lon: np.ndarray, polygon: List[Tuple[float, float]]) -> np.ndarray:
+    """Versión vectorizada de `_point_in_polygon` (mismo ray casting) para arreglos de puntos."""
+    inside = np.zeros(len(lat), dtype=bool)
+    n = len(polygon)
+    p1_lat, p1_lon = polygon[0]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for i in range(1, n + 1):
+            p2_lat, p2_lon = polygon[i % n]
+            crossing = (
+                (lon > min(p1_lon, p2_lon))
+                & (lon <= max(p1_lon, p2_lon))
+                & (lat <= max(p1_lat, p2_lat))
+            )
+            if p1_lat != p2_lat and p1_lon != p2_lon:
+                xinters = (lon - p1_lon) * (p2_lat - p1_lat) / (p2_lon - p1_lon) + p1_lat
+                crossing &= lat <= xinters
+            inside ^= crossing
+            p1_lat, p1_lon = p2_lat, p2_lon
+    return inside
+
+
+# Columnas con índice de filtros en la pestaña "Datos" (además de 'zone')
+FILTER_COLUMNS: List[str] = ['primary_type', 'arrest', 'domestic', 'district']
+
+
+def _zone_labels(df: pd.DataFrame) -> pd.Series:
+    """Nombre de la zona de AREQUIPA_ZONES que contiene cada fila (None si ninguna)."""
+    labels = pd.Series(None, index=df.index, dtype=object)
+    if df.empty or 'latitude' not in df.columns or 'longitude' not in df.columns:
+        return labels
+    lat = pd.to_numeric(df['latitude'], errors='coerce').to_numpy(dtype=float)
+    lon = pd.to_numeric(df['longitude'], errors='coerce').to_numpy(dtype=float)
+    free = np.ones(len(df), dtype=bool)
+    for name, zone in AREQUIPA_ZONES.items():
+        mask = free & _points_in_polygon(lat, lon, zone['bounds'])
+        labels[mask] = name
+        free &= ~mask
+    return labels
+
+
+def build_filter_index(df: pd.DataFrame) -> Dict[str, Any]:
+    """Construye bitmaps de filas por valor para filtrar sin recorrer el DataFrame.
+
+    Para cada columna de `FILTER_COLUMNS` y para la zona, guarda un bitmap
+    (`np.packbits`) por valor distinto. Los valores nulos no se indexan.
+
+    @param df DataFrame combinado de la sesión.
+    @returns Diccionario con el número de filas (`rows`) y los bitmaps por columna (`bitmaps`).
+    """
+    columns = {c: df[c] for c in FILTER_COLUMNS if c in df.columns}
+    columns['zone'] = _zone_labels(df)
+
+    bitmaps: Dict[str, Dict[Any, np.ndarray]] = {}
+    for name, series in columns.items():
+        if name in ('arrest', 'domestic') and not pd.api.types.is_bool_dtype(series):
+            series = series.replace({'true': True, 'false': False})
+        codes, uniques = pd.factorize(series)
+        bitmaps[name] = {
+            (value.item() if hasattr(value, 'item') else value): np.packbits(codes == i)
+            for i, value in enumerate(uniques)
+        }
+    return {'rows': len(df), 'bitmaps': bitmaps}
+
+
+def filter_index_values(index: Dict[str, Any], column: str) -> List[Any]:
+    """Valores indexados de una columna, ordenados para mostrarlos en filtros."""
+    return sorted(index['bitmaps'].get(column, {}), key=str)
+
+
+def filter_index_rows(index: Dict[str, Any], filters: Dict[str, List[Any]]) -> np.ndarray:
+    """Posiciones de fila que cumplen todos los filtros.
+
+    Dentro de una columna los valores se combinan con OR y entre columnas con
+    AND, ambos como operaciones sobre los bitmaps.
+
+    @param index Índice creado con `build_filter_index`.
+    @param filters Valores aceptados por columna; las listas vacías no filtran.
+    @returns Arreglo ordenado de posiciones (para usar con `df.iloc`).
+    """
+    rows = index['rows']
+    selected: Optional[np.ndarray] = None
+    for column, values in filters.items():
+        if not values:
+            continue
+        column_bits = np.zeros((rows + 7) // 8, dtype=np.uint8)
+        for value in values:
+            bits = index['bitmaps'].get(column, {}).get(value)
+            if bits is not None:
+                column_bits |= bits
+        selected = column_bits if selected is None else selected & column_bits
+    if selected is None:
+        return np.arange(rows)
+    return np.flatnonzero(np.unpackbits(selected, count=rows))
+
+
 def _generate_point_in_bounds(bounds: List[Tuple[float, float]]) -> Tuple[float, float]:
     lats = [b[0] for b in bounds]
     lons = [b[1] for b in bounds]
@@ -175,6 +416,9 @@ def generate_random_records_in_zone(
         preferred_count = n
 
     base_ts = int(time.time() * 1000)
+    # Componente aleatorio: dos generadores en el mismo milisegundo (p. ej.
+    # workers de loadgen) no deben producir ids iguales
+    batch = uuid.uuid4().hex[:12]
     
     # First generate preferred records (may repeat points)
     for i in range(preferred_count):
@@ -191,7 +435,7 @@ def generate_random_records_in_zone(
         description = random.choice(CRIME_TYPES_AREQUIPA.get(primary, ['Incidente']))
 
         row = {
-            'id': f'ARQ-{base_ts}-{record_index}',
+            'id': f'ARQ-{base_ts}-{batch}-{record_index}',
             'case_number': f'AQP{record_date.year}{record_index:06d}',
             'date': record_date.isoformat(),
             'block': f'{random.choice(["AV", "CALLE", "JR"])} {random.randint(100, 999)}',
@@ -234,7 +478,7 @@ def generate_random_records_in_zone(
         record_date = now - timedelta(days=days_ago, hours=hours_ago, minutes=minutes_ago)
         
         row = {
-            'id': f'ARQ-{base_ts + i}-{i}',
+            'id': f'ARQ-{base_ts}-{batch}-{i}',
             'case_number': f'AQP{record_date.year}{i:06d}',
             'date': record_date.isoformat(),
             'block': f'{random.choice(["AV", "CALLE", "JR"])} {random.randint(100, 999)}',
@@ -309,45 +553,62 @@ def persist_dataframe_to_sqlite(df: pd.DataFrame, db_path: str = 'chicago.db', t
     
     # Convertir el diccionario a una cadena
     if 'location' in df.columns and df['location'].dtype == 'object':
-        df['location'] = df['location'].apply(lambda x: str(x) if isinstance(x, dict) else x)
+        # assign: el DataFrame de la sesión puede estar compartido con otras sesiones
+        df = df.assign(location=df['location'].apply(lambda x: str(x) if isinstance(x, dict) else x))
     
+    # Upsert por id: guardar dos veces el mismo lote ya no duplica filas
+    if 'id' in df.columns:
+        df = df.drop_duplicates(subset='id', keep='first')
     conn = sqlite3.connect(db_path)
     try:
-        df.to_sql(table, conn, if_exists='append', index=False)
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone()
+        if not exists or 'id' not in df.columns:
+            df.to_sql(table, conn, if_exists='append', index=False)
+            if 'id' in df.columns:
+                retention.dedupe_sqlite_table(conn, table)
+            return
+        # Tablas de versiones anteriores pueden tener duplicados y no tener índice
+        # único; con el índice ya creado no hace falta recorrer la tabla
+        has_index = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (f'{table}_id_uq',)
+        ).fetchone()
+        if not has_index:
+            retention.dedupe_sqlite_table(conn, table)
+        existing = {row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')}
+        columns = ', '.join(f'"{c}"' for c in df.columns if c in existing)
+        staging = f'{table}_staging'
+        df.to_sql(staging, conn, if_exists='replace', index=False)
+        conn.execute(f'INSERT OR REPLACE INTO "{table}" ({columns}) SELECT {columns} FROM "{staging}"')
+        conn.execute(f'DROP TABLE "{staging}"')
+        conn.commit()
     finally:
         conn.close()
 
 
 def add_records_to_session(df: pd.DataFrame, is_arequipa: bool = False) -> None:
-    if is_arequipa:
-        key = '_arequipa_records'
-        existing = st.session_state.get(key, pd.DataFrame(columns=SCHEMA_COLUMNS))
-        st.session_state[key] = pd.concat([df, existing], ignore_index=True)
-    else:
-        key_df = '_chicago_last_df'
-        existing = st.session_state.get(key_df, pd.DataFrame(columns=SCHEMA_COLUMNS))
-        st.session_state[key_df] = pd.concat([df, existing], ignore_index=True)
-
-
-def get_arequipa_records() -> pd.DataFrame:
-    """Obtiene los registros sintéticos de Arequipa almacenados en la sesión."""
-    return st.session_state.get('_arequipa_records', pd.DataFrame(columns=SCHEMA_COLUMNS))
-
-
-def clear_arequipa_records() -> None:
-    """Limpia los registros sintéticos de Arequipa de la sesión."""
-    if '_arequipa_records' in st.session_state:
-        del st.session_state['_arequipa_records']
+    """Antepone `df` a los registros de la sesión, conservando como mucho `SESSION_MAX_SYNTHETIC_ROWS` (los más nuevos)."""
+    key = _AREQUIPA_KEY if is_arequipa else _COMBINED_KEY
+    existing = session_store.get(key)
+    combined = df if existing is None or existing.empty else pd.concat([df, existing], ignore_index=True)
+    if len(combined) > session_store.SESSION_MAX_SYNTHETIC_ROWS:
+        combined = combined.iloc[:session_store.SESSION_MAX_SYNTHETIC_ROWS].reset_index(drop=True)
+    session_store.put(key, combined)
+    _bump_data_version()
+    if not is_arequipa:
+        st.session_state['_chicago_last_df_version'] = get_data_version()
 
 
 def get_arequipa_records() -> pd.DataFrame:
     """Obtiene los registros sintéticos de Arequipa almacenados en la sesión."""
-    return st.session_state.get('_arequipa_records', pd.DataFrame(columns=SCHEMA_COLUMNS))
+    frame = session_store.get(_AREQUIPA_KEY)
+    return frame if frame is not None else pd.DataFrame(columns=SCHEMA_COLUMNS)
 
 
 def clear_arequipa_records() -> None:
     """Limpia los registros sintéticos de Arequipa de la sesión."""
-    if '_arequipa_records' in st.session_state:
-        del st.session_state['_arequipa_records']
+    if session_store.drop(_AREQUIPA_KEY):
+        _bump_data_version()
 
 
@@ -1,13 +1,27 @@
 import os
+import re
 import sqlite3
 import json
-import random
-from typing import Any, Dict, List
-from datetime import datetime, timedelta
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 
+import anomaly
+import querylog
+import tracing
+
+# Reading .env is a local file read; the expensive parts (psycopg2 import,
+# TLS connect, schema DDL) are deferred to the first database call.
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # DB_MODE
 DB_MODE = os.getenv('DB_MODE', 'sqlite').lower()
 
@@ -19,15 +33,615 @@ PG_PASSWORD: str = os.getenv('PG_PASSWORD', '')
 PG_PORT: str = os.getenv('PG_PORT', '5432')
 PG_SSLMODE: str = os.getenv('PG_SSLMODE', 'require')
 
+# Connection pool (Postgres). Should be >= the gunicorn threads per worker.
+PG_POOL_MIN: int = int(os.getenv('PG_POOL_MIN', '1'))
+PG_POOL_MAX: int = int(os.getenv('PG_POOL_MAX', '8'))
+
+# Optional Postgres read replica: reads go there unless they must see a
+# write the replica has not replayed yet (or it lags more than the limit).
+PG_READ_HOST: str = os.getenv('PG_READ_HOST', '')
+PG_READ_PORT: str = os.getenv('PG_READ_PORT', PG_PORT)
+PG_READ_POOL_MAX: int = int(os.getenv('PG_READ_POOL_MAX', str(PG_POOL_MAX)))
+PG_MAX_REPLICA_LAG_S: float = float(os.getenv('PG_MAX_REPLICA_LAG_S', '5'))
+REPLICA_STATUS_TTL_S: float = float(os.getenv('REPLICA_STATUS_TTL_S', '1'))
+
 # SQLite settings (used when DB_MODE == 'sqlite')
 SQLITE_PATH = os.getenv('SQLITE_PATH', 'chicago_local.db')
+SQLITE_TIMEOUT: float = float(os.getenv('SQLITE_TIMEOUT', '30'))
+# WAL lets readers run while a write is in progress; reader connections
+# also get a larger page cache and memory-mapped I/O.
+SQLITE_JOURNAL_MODE: str = os.getenv('SQLITE_JOURNAL_MODE', 'wal')
+SQLITE_MMAP_SIZE: int = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+SQLITE_CACHE_KB: int = int(os.getenv('SQLITE_CACHE_KB', str(64 * 1024)))
+
+# Ids per IN (...) statement in multi-id SQLite queries (host parameter limit is 999)
+BATCH_CHUNK_SIZE: int = 500
+
+_sqlite_local = threading.local()
+# One writer connection per process; writers across processes queue on SQLite's own lock
+_sqlite_writer = None
+_sqlite_write_lock = threading.RLock()
+_schema_ready = False
+_schema_lock = threading.Lock()
+_pg_pools: Dict[str, Any] = {}
+_pg_pool_lock = threading.Lock()
+_pg_pool_slots = {
+    'primary': threading.BoundedSemaphore(max(1, PG_POOL_MAX)),
+    'replica': threading.BoundedSemaphore(max(1, PG_READ_POOL_MAX)),
+}
+_routing_local = threading.local()
+_routing_lock = threading.Lock()
+_routing = {
+    'last_write_lsn': 0,
+    'replica_status': None,
+    'reads_primary': 0,
+    'reads_replica': 0,
+    'ryw_fallbacks': 0,
+    'lag_fallbacks': 0,
+    'replica_errors': 0,
+    'writes': 0,
+    'write_wait_ms': 0.0,
+}
+
+
+def _count_routing(name: str, delta: float = 1) -> None:
+    with _routing_lock:
+        _routing[name] += delta
+
+
+def _elapsed_ms(started: float) -> float:
+    return (time.perf_counter() - started) * 1000
+
+
+def _observe(sql: Any, params: Any, started: float, explain: Any = None, backend: str = DB_MODE) -> None:
+    """Report a finished statement to the slow-query log and, inside a trace, as a ``db.query`` span."""
+    if tracing.active():
+        tracing.record('db.query', started, sql=querylog.normalize_sql(sql)[:200])
+    querylog.observe(sql, params, _elapsed_ms(started), explain, backend)
+
+
+def _sqlite_plan(conn: sqlite3.Connection, sql: str, params: Any) -> str:
+    """EXPLAIN QUERY PLAN rendered as an indented tree (never runs the statement, writes included)."""
+    rows = sqlite3.Connection.execute(conn, f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    if not rows:
+        # Plain INSERT ... VALUES: no table scans or index searches to show
+        return '(no scans or searches)'
+    depth: Dict[int, int] = {0: -1}
+    lines = []
+    for node, parent, _, detail in rows:
+        depth[node] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[node] + detail)
+    return '\n'.join(lines)
+
+
+class _TimedSqliteCursor(sqlite3.Cursor):
+    """Cursor that reports every statement's duration to the slow-query log."""
+
+    def execute(self, sql, params=()):
+        started = time.perf_counter()
+        result = super().execute(sql, params)
+        _observe(sql, params, started, lambda _analyze: _sqlite_plan(self.connection, sql, params), 'sqlite')
+        return result
+
+    def executemany(self, sql, seq_of_params):
+        rows = seq_of_params if isinstance(seq_of_params, list) else list(seq_of_params)
+        started = time.perf_counter()
+        result = super().executemany(sql, rows)
+        # Planned with the first row's parameters (the plan does not depend on the values)
+        first = rows[0] if rows else ()
+        _observe(sql, f'<{len(rows)} rows>', started, lambda _analyze: _sqlite_plan(self.connection, sql, first), 'sqlite')
+        return result
+
+
+class _TimedSqliteConnection(sqlite3.Connection):
+    def cursor(self, factory=_TimedSqliteCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+
+_pg_cursor_class = None
+
+
+def _pg_plan(conn: Any, sql: Any, params: Any, analyze: bool) -> str:
+    """EXPLAIN text, inside a savepoint so a failure cannot abort the caller's transaction.
+
+    ``analyze`` (SELECTs only, see ``querylog.explain_mode``) runs the query
+    again with ``EXPLAIN (ANALYZE, BUFFERS)``; writes get a plain
+    ``EXPLAIN``, which plans without executing.
+    """
+    from psycopg2 import extensions
+
+    cur = extensions.cursor(conn)
+    try:
+        if not conn.autocommit:
+            cur.execute("SAVEPOINT querylog_explain")
+        try:
+            prefix = 'EXPLAIN (ANALYZE, BUFFERS)' if analyze else 'EXPLAIN'
+            cur.execute(f"{prefix} {sql}", params)
+            return '\n'.join(row[0] for row in cur.fetchall())
+        finally:
+            if not conn.autocommit:
+                cur.execute("ROLLBACK TO SAVEPOINT querylog_explain")
+                cur.execute("RELEASE SAVEPOINT querylog_explain")
+    finally:
+        cur.close()
+
+
+def _pg_cursor_factory():
+    """Cursor class for the Postgres pools (built on first use, psycopg2 is imported lazily)."""
+    global _pg_cursor_class
+    if _pg_cursor_class is None:
+        from psycopg2 import extensions
+
+        class _TimedPgCursor(extensions.cursor):
+            def execute(self, query, vars=None):
+                # Named (server-side) cursors only DECLARE here; execute_values
+                # sends pre-rendered bytes that contain the values, it is timed by _execute_values
+                if self.name is not None or isinstance(query, bytes):
+                    return super().execute(query, vars)
+                started = time.perf_counter()
+                result = super().execute(query, vars)
+                _observe(query, vars, started, lambda analyze: _pg_plan(self.connection, query, vars, analyze), 'postgres')
+                return result
+
+            def executemany(self, query, vars_list):
+                rows = vars_list if isinstance(vars_list, list) else list(vars_list)
+                started = time.perf_counter()
+                result = super().executemany(query, rows)
+                first = rows[0] if rows else None
+                _observe(
+                    query, f'<{len(rows)} rows>', started,
+                    lambda analyze: _pg_plan(self.connection, query, first, analyze), 'postgres',
+                )
+                return result
+
+        _pg_cursor_class = _TimedPgCursor
+    return _pg_cursor_class
+
+
+def _execute_values(cur: Any, sql: str, rows: List[Any]) -> None:
+    """psycopg2 ``execute_values`` timed as one statement (values never reach the log)."""
+    from psycopg2.extras import execute_values
+
+    started = time.perf_counter()
+    execute_values(cur, sql, rows)
+    # Planned with the first row: psycopg2 adapts a tuple to the "(v1, v2, ...)" that VALUES %s expects
+    first = (tuple(rows[0]),) if rows else None
+    _observe(
+        sql, f'<{len(rows)} rows>', started,
+        lambda analyze: _pg_plan(cur.connection, sql, first, analyze), 'postgres',
+    )
+
+
+@contextmanager
+def _sqlite_connection(write: bool = False) -> Iterator[sqlite3.Connection]:
+    """Yield a SQLite connection: this thread's reader, or the process writer.
+
+    Reader connections are reused across calls made from the same thread
+    and are read-only (``query_only``). ``write=True`` holds the single
+    writer connection for the block and starts an immediate transaction,
+    so the read-then-write in ``insert_crimes`` cannot fail upgrading its
+    lock; in WAL mode readers keep working meanwhile and see the commit as
+    soon as it lands (read-your-writes needs nothing more).
+    """
+    _ensure_schema()
+    if write:
+        global _sqlite_writer
+        started = time.perf_counter()
+        with _sqlite_write_lock:
+            tracing.record('db.write_lock', started)
+            _count_routing('write_wait_ms', (time.perf_counter() - started) * 1000)
+            _count_routing('writes')
+            if _sqlite_writer is None:
+                _sqlite_writer = sqlite3.connect(
+                    SQLITE_PATH, timeout=SQLITE_TIMEOUT, check_same_thread=False, factory=_TimedSqliteConnection
+                )
+                _sqlite_writer.row_factory = sqlite3.Row
+                _sqlite_writer.execute("PRAGMA synchronous=NORMAL")
+            conn = _sqlite_writer
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+        return
+
+    conn = getattr(_sqlite_local, 'conn', None)
+    if conn is None:
+        started = time.perf_counter()
+        conn = sqlite3.connect(SQLITE_PATH, timeout=SQLITE_TIMEOUT, factory=_TimedSqliteConnection)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KB}")
+        conn.execute("PRAGMA query_only=ON")
+        _sqlite_local.conn = conn
+        tracing.record('db.connect', started)
+    _count_routing('reads_primary')
+    try:
+        yield conn
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def _get_pg_pool(role: str = 'primary'):
+    """Create the process-wide Postgres pool for ``role`` ('primary' or 'replica') on first use."""
+    pool = _pg_pools.get(role)
+    if pool is None:
+        with _pg_pool_lock:
+            pool = _pg_pools.get(role)
+            if pool is None:
+                from psycopg2 import pool as pg_pool
+                replica = role == 'replica'
+                pool = pg_pool.ThreadedConnectionPool(
+                    PG_POOL_MIN,
+                    PG_READ_POOL_MAX if replica else PG_POOL_MAX,
+                    host=PG_READ_HOST if replica else PG_HOST,
+                    dbname=PG_DBNAME,
+                    user=PG_USER,
+                    password=PG_PASSWORD,
+                    port=PG_READ_PORT if replica else PG_PORT,
+                    sslmode=PG_SSLMODE,
+                    cursor_factory=_pg_cursor_factory(),
+                )
+                _pg_pools[role] = pool
+    return pool
+
+
+def _parse_lsn(lsn: Any) -> int:
+    """'16/B374D848' -> comparable integer (0 for missing or malformed values)."""
+    try:
+        high, low = str(lsn).split('/')
+        return (int(high, 16) << 32) + int(low, 16)
+    except (AttributeError, ValueError):
+        return 0
+
+
+def _format_lsn(value: int) -> str:
+    return f'{value >> 32:X}/{value & 0xFFFFFFFF:X}'
+
+
+def _replica_status(max_age: float = REPLICA_STATUS_TTL_S) -> Dict[str, Any]:
+    """Replay position and lag of the replica (``ok`` False if unreachable), cached for ``max_age`` seconds."""
+    with _routing_lock:
+        status = _routing['replica_status']
+    if status is not None and time.monotonic() - status['checked_at'] < max_age:
+        return status
+    try:
+        with _pg_connection(read=True, route=False) as conn:
+            with conn.cursor() as cur:
+                # Fully replayed means no lag, even if the primary has been idle for a while
+                cur.execute(
+                    """
+                    SELECT pg_last_wal_replay_lsn()::text,
+                           CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+                           END
+                    """
+                )
+                replay_lsn, lag_s = cur.fetchone()
+            conn.rollback()
+    except Exception as e:
+        logger.warning('Replica status check failed: %s', e)
+        _count_routing('replica_errors')
+        # Cached too, so an unreachable replica costs one attempt per TTL, not one per read
+        status = {'ok': False, 'error': str(e), 'checked_at': time.monotonic()}
+    else:
+        status = {'ok': True, 'replay_lsn': _parse_lsn(replay_lsn), 'lag_s': float(lag_s), 'checked_at': time.monotonic()}
+    with _routing_lock:
+        _routing['replica_status'] = status
+    return status
+
+
+def _read_role() -> str:
+    """Pick the pool for a read: the replica unless it is lagging or behind a write this caller must see."""
+    if not PG_READ_HOST:
+        return 'primary'
+    with _routing_lock:
+        needed = max(_routing['last_write_lsn'], getattr(_routing_local, 'min_lsn', 0))
+    status = _replica_status()
+    if status['ok'] and needed and status['replay_lsn'] < needed:
+        # The cached position may be stale: look again before giving up on the replica
+        status = _replica_status(max_age=0)
+        if status['ok'] and status['replay_lsn'] < needed:
+            _count_routing('ryw_fallbacks')
+            return 'primary'
+    if not status['ok']:
+        return 'primary'
+    if status['lag_s'] > PG_MAX_REPLICA_LAG_S:
+        _count_routing('lag_fallbacks')
+        return 'primary'
+    return 'replica'
+
+
+def _note_write(conn: Any) -> None:
+    """After a committed write, remember the primary's WAL position for read-your-writes."""
+    _count_routing('writes')
+    if not PG_READ_HOST:
+        return
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_current_wal_lsn()::text")
+        lsn = _parse_lsn(cur.fetchone()[0])
+    conn.rollback()
+    _routing_local.write_lsn = max(getattr(_routing_local, 'write_lsn', 0), lsn)
+    with _routing_lock:
+        _routing['last_write_lsn'] = max(_routing['last_write_lsn'], lsn)
+
+
+def set_read_floor(lsn: str | None) -> None:
+    """Make this thread's reads see at least WAL position ``lsn`` (e.g. a client's X-Min-LSN); None clears it."""
+    _routing_local.min_lsn = _parse_lsn(lsn) if lsn else 0
+    _routing_local.write_lsn = 0
+
+
+def thread_write_lsn() -> str | None:
+    """WAL position of the newest write made by this thread since ``set_read_floor`` (Postgres with a replica)."""
+    lsn = getattr(_routing_local, 'write_lsn', 0)
+    return _format_lsn(lsn) if lsn else None
+
+
+@contextmanager
+def _pg_connection(ensure_schema: bool = True, read: bool = False, route: bool = True) -> Iterator[Any]:
+    """Borrow a pooled Postgres connection.
+
+    ``read=True`` may be served by the read replica (see ``_read_role``);
+    everything else uses the primary. Blocks while all connections of the
+    pool are in use instead of failing, and discards connections that were
+    closed by the server.
+    """
+    if ensure_schema:
+        _ensure_schema()
+    role = 'primary'
+    if read:
+        role = _read_role() if route else 'replica'
+        if route:
+            _count_routing('reads_replica' if role == 'replica' else 'reads_primary')
+    started = time.perf_counter()
+    _pg_pool_slots[role].acquire()
+    try:
+        pool = _get_pg_pool(role)
+        conn = pool.getconn()
+        tracing.record('db.connect', started, role=role)
+        try:
+            yield conn
+        except Exception:
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+            raise
+        finally:
+            pool.putconn(conn, close=bool(conn.closed))
+    finally:
+        _pg_pool_slots[role].release()
+
+
+def routing_stats() -> Dict[str, Any]:
+    """Read/write routing counters and, with a replica, its replay lag in seconds and bytes."""
+    with _routing_lock:
+        stats = {k: v for k, v in _routing.items() if k not in ('replica_status', 'last_write_lsn')}
+        last_write = _routing['last_write_lsn']
+    stats['write_wait_ms'] = round(stats['write_wait_ms'], 2)
+    if DB_MODE == 'sqlite':
+        stats = {'reads': stats['reads_primary'], 'writes': stats['writes'], 'write_wait_ms': stats['write_wait_ms']}
+        try:
+            with _sqlite_connection() as conn:
+                stats['journal_mode'] = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        except Exception as e:
+            stats['error'] = str(e)
+        return {'backend': 'sqlite', **stats}
+
+    stats['replica'] = bool(PG_READ_HOST)
+    if not PG_READ_HOST:
+        return {'backend': 'postgres', **stats}
+    status = _replica_status(max_age=0)
+    stats['last_write_lsn'] = _format_lsn(last_write) if last_write else None
+    if not status['ok']:
+        stats.update(replica_ok=False, replica_error=status['error'])
+        return {'backend': 'postgres', **stats}
+    stats.update(replica_ok=True, replay_lsn=_format_lsn(status['replay_lsn']), lag_s=round(status['lag_s'], 3))
+    try:
+        with _pg_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_current_wal_lsn()::text")
+                stats['lag_bytes'] = max(0, _parse_lsn(cur.fetchone()[0]) - status['replay_lsn'])
+            conn.rollback()
+    except Exception as e:
+        stats['error'] = str(e)
+    return {'backend': 'postgres', **stats}
+
+
+# Monotonic counter bumped by every write that changes `crimes`; lets
+# caches (e.g. exports) key their results by data version.
+_META_DDL = """
+    CREATE TABLE IF NOT EXISTS crimes_meta (
+        key TEXT PRIMARY KEY,
+        value BIGINT NOT NULL
+    )
+"""
+_BUMP_VERSION_SQL = """
+    INSERT INTO crimes_meta (key, value) VALUES ('data_version', 1)
+    ON CONFLICT (key) DO UPDATE SET value = crimes_meta.value + 1
+"""
+
+
+# Append-only change log for delta sync: one row per upserted or deleted id.
+# Writers bump `crimes_meta` first, which row-locks it until commit, so log
+# versions become visible in increasing order and `since` never skips rows.
+CHANGE_UPSERT = 'upsert'
+CHANGE_DELETE = 'delete'
+
+_SQLITE_CHANGES_DDL = """
+    CREATE TABLE IF NOT EXISTS crimes_changes (
+        version INTEGER PRIMARY KEY AUTOINCREMENT,
+        id TEXT NOT NULL,
+        op TEXT NOT NULL,
+        changed_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+_PG_CHANGES_DDL = """
+    CREATE TABLE IF NOT EXISTS crimes_changes (
+        version BIGSERIAL PRIMARY KEY,
+        id TEXT NOT NULL,
+        op TEXT NOT NULL,
+        changed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+"""
+
+
+def _log_changes(cur: Any, ids: List[str], op: str) -> None:
+    """Append ``op`` entries for ``ids`` to the change log (same transaction as the write)."""
+    if not ids:
+        return
+    if DB_MODE == 'sqlite':
+        cur.executemany("INSERT INTO crimes_changes (id, op) VALUES (?, ?)", [(i, op) for i in ids])
+        return
+    _execute_values(cur, "INSERT INTO crimes_changes (id, op) VALUES %s", [(i, op) for i in ids])
+
+
+# Per-cell decayed counts for anomaly detection (see anomaly.py), updated
+# in the same transaction as the inserts that feed them.
+_ANOMALY_CELLS_DDL = """
+    CREATE TABLE IF NOT EXISTS crimes_anomaly_cells (
+        lat_bin {real} NOT NULL,
+        lon_bin {real} NOT NULL,
+        primary_type TEXT NOT NULL,
+        fast {real} NOT NULL,
+        slow {real} NOT NULL,
+        last_ts {real} NOT NULL,
+        total BIGINT NOT NULL,
+        first_ts {real},
+        PRIMARY KEY (lat_bin, lon_bin, primary_type)
+    )
+"""
+_ANOMALY_CELL_COLUMNS = ['lat_bin', 'lon_bin', 'primary_type', 'fast', 'slow', 'last_ts', 'total', 'first_ts']
+_ANOMALY_UPSERT_TAIL = """
+    ON CONFLICT (lat_bin, lon_bin, primary_type) DO UPDATE SET
+    fast = excluded.fast, slow = excluded.slow, last_ts = excluded.last_ts, total = excluded.total,
+    first_ts = excluded.first_ts
+"""
+
+
+def _update_anomaly_cells(cur: Any, inserted: List[Dict[str, Any]]) -> None:
+    """Fold newly inserted records into their cells' decayed counts (O(1) per record)."""
+    events = anomaly.group_events(inserted, default_ts=time.time())
+    if not events:
+        return
+    keys = list(events)
+    cells: Dict[Any, Dict[str, Any]] = {}
+    select = f"SELECT {', '.join(_ANOMALY_CELL_COLUMNS)} FROM crimes_anomaly_cells"
+    if DB_MODE == 'sqlite':
+        for chunk in _chunks(keys, BATCH_CHUNK_SIZE // 3):
+            tuples = ','.join('(?, ?, ?)' for _ in chunk)
+            cur.execute(
+                f"{select} WHERE (lat_bin, lon_bin, primary_type) IN (VALUES {tuples})",
+                [v for key in chunk for v in key],
+            )
+            for row in cur.fetchall():
+                cells[tuple(row[:3])] = dict(zip(_ANOMALY_CELL_COLUMNS[3:], row[3:]))
+    else:
+        cur.execute(f"{select} WHERE (lat_bin, lon_bin, primary_type) IN %s", (tuple(keys),))
+        for row in cur.fetchall():
+            cells[tuple(row[:3])] = dict(zip(_ANOMALY_CELL_COLUMNS[3:], row[3:]))
+
+    latest = 0.0
+    values = []
+    for key in keys:
+        cell = cells.get(key) or anomaly.new_cell()
+        for ts in sorted(events[key]):
+            anomaly.add_event(cell, ts)
+        latest = max(latest, cell['last_ts'])
+        values.append((*key, cell['fast'], cell['slow'], cell['last_ts'], cell['total'], cell['first_ts']))
+
+    columns = ', '.join(_ANOMALY_CELL_COLUMNS)
+    if DB_MODE == 'sqlite':
+        cur.executemany(
+            f"INSERT INTO crimes_anomaly_cells ({columns}) VALUES ({', '.join('?' for _ in _ANOMALY_CELL_COLUMNS)})"
+            + _ANOMALY_UPSERT_TAIL,
+            values,
+        )
+        cur.execute(
+            "INSERT INTO crimes_meta (key, value) VALUES ('anomaly_clock', ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = MAX(crimes_meta.value, excluded.value)",
+            (int(latest),),
+        )
+    else:
+        _execute_values(
+            cur,
+            f"INSERT INTO crimes_anomaly_cells ({columns}) VALUES %s" + _ANOMALY_UPSERT_TAIL,
+            values,
+        )
+        cur.execute(
+            "INSERT INTO crimes_meta (key, value) VALUES ('anomaly_clock', %s) "
+            "ON CONFLICT (key) DO UPDATE SET value = GREATEST(crimes_meta.value, EXCLUDED.value)",
+            (int(latest),),
+        )
+
+
+# Full-text search over these columns: FTS5 in SQLite, tsvector + GIN in Postgres
+SEARCH_COLUMNS = ('description', 'block', 'location_description', 'primary_type')
+
+# External-content FTS5 index over `crimes`, kept in sync by triggers so
+# every write path (single and batch upserts/deletes) updates it.
+_SQLITE_FTS_DDL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS crimes_fts USING fts5(
+        {', '.join(SEARCH_COLUMNS)}, content='crimes', content_rowid='rowid'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS crimes_fts_ai AFTER INSERT ON crimes BEGIN
+        INSERT INTO crimes_fts (rowid, {', '.join(SEARCH_COLUMNS)})
+        VALUES (new.rowid, {', '.join('new.' + c for c in SEARCH_COLUMNS)});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS crimes_fts_ad AFTER DELETE ON crimes BEGIN
+        INSERT INTO crimes_fts (crimes_fts, rowid, {', '.join(SEARCH_COLUMNS)})
+        VALUES ('delete', old.rowid, {', '.join('old.' + c for c in SEARCH_COLUMNS)});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS crimes_fts_au AFTER UPDATE ON crimes BEGIN
+        INSERT INTO crimes_fts (crimes_fts, rowid, {', '.join(SEARCH_COLUMNS)})
+        VALUES ('delete', old.rowid, {', '.join('old.' + c for c in SEARCH_COLUMNS)});
+        INSERT INTO crimes_fts (rowid, {', '.join(SEARCH_COLUMNS)})
+        VALUES (new.rowid, {', '.join('new.' + c for c in SEARCH_COLUMNS)});
+    END
+    """,
+]
+_PG_SEARCH_DOCUMENT = " || ' ' || ".join(f"coalesce({c}, '')" for c in SEARCH_COLUMNS)
+
+# False when this SQLite build lacks FTS5; search then falls back to LIKE
+_sqlite_fts = False
+
+
+def _init_sqlite_fts(cur: sqlite3.Cursor) -> bool:
+    """Create the FTS5 index and its triggers, backfilling it on first creation."""
+    cur.execute("SELECT 1 FROM sqlite_master WHERE name = 'crimes_fts'")
+    existed = cur.fetchone() is not None
+    try:
+        for ddl in _SQLITE_FTS_DDL:
+            cur.execute(ddl)
+    except sqlite3.OperationalError as e:
+        logger.warning('SQLite FTS5 unavailable, text search will scan: %s', e)
+        return False
+    if not existed:
+        cur.execute("INSERT INTO crimes_fts (crimes_fts) VALUES ('rebuild')")
+    return True
 
 
 def _init_sqlite() -> None:
     """Create sqlite DB and `crimes` table if it doesn't exist."""
-    conn = sqlite3.connect(SQLITE_PATH)
+    conn = sqlite3.connect(SQLITE_PATH, timeout=SQLITE_TIMEOUT, factory=_TimedSqliteConnection)
     try:
         cur = conn.cursor()
+        # Persistent in the database file; every later connection uses it
+        cur.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
         cur.execute(
             """
             CREATE TABLE IF NOT EXISTS crimes (
@@ -50,269 +664,776 @@ def _init_sqlite() -> None:
                 updated_on TEXT,
                 latitude REAL,
                 longitude REAL,
-                location TEXT
+                location TEXT,
+                ingest_mode TEXT,
+                content_hash TEXT
             )
             """
         )
+        cur.execute("PRAGMA table_info(crimes)")
+        existing_cols = {row[1] for row in cur.fetchall()}
+        for col in ('ingest_mode', 'content_hash'):
+            if col not in existing_cols:
+                cur.execute(f"ALTER TABLE crimes ADD COLUMN {col} TEXT")
+        cur.execute(_META_DDL)
+        cur.execute(_SQLITE_CHANGES_DDL)
+        cur.execute(_ANOMALY_CELLS_DDL.format(real='REAL'))
+        cur.execute("PRAGMA table_info(crimes_anomaly_cells)")
+        if 'first_ts' not in {row[1] for row in cur.fetchall()}:
+            cur.execute("ALTER TABLE crimes_anomaly_cells ADD COLUMN first_ts REAL")
+        global _sqlite_fts
+        _sqlite_fts = _init_sqlite_fts(cur)
         conn.commit()
     finally:
         conn.close()
 
 
-if DB_MODE == 'sqlite':
-    _init_sqlite()
-else:
-    import psycopg2
-    from psycopg2.extras import execute_values
-    
-    def _init_postgres() -> None:
-        """Create the `crimes` table in Postgres if it doesn't exist."""
-        conn = psycopg2.connect(
-            host=PG_HOST,
-            dbname=PG_DBNAME,
-            user=PG_USER,
-            password=PG_PASSWORD,
-            port=PG_PORT,
-            sslmode=PG_SSLMODE,
-        )
-        try:
-            with conn.cursor() as cur:
-                cur.execute(
-                    """
-                    CREATE TABLE IF NOT EXISTS crimes (
-                        id TEXT PRIMARY KEY,
-                        case_number TEXT,
-                        date TIMESTAMPTZ,
-                        block TEXT,
-                        iucr TEXT,
-                        primary_type TEXT,
-                        description TEXT,
-                        location_description TEXT,
-                        arrest BOOLEAN,
-                        domestic BOOLEAN,
-                        beat TEXT,
-                        district TEXT,
-                        ward TEXT,
-                        community_area TEXT,
-                        fbi_code TEXT,
-                        year INTEGER,
-                        updated_on TIMESTAMPTZ,
-                        latitude DOUBLE PRECISION,
-                        longitude DOUBLE PRECISION,
-                        location TEXT
-                    )
-                    """
+def _init_postgres() -> None:
+    """Create the `crimes` table in Postgres if it doesn't exist."""
+    with _pg_connection(ensure_schema=False) as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS crimes (
+                    id TEXT PRIMARY KEY,
+                    case_number TEXT,
+                    date TIMESTAMPTZ,
+                    block TEXT,
+                    iucr TEXT,
+                    primary_type TEXT,
+                    description TEXT,
+                    location_description TEXT,
+                    arrest BOOLEAN,
+                    domestic BOOLEAN,
+                    beat TEXT,
+                    district TEXT,
+                    ward TEXT,
+                    community_area TEXT,
+                    fbi_code TEXT,
+                    year INTEGER,
+                    updated_on TIMESTAMPTZ,
+                    latitude DOUBLE PRECISION,
+                    longitude DOUBLE PRECISION,
+                    location TEXT,
+                    ingest_mode TEXT,
+                    content_hash TEXT
                 )
-            conn.commit()
-        finally:
-            conn.close()
+                """
+            )
+            cur.execute("ALTER TABLE crimes ADD COLUMN IF NOT EXISTS ingest_mode TEXT")
+            cur.execute("ALTER TABLE crimes ADD COLUMN IF NOT EXISTS content_hash TEXT")
+            cur.execute(
+                f"""
+                ALTER TABLE crimes ADD COLUMN IF NOT EXISTS search_tsv tsvector
+                GENERATED ALWAYS AS (to_tsvector('simple', {_PG_SEARCH_DOCUMENT})) STORED
+                """
+            )
+            cur.execute("CREATE INDEX IF NOT EXISTS crimes_search_tsv_idx ON crimes USING GIN (search_tsv)")
+            cur.execute(_META_DDL)
+            cur.execute(_PG_CHANGES_DDL)
+            cur.execute(_ANOMALY_CELLS_DDL.format(real='DOUBLE PRECISION'))
+            cur.execute("ALTER TABLE crimes_anomaly_cells ADD COLUMN IF NOT EXISTS first_ts DOUBLE PRECISION")
+        conn.commit()
+
+
+def _ensure_schema() -> None:
+    """Create or migrate the schema once per process, on first database use."""
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if _schema_ready:
+            return
+        if DB_MODE == 'sqlite':
+            _init_sqlite()
+        else:
+            _init_postgres()
+        _schema_ready = True
 
+
+def check_ready() -> Dict[str, Any]:
+    """Run a one-shot readiness check against the configured backend.
+
+    Initializes the schema if needed and runs ``SELECT 1``. Never raises;
+    failures are reported in the returned dict.
+    """
+    started = time.perf_counter()
+    result: Dict[str, Any] = {'backend': DB_MODE, 'ok': True}
     try:
-        _init_postgres()
-    except Exception:
-        
-        pass
+        if DB_MODE == 'sqlite':
+            with _sqlite_connection() as conn:
+                conn.execute("SELECT 1").fetchone()
+        else:
+            with _pg_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                    cur.fetchone()
+    except Exception as e:
+        logger.warning('Database readiness check failed: %s', e)
+        result['ok'] = False
+        result['error'] = str(e)
+    result['latency_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    return result
 
 
-def insert_crimes(records: List[Dict[str, Any]]) -> None:
-    """Insert or update records in the configured backend."""
-    if not records:
-        return
+CRIME_COLUMNS: List[str] = [
+    'id', 'case_number', 'date', 'block', 'iucr', 'primary_type',
+    'description', 'location_description', 'arrest', 'domestic', 'beat',
+    'district', 'ward', 'community_area', 'fbi_code', 'year', 'updated_on',
+    'latitude', 'longitude', 'location'
+]
+_SELECT_COLUMNS = ', '.join(CRIME_COLUMNS)
+_READ_COLUMNS = _SELECT_COLUMNS + ', ingest_mode'
+
+# Ingest modes: real rows keep their timestamps; synthetic (demo) rows can be replayed
+INGEST_REAL = 'real'
+INGEST_SYNTHETIC = 'synthetic'
+INGEST_MODES = (INGEST_REAL, INGEST_SYNTHETIC)
+
+# Replay synthetic timestamps on reads unless the caller says otherwise
+SYNTHETIC_REPLAY: bool = os.getenv('SYNTHETIC_REPLAY', '0').lower() in ('1', 'true', 'yes')
 
-    columns = [
-        'id', 'case_number', 'date', 'block', 'iucr', 'primary_type',
-        'description', 'location_description', 'arrest', 'domestic', 'beat',
-        'district', 'ward', 'community_area', 'fbi_code', 'year', 'updated_on',
-        'latitude', 'longitude', 'location'
-    ]
 
-    def _normalize_value(v: Any) -> Any:
-        if v is None:
-            return None
+def _unique_ids(crime_ids: List[Any]) -> List[str]:
+    """Stringify ids and drop duplicates, keeping the caller's order."""
+    return list(dict.fromkeys(str(i) for i in crime_ids if i is not None))
+
+
+def _chunks(items: List[str], size: int = BATCH_CHUNK_SIZE) -> Iterator[List[str]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _normalize_value(v: Any) -> Any:
+    if v is None:
+        return None
+    
+    try:
         
+        if hasattr(v, 'to_pydatetime'):
+            v = v.to_pydatetime()
+    except Exception:
+        pass
+
+    if isinstance(v, datetime):
+        return v.isoformat()
+    if isinstance(v, bool):
+        return int(v)
+    if isinstance(v, (list, dict)):
         try:
-            
-            if hasattr(v, 'to_pydatetime'):
-                v = v.to_pydatetime()
+            return json.dumps(v)
         except Exception:
-            pass
+            return str(v)
+    return v
 
-        if isinstance(v, datetime):
-            return v.isoformat()
-        if isinstance(v, bool):
-            return int(v)
-        if isinstance(v, (list, dict)):
-            try:
-                return json.dumps(v)
-            except Exception:
-                return str(v)
-        return v
 
-    def _enforce_recent_date(rec: Dict[str, Any]) -> None:
-        """Force record 'date' to be today's date and at least 1 hour earlier than now.
-
-        Sets 'date' to UTC now minus between 1 hour and ~1 hour 59 minutes,
-        updates 'updated_on' to now, and adjusts 'year'.
-        """
-        now = datetime.utcnow()
-        extra_minutes = random.randint(0, 59)
-        extra_seconds = random.randint(0, 59)
-        new_date = now - timedelta(hours=1, minutes=extra_minutes, seconds=extra_seconds)
-        rec['date'] = new_date
-        rec['updated_on'] = now
+def _pg_norm(v: Any) -> Any:
+    try:
+        if hasattr(v, 'to_pydatetime'):
+            v = v.to_pydatetime()
+    except Exception:
+        pass
+    if isinstance(v, datetime):
+        return v
+    if isinstance(v, bool):
+        return v
+    if isinstance(v, (list, dict)):
         try:
-            rec['year'] = new_date.year
+            return json.dumps(v)
         except Exception:
-            rec['year'] = now.year
+            return str(v)
+    return v
+
+
+def _content_hash(rec: Dict[str, Any], mode: str) -> str:
+    """Stable hash of a record's column values, used to skip unchanged rows."""
+    values = [_normalize_value(rec.get(col)) for col in CRIME_COLUMNS] + [mode]
+    payload = json.dumps(values, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
 
-    for r in records:
-        try:
-            _enforce_recent_date(r)
-        except Exception:
-            pass
 
+def _replay_timestamps(row: Dict[str, Any]) -> None:
+    """Shift a synthetic row so it looks like it happened within the last ~2 hours.
+
+    Sets 'date' to UTC now minus between 1 hour and ~1 hour 59 minutes,
+    updates 'updated_on' to now, and adjusts 'year'. The offset is derived
+    from the id, so a row keeps its relative position between reads.
+    """
+    now = datetime.now(timezone.utc) if DB_MODE == 'postgres' else datetime.utcnow()
+    offset = int(hashlib.md5(str(row.get('id')).encode('utf-8')).hexdigest()[:8], 16) % 3600
+    new_date = now - timedelta(hours=1, seconds=offset)
     if DB_MODE == 'sqlite':
-        conn = sqlite3.connect(SQLITE_PATH)
-        try:
+        row['date'] = new_date.isoformat()
+        row['updated_on'] = now.isoformat()
+    else:
+        row['date'] = new_date
+        row['updated_on'] = now
+    row['year'] = new_date.year
+
+
+def _finish_rows(rows: List[Dict[str, Any]], replay: bool) -> List[Dict[str, Any]]:
+    """Drop internal columns and, if requested, replay synthetic timestamps."""
+    for row in rows:
+        mode = row.pop('ingest_mode', None)
+        if replay and mode == 'synthetic':
+            _replay_timestamps(row)
+    return rows
+
+
+def insert_crimes(records: List[Dict[str, Any]], mode: str = INGEST_REAL) -> Dict[str, int]:
+    """Insert or update records in the configured backend, skipping unchanged rows.
+
+    ``mode`` tags the rows as ``'real'`` or ``'synthetic'``. Timestamps are
+    stored as given in both modes; synthetic rows can be shifted to look
+    recent at read time with ``replay=True`` on the fetch functions.
+
+    Each row stores a ``content_hash`` of the values it was ingested with.
+    Incoming records whose hash matches the stored one are not written at
+    all, so resyncing the same upstream rows is (nearly) write-free.
+
+    Returns counts of ``inserted``, ``updated`` and ``unchanged`` records.
+    """
+    if mode not in INGEST_MODES:
+        raise ValueError(f'Invalid ingest mode {mode!r}, expected one of {INGEST_MODES}')
+    stats = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+    if not records:
+        return stats
+
+    columns = CRIME_COLUMNS + ['ingest_mode', 'content_hash']
+
+    # Last occurrence of an id wins, like the row-by-row upsert did
+    incoming: Dict[str, Dict[str, Any]] = {}
+    for rec in records:
+        if rec.get('id') is None:
+            continue
+        incoming[str(rec['id'])] = rec
+    hashes = {rid: _content_hash(rec, mode) for rid, rec in incoming.items()}
+    ids = list(incoming)
+
+    def _changed_records(existing: Dict[str, str]) -> List[Dict[str, Any]]:
+        changed = []
+        for rid in ids:
+            if rid not in existing:
+                stats['inserted'] += 1
+            elif existing[rid] != hashes[rid]:
+                stats['updated'] += 1
+            else:
+                stats['unchanged'] += 1
+                continue
+            rec = dict(incoming[rid])
+            rec['id'] = rid
+            rec['ingest_mode'] = mode
+            rec['content_hash'] = hashes[rid]
+            changed.append(rec)
+        return changed
+
+    update_cols = [col for col in columns if col != 'id']
+
+    if DB_MODE == 'sqlite':
+        with _sqlite_connection(write=True) as conn:
             cur = conn.cursor()
-            placeholders = ','.join('?' for _ in columns)
-            insert_sql = f"INSERT OR REPLACE INTO crimes ({', '.join(columns)}) VALUES ({placeholders})"
-            values = [tuple(_normalize_value(rec.get(col)) for col in columns) for rec in records]
-            cur.executemany(insert_sql, values)
+            existing: Dict[str, str] = {}
+            for chunk in _chunks(ids):
+                placeholders = ','.join('?' for _ in chunk)
+                cur.execute(f"SELECT id, content_hash FROM crimes WHERE id IN ({placeholders})", chunk)
+                existing.update((str(row[0]), row[1]) for row in cur.fetchall())
+            changed = _changed_records(existing)
+            if changed:
+                placeholders = ','.join('?' for _ in columns)
+                insert_sql = f"""
+                    INSERT INTO crimes ({', '.join(columns)}) VALUES ({placeholders})
+                    ON CONFLICT(id) DO UPDATE SET
+                    {', '.join([f"{col}=excluded.{col}" for col in update_cols])}
+                """
+                values = [tuple(_normalize_value(rec.get(col)) for col in columns) for rec in changed]
+                cur.executemany(insert_sql, values)
+                cur.execute(_BUMP_VERSION_SQL)
+                _log_changes(cur, [rec['id'] for rec in changed], CHANGE_UPSERT)
+                _update_anomaly_cells(cur, [rec for rec in changed if rec['id'] not in existing])
             conn.commit()
-        finally:
-            conn.close()
-        return
+        return stats
 
     # Postgres 
-    conn = psycopg2.connect(
-        host=PG_HOST,
-        dbname=PG_DBNAME,
-        user=PG_USER,
-        password=PG_PASSWORD,
-        port=PG_PORT,
-        sslmode=PG_SSLMODE,
-    )
-    try:
+    with _pg_connection() as conn:
         with conn.cursor() as cur:
-            def _pg_norm(v: Any) -> Any:
-                try:
-                    if hasattr(v, 'to_pydatetime'):
-                        v = v.to_pydatetime()
-                except Exception:
-                    pass
-                if isinstance(v, datetime):
-                    return v
-                if isinstance(v, bool):
-                    return v
-                if isinstance(v, (list, dict)):
-                    try:
-                        return json.dumps(v)
-                    except Exception:
-                        return str(v)
-                return v
-
-            values = [tuple(_pg_norm(rec.get(col)) for col in columns) for rec in records]
-            insert_sql = f"""
-                INSERT INTO crimes ({', '.join(columns)})
-                VALUES %s
-                ON CONFLICT (id) DO UPDATE SET
-                {', '.join([f"{col}=EXCLUDED.{col}" for col in columns if col != 'id'])}
-            """
-            execute_values(cur, insert_sql, values)
+            cur.execute("SELECT id, content_hash FROM crimes WHERE id = ANY(%s)", (ids,))
+            existing = {str(row[0]): row[1] for row in cur.fetchall()}
+            changed = _changed_records(existing)
+            if changed:
+                values = [tuple(_pg_norm(rec.get(col)) for col in columns) for rec in changed]
+                insert_sql = f"""
+                    INSERT INTO crimes ({', '.join(columns)})
+                    VALUES %s
+                    ON CONFLICT (id) DO UPDATE SET
+                    {', '.join([f"{col}=EXCLUDED.{col}" for col in update_cols])}
+                """
+                _execute_values(cur, insert_sql, values)
+                cur.execute(_BUMP_VERSION_SQL)
+                _log_changes(cur, [rec['id'] for rec in changed], CHANGE_UPSERT)
+                _update_anomaly_cells(cur, [rec for rec in changed if rec['id'] not in existing])
         conn.commit()
-    finally:
-        conn.close()
+        if changed:
+            _note_write(conn)
+    return stats
+
+
+def _sort_by_date_desc(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return sorted(rows, key=lambda r: (r.get('date') is not None, r.get('date')), reverse=True)
+
+
+def fetch_latest_crimes(limit: int = 5000, replay: bool | None = None) -> List[Dict[str, Any]]:
+    """Return the ``limit`` most recent records.
 
+    With ``replay`` (default ``SYNTHETIC_REPLAY``) synthetic rows get fresh
+    timestamps and are merged by their replayed date.
+    """
+    if replay is None:
+        replay = SYNTHETIC_REPLAY
+    if replay:
+        # Replayed rows jump to "now", so take the newest of each kind and merge
+        queries = [
+            "WHERE ingest_mode = 'synthetic'",
+            "WHERE ingest_mode IS NULL OR ingest_mode <> 'synthetic'",
+        ]
+    else:
+        queries = ['']
 
-def fetch_latest_crimes(limit: int = 5000) -> List[Dict[str, Any]]:
-    columns = None
+    rows: List[Dict[str, Any]] = []
     if DB_MODE == 'sqlite':
-        conn = sqlite3.connect(SQLITE_PATH)
-        try:
-            conn.row_factory = sqlite3.Row
+        with _sqlite_connection() as conn:
             cur = conn.cursor()
-            cur.execute("SELECT * FROM crimes ORDER BY date DESC LIMIT ?", (limit,))
-            rows = cur.fetchall()
-            return [dict(row) for row in rows]
-        finally:
-            conn.close()
-
-    conn = psycopg2.connect(
-        host=PG_HOST,
-        dbname=PG_DBNAME,
-        user=PG_USER,
-        password=PG_PASSWORD,
-        port=PG_PORT,
-        sslmode=PG_SSLMODE,
-    )
-    try:
-        with conn.cursor() as cur:
-            cur.execute("SELECT * FROM crimes ORDER BY date DESC LIMIT %s", (limit,))
-            cols = [desc[0] for desc in cur.description]
-            rows = cur.fetchall()
-            return [dict(zip(cols, row)) for row in rows]
-    finally:
-        conn.close()
+            for where in queries:
+                cur.execute(f"SELECT {_READ_COLUMNS} FROM crimes {where} ORDER BY date DESC LIMIT ?", (limit,))
+                rows.extend(dict(row) for row in cur.fetchall())
+    else:
+        with _pg_connection(read=True) as conn:
+            with conn.cursor() as cur:
+                for where in queries:
+                    cur.execute(f"SELECT {_READ_COLUMNS} FROM crimes {where} ORDER BY date DESC LIMIT %s", (limit,))
+                    cols = [desc[0] for desc in cur.description]
+                    rows.extend(dict(zip(cols, row)) for row in cur.fetchall())
+
+    rows = _finish_rows(rows, replay)
+    if replay:
+        rows = _sort_by_date_desc(rows)[:limit]
+    return rows
 
 
-def fetch_crime_by_id(crime_id: str) -> Dict[str, Any] | None:
+def fetch_crime_by_id(crime_id: str, replay: bool | None = None) -> Dict[str, Any] | None:
+    if replay is None:
+        replay = SYNTHETIC_REPLAY
     if DB_MODE == 'sqlite':
-        conn = sqlite3.connect(SQLITE_PATH)
-        try:
-            conn.row_factory = sqlite3.Row
+        with _sqlite_connection() as conn:
             cur = conn.cursor()
-            cur.execute("SELECT * FROM crimes WHERE id = ?", (crime_id,))
+            cur.execute(f"SELECT {_READ_COLUMNS} FROM crimes WHERE id = ?", (crime_id,))
             row = cur.fetchone()
-            return dict(row) if row else None
-        finally:
-            conn.close()
-
-    conn = psycopg2.connect(
-        host=PG_HOST,
-        dbname=PG_DBNAME,
-        user=PG_USER,
-        password=PG_PASSWORD,
-        port=PG_PORT,
-        sslmode=PG_SSLMODE,
-    )
-    try:
+            return _finish_rows([dict(row)], replay)[0] if row else None
+
+    with _pg_connection(read=True) as conn:
         with conn.cursor() as cur:
-            cur.execute("SELECT * FROM crimes WHERE id = %s", (crime_id,))
+            cur.execute(f"SELECT {_READ_COLUMNS} FROM crimes WHERE id = %s", (crime_id,))
             row = cur.fetchone()
             if not row:
                 return None
             cols = [desc[0] for desc in cur.description]
-            return dict(zip(cols, row))
-    finally:
-        conn.close()
+            return _finish_rows([dict(zip(cols, row))], replay)[0]
 
 
 def delete_crime_by_id(crime_id: str) -> bool:
     if DB_MODE == 'sqlite':
-        conn = sqlite3.connect(SQLITE_PATH)
-        try:
+        with _sqlite_connection(write=True) as conn:
             cur = conn.cursor()
             cur.execute("DELETE FROM crimes WHERE id = ?", (crime_id,))
             deleted = cur.rowcount
+            if deleted:
+                cur.execute(_BUMP_VERSION_SQL)
+                _log_changes(cur, [str(crime_id)], CHANGE_DELETE)
             conn.commit()
             return deleted > 0
-        finally:
-            conn.close()
-
-    conn = psycopg2.connect(
-        host=PG_HOST,
-        dbname=PG_DBNAME,
-        user=PG_USER,
-        password=PG_PASSWORD,
-        port=PG_PORT,
-        sslmode=PG_SSLMODE,
-    )
-    try:
+
+    with _pg_connection() as conn:
         with conn.cursor() as cur:
             cur.execute("DELETE FROM crimes WHERE id = %s", (crime_id,))
             deleted = cur.rowcount
+            if deleted:
+                cur.execute(_BUMP_VERSION_SQL)
+                _log_changes(cur, [str(crime_id)], CHANGE_DELETE)
         conn.commit()
+        if deleted:
+            _note_write(conn)
         return deleted > 0
-    finally:
-        conn.close()
+
+
+def fetch_crimes_by_ids(crime_ids: List[Any], replay: bool | None = None) -> Dict[str, Dict[str, Any] | None]:
+    """Fetch many records in a single round-trip.
+
+    Returns a dict keyed by id in request order; ids that do not exist map
+    to None.
+    """
+    if replay is None:
+        replay = SYNTHETIC_REPLAY
+    ids = _unique_ids(crime_ids)
+    found: Dict[str, Dict[str, Any]] = {}
+    if not ids:
+        return {}
+
+    if DB_MODE == 'sqlite':
+        with _sqlite_connection() as conn:
+            cur = conn.cursor()
+            for chunk in _chunks(ids):
+                placeholders = ','.join('?' for _ in chunk)
+                cur.execute(f"SELECT {_READ_COLUMNS} FROM crimes WHERE id IN ({placeholders})", chunk)
+                for row in cur.fetchall():
+                    found[str(row['id'])] = dict(row)
+    else:
+        with _pg_connection(read=True) as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT {_READ_COLUMNS} FROM crimes WHERE id = ANY(%s)", (ids,))
+                cols = [desc[0] for desc in cur.description]
+                for row in cur.fetchall():
+                    rec = dict(zip(cols, row))
+                    found[str(rec['id'])] = rec
+    _finish_rows(list(found.values()), replay)
+    return {i: found.get(i) for i in ids}
+
+
+def delete_crimes_by_ids(crime_ids: List[Any]) -> Dict[str, bool]:
+    """Delete many records in one transaction.
+
+    Returns a dict keyed by id in request order with True for ids that were
+    deleted and False for ids that did not exist.
+    """
+    ids = _unique_ids(crime_ids)
+    deleted: set = set()
+    if not ids:
+        return {}
+
+    if DB_MODE == 'sqlite':
+        with _sqlite_connection(write=True) as conn:
+            cur = conn.cursor()
+            for chunk in _chunks(ids):
+                placeholders = ','.join('?' for _ in chunk)
+                cur.execute(f"SELECT id FROM crimes WHERE id IN ({placeholders})", chunk)
+                deleted.update(str(row[0]) for row in cur.fetchall())
+                cur.execute(f"DELETE FROM crimes WHERE id IN ({placeholders})", chunk)
+            if deleted:
+                cur.execute(_BUMP_VERSION_SQL)
+                _log_changes(cur, [i for i in ids if i in deleted], CHANGE_DELETE)
+            conn.commit()
+    else:
+        with _pg_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM crimes WHERE id = ANY(%s) RETURNING id", (ids,))
+                deleted.update(str(row[0]) for row in cur.fetchall())
+                if deleted:
+                    cur.execute(_BUMP_VERSION_SQL)
+                    _log_changes(cur, [i for i in ids if i in deleted], CHANGE_DELETE)
+            conn.commit()
+            if deleted:
+                _note_write(conn)
+    return {i: i in deleted for i in ids}
+
+
+def _search_terms(query: str) -> List[str]:
+    return re.findall(r'\w+', (query or '').lower())
+
+
+def search_crimes(
+    query: str,
+    limit: int = 50,
+    offset: int = 0,
+    replay: bool | None = None,
+) -> Dict[str, Any]:
+    """Full-text search over ``SEARCH_COLUMNS``, best matches first.
+
+    Every word of ``query`` must match (as a prefix) in any of the columns.
+    Uses the FTS5 index on SQLite (BM25 ranking) and the ``search_tsv`` GIN
+    index on Postgres (``ts_rank``). Returns ``{'total', 'records'}`` where
+    ``total`` counts all matches and ``records`` holds the requested page.
+    """
+    if replay is None:
+        replay = SYNTHETIC_REPLAY
+    terms = _search_terms(query)
+    if not terms:
+        return {'total': 0, 'records': []}
+
+    if DB_MODE == 'sqlite':
+        with _sqlite_connection() as conn:
+            cur = conn.cursor()
+            if _sqlite_fts:
+                match = ' '.join(f'"{t}"*' for t in terms)
+                cur.execute("SELECT count(*) FROM crimes_fts WHERE crimes_fts MATCH ?", (match,))
+                total = cur.fetchone()[0]
+                cols = ', '.join(f'c.{c}' for c in _READ_COLUMNS.split(', '))
+                cur.execute(
+                    f"""
+                    SELECT {cols} FROM crimes_fts JOIN crimes c ON c.rowid = crimes_fts.rowid
+                    WHERE crimes_fts MATCH ? ORDER BY bm25(crimes_fts), c.date DESC LIMIT ? OFFSET ?
+                    """,
+                    (match, limit, offset),
+                )
+            else:
+                any_column = '(' + ' OR '.join(f'lower({c}) LIKE ?' for c in SEARCH_COLUMNS) + ')'
+                where = ' AND '.join(any_column for _ in terms)
+                params = [f'%{t}%' for t in terms for _ in SEARCH_COLUMNS]
+                cur.execute(f"SELECT count(*) FROM crimes WHERE {where}", params)
+                total = cur.fetchone()[0]
+                cur.execute(
+                    f"SELECT {_READ_COLUMNS} FROM crimes WHERE {where} ORDER BY date DESC LIMIT ? OFFSET ?",
+                    params + [limit, offset],
+                )
+            rows = [dict(row) for row in cur.fetchall()]
+    else:
+        tsquery = ' & '.join(f'{t}:*' for t in terms)
+        with _pg_connection(read=True) as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT count(*) FROM crimes WHERE search_tsv @@ to_tsquery('simple', %s)",
+                    (tsquery,),
+                )
+                total = cur.fetchone()[0]
+                cur.execute(
+                    f"""
+                    SELECT {_READ_COLUMNS} FROM crimes, to_tsquery('simple', %s) AS q
+                    WHERE search_tsv @@ q
+                    ORDER BY ts_rank(search_tsv, q) DESC, date DESC LIMIT %s OFFSET %s
+                    """,
+                    (tsquery, limit, offset),
+                )
+                cols = [desc[0] for desc in cur.description]
+                rows = [dict(zip(cols, row)) for row in cur.fetchall()]
+
+    return {'total': int(total), 'records': _finish_rows(rows, replay)}
+
+
+def fetch_changes(since: int = 0, limit: int = 1000, replay: bool | None = None) -> Dict[str, Any]:
+    """Return what changed after change-log version ``since``, one page at a time.
+
+    Reads up to ``limit`` log entries and collapses them per id to the last
+    operation: upserted ids come back as full current rows, deleted ids as
+    tombstones. Clients pass the returned ``next_since`` on the next call
+    until ``has_more`` is False.
+    """
+    if replay is None:
+        replay = SYNTHETIC_REPLAY
+    last_op: Dict[str, str] = {}
+    if DB_MODE == 'sqlite':
+        with _sqlite_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                "SELECT version, id, op FROM crimes_changes WHERE version > ? ORDER BY version LIMIT ?",
+                (since, limit + 1),
+            )
+            log = [tuple(row) for row in cur.fetchall()]
+    else:
+        with _pg_connection(read=True) as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT version, id, op FROM crimes_changes WHERE version > %s ORDER BY version LIMIT %s",
+                    (since, limit + 1),
+                )
+                log = cur.fetchall()
+            conn.rollback()
+
+    has_more = len(log) > limit
+    log = log[:limit]
+    for _, crime_id, op in log:
+        last_op.pop(crime_id, None)
+        last_op[crime_id] = op
+
+    upsert_ids = [i for i, op in last_op.items() if op == CHANGE_UPSERT]
+    rows = fetch_crimes_by_ids(upsert_ids, replay=replay) if upsert_ids else {}
+    return {
+        'since': since,
+        'next_since': int(log[-1][0]) if log else since,
+        'has_more': has_more,
+        # An id upserted then deleted later (past this page) is skipped here;
+        # its tombstone arrives on a following page.
+        'upserts': [row for row in rows.values() if row is not None],
+        'deletes': [i for i, op in last_op.items() if op == CHANGE_DELETE],
+    }
+
+
+def latest_change_version() -> int:
+    """Newest change-log version (0 if the log is empty); a starting ``since`` for ``fetch_changes``."""
+    sql = "SELECT COALESCE(MAX(version), 0) FROM crimes_changes"
+    if DB_MODE == 'sqlite':
+        with _sqlite_connection() as conn:
+            return int(conn.execute(sql).fetchone()[0])
+
+    with _pg_connection(read=True) as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql)
+            version = int(cur.fetchone()[0])
+        conn.rollback()
+        return version
+
+
+def detect_anomalies(
+    limit: int = 50,
+    min_z: float | None = None,
+    min_count: float | None = None,
+    now: float | None = None,
+) -> Dict[str, Any]:
+    """Cells whose recent rate significantly exceeds their baseline.
+
+    Reads only the per-cell state kept by ``insert_crimes``, never the
+    records. ``now`` (epoch seconds) defaults to the stream clock, the
+    newest event time ingested. Returns ``{'as_of', 'anomalies'}``.
+    """
+    min_z = anomaly.ANOMALY_Z if min_z is None else min_z
+    min_count = anomaly.ANOMALY_MIN_COUNT if min_count is None else min_count
+    select = f"SELECT {', '.join(_ANOMALY_CELL_COLUMNS)} FROM crimes_anomaly_cells WHERE fast >= {{p}}"
+    clock_sql = "SELECT value FROM crimes_meta WHERE key = 'anomaly_clock'"
+    if DB_MODE == 'sqlite':
+        with _sqlite_connection() as conn:
+            clock = conn.execute(clock_sql).fetchone()
+            # Stored counts only decay from last_ts on, so fast >= min_count prefilters safely
+            rows = conn.execute(select.replace('{p}', '?'), (min_count,)).fetchall()
+    else:
+        with _pg_connection(read=True) as conn:
+            with conn.cursor() as cur:
+                cur.execute(clock_sql)
+                clock = cur.fetchone()
+                cur.execute(select.replace('{p}', '%s'), (min_count,))
+                rows = cur.fetchall()
+            conn.rollback()
+
+    if now is None:
+        if not clock:
+            return {'as_of': None, 'anomalies': []}
+        # A clock already pushed into the future by a mis-dated record must not decay real cells
+        now = min(float(clock[0]), time.time())
+    cells = ((tuple(row[:3]), dict(zip(_ANOMALY_CELL_COLUMNS[3:], row[3:]))) for row in rows)
+    return {
+        'as_of': datetime.fromtimestamp(now, timezone.utc).isoformat(),
+        'anomalies': anomaly.detect(cells, now, min_z=min_z, min_count=min_count, limit=limit),
+    }
+
+
+_COMPACT_TABLES = ('crimes', 'crimes_changes', 'crimes_anomaly_cells', 'crimes_meta')
+
+
+def _sqlite_file_bytes() -> int:
+    return sum(
+        os.path.getsize(SQLITE_PATH + suffix)
+        for suffix in ('', '-wal', '-shm')
+        if os.path.exists(SQLITE_PATH + suffix)
+    )
+
+
+def compact() -> Dict[str, Any]:
+    """VACUUM and ANALYZE the crimes tables, reporting storage before and after.
+
+    On SQLite this rewrites the file (holding the process writer lock) and
+    truncates the WAL; on Postgres it runs ``VACUUM (ANALYZE)``, which makes
+    dead rows reusable but rarely shrinks the files.
+    """
+    _ensure_schema()
+    if DB_MODE == 'sqlite':
+        before = _sqlite_file_bytes()
+        with _sqlite_write_lock:
+            conn = sqlite3.connect(SQLITE_PATH, timeout=SQLITE_TIMEOUT, isolation_level=None)
+            try:
+                conn.execute("VACUUM")
+                conn.execute("ANALYZE")
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            finally:
+                conn.close()
+        after = _sqlite_file_bytes()
+        return {'backend': 'sqlite', 'before_bytes': before, 'after_bytes': after, 'reclaimed_bytes': before - after}
+
+    size_sql = """
+        SELECT COALESCE(SUM(pg_total_relation_size(oid)), 0)
+        FROM pg_class WHERE relname = ANY(%s) AND relkind = 'r'
+    """
+    with _pg_connection() as conn:
+        # VACUUM cannot run inside a transaction block
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                cur.execute(size_sql, (list(_COMPACT_TABLES),))
+                before = int(cur.fetchone()[0])
+                for table in _COMPACT_TABLES:
+                    cur.execute(f"VACUUM (ANALYZE) {table}")
+                cur.execute(size_sql, (list(_COMPACT_TABLES),))
+                after = int(cur.fetchone()[0])
+        finally:
+            conn.autocommit = False
+    return {'backend': 'postgres', 'before_bytes': before, 'after_bytes': after, 'reclaimed_bytes': before - after}
+
+
+def data_version() -> int:
+    """Current value of the write counter (0 if nothing was ever written)."""
+    if DB_MODE == 'sqlite':
+        with _sqlite_connection() as conn:
+            row = conn.execute("SELECT value FROM crimes_meta WHERE key = 'data_version'").fetchone()
+            return int(row[0]) if row else 0
+
+    with _pg_connection(read=True) as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT value FROM crimes_meta WHERE key = 'data_version'")
+            row = cur.fetchone()
+            return int(row[0]) if row else 0
+
+
+def iter_crimes(
+    primary_type: str | None = None,
+    since: str | None = None,
+    until: str | None = None,
+    mode: str | None = None,
+    limit: int | None = None,
+    batch_size: int = 5000,
+) -> Iterator[List[Dict[str, Any]]]:
+    """Stream records matching the filters in batches of ``batch_size`` rows.
+
+    Uses a server-side cursor on Postgres so large exports never hold the
+    full result in memory. Rows are ordered by date, newest first.
+    """
+    clauses: List[str] = []
+    params: List[Any] = []
+    if primary_type:
+        clauses.append("primary_type = {p}")
+        params.append(primary_type)
+    if since:
+        clauses.append("date >= {p}")
+        params.append(since)
+    if until:
+        clauses.append("date < {p}")
+        params.append(until)
+    if mode == INGEST_REAL:
+        # Rows written before ingest modes existed have no mode and count as real
+        clauses.append("(ingest_mode IS NULL OR ingest_mode <> {p})")
+        params.append(INGEST_SYNTHETIC)
+    elif mode:
+        clauses.append("ingest_mode = {p}")
+        params.append(mode)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    sql = f"SELECT {_READ_COLUMNS} FROM crimes {where} ORDER BY date DESC"
+    if limit is not None:
+        sql += " LIMIT {p}"
+        params.append(int(limit))
+
+    if DB_MODE == 'sqlite':
+        with _sqlite_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(sql.replace('{p}', '?'), params)
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield _finish_rows([dict(row) for row in rows], replay=False)
+
+    with _pg_connection(read=True) as conn:
+        with conn.cursor(name=f'iter_crimes_{uuid.uuid4().hex}') as cur:
+            cur.itersize = batch_size
+            cur.execute(sql.replace('{p}', '%s'), params)
+            cols = None
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if cols is None and cur.description:
+                    cols = [desc[0] for desc in cur.description]
+                if not rows:
+                    break
+                yield _finish_rows([dict(zip(cols, row)) for row in rows], replay=False)
+        conn.rollback()
@@ -0,0 +1,344 @@
+"""Exportación de registros a CSV, Parquet y GeoJSON.
+
+Los archivos se generan bajo demanda y por bloques (`iter_export`), y se
+guardan en `EXPORT_DIR` con un nombre derivado de una clave que incluye la
+versión de los datos: mientras los datos no cambien, repetir una descarga
+sólo lee el archivo ya generado. Las exportaciones grandes pueden correr
+como trabajos en segundo plano (`start_export_job`), cuyo estado se guarda
+junto al archivo para que cualquier worker de gunicorn pueda consultarlo.
+Cada worker corre como mucho `EXPORT_JOB_CONCURRENCY` trabajos a la vez
+(`ExportBusy` al superarlo) y pedir otra vez una exportación en curso
+devuelve el mismo trabajo.
+
+pandas se importa dentro de las funciones que lo usan: la API importa este
+módulo y no debe cargar pandas/numpy/pyarrow hasta la primera exportación.
+"""
+import hashlib
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+EXPORT_DIR: str = os.getenv('EXPORT_DIR', 'exports')
+EXPORT_CACHE_MAX_FILES: int = int(os.getenv('EXPORT_CACHE_MAX_FILES', '20'))
+EXPORT_JOB_CONCURRENCY: int = int(os.getenv('EXPORT_JOB_CONCURRENCY', '2'))
+CHUNK_ROWS: int = 5000
+_READ_BLOCK: int = 1 << 20
+
+EXPORT_FORMATS: Dict[str, Dict[str, str]] = {
+    'csv': {'ext': 'csv', 'mime': 'text/csv'},
+    'geojson': {'ext': 'geojson', 'mime': 'application/geo+json'},
+    'parquet': {'ext': 'parquet', 'mime': 'application/vnd.apache.parquet'},
+}
+
+FrameFactory = Callable[[], Iterable['pd.DataFrame']]
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except Exception:
+        return False
+
+
+def available_formats() -> List[str]:
+    return [f for f in EXPORT_FORMATS if f != 'parquet' or parquet_available()]
+
+
+def chunk_frame(df: 'pd.DataFrame', chunk_rows: int = CHUNK_ROWS) -> Iterator['pd.DataFrame']:
+    """Divide un DataFrame en bloques de `chunk_rows` filas (vistas, sin copiar)."""
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+def _json_value(v: Any) -> Any:
+    import pandas as pd
+
+    if v is None:
+        return None
+    if isinstance(v, (str, bool, int)):
+        return v
+    try:
+        if pd.isna(v):
+            return None
+    except (TypeError, ValueError):
+        pass
+    if isinstance(v, (pd.Timestamp, datetime)):
+        return v.isoformat()
+    if hasattr(v, 'item'):
+        # numpy scalars
+        return v.item()
+    return v
+
+
+def _iter_csv(frames: Iterable['pd.DataFrame']) -> Iterator[bytes]:
+    header = True
+    for chunk in frames:
+        if chunk.empty and not header:
+            continue
+        yield chunk.to_csv(index=False, header=header).encode('utf-8')
+        header = False
+
+
+def _iter_geojson(frames: Iterable['pd.DataFrame']) -> Iterator[bytes]:
+    import pandas as pd
+
+    yield b'{"type": "FeatureCollection", "features": ['
+    first = True
+    for chunk in frames:
+        if chunk.empty:
+            continue
+        props_cols = [c for c in chunk.columns if c not in ('latitude', 'longitude')]
+        lats = pd.to_numeric(chunk['latitude'], errors='coerce') if 'latitude' in chunk else None
+        lons = pd.to_numeric(chunk['longitude'], errors='coerce') if 'longitude' in chunk else None
+        parts = []
+        for i, row in enumerate(chunk[props_cols].itertuples(index=False, name=None)):
+            geometry = None
+            if lats is not None and lons is not None:
+                lat, lon = lats.iat[i], lons.iat[i]
+                if not (pd.isna(lat) or pd.isna(lon)):
+                    geometry = {'type': 'Point', 'coordinates': [float(lon), float(lat)]}
+            feature = {
+                'type': 'Feature',
+                'geometry': geometry,
+                'properties': {c: _json_value(v) for c, v in zip(props_cols, row)},
+            }
+            parts.append(json.dumps(feature, default=str))
+        body = ','.join(parts)
+        yield (body if first else ',' + body).encode('utf-8')
+        first = False
+    yield b']}'
+
+
+def _write_parquet(frames: Iterable['pd.DataFrame'], path: str) -> None:
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for chunk in frames:
+            # Columnas mixtas (p. ej. location) como texto para un esquema estable
+            chunk = chunk.astype({c: 'string' for c in chunk.columns if chunk[c].dtype == object})
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            else:
+                table = table.cast(writer.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        pd.DataFrame().to_parquet(path)
+
+
+def iter_export(frames: Iterable['pd.DataFrame'], fmt: str) -> Iterator[bytes]:
+    """Genera el contenido exportado por bloques de bytes (CSV y GeoJSON)."""
+    if fmt == 'csv':
+        return _iter_csv(frames)
+    if fmt == 'geojson':
+        return _iter_geojson(frames)
+    raise ValueError(f'Formato sin salida por bloques: {fmt!r}')
+
+
+def cache_path(key: str, fmt: str) -> str:
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+    return os.path.join(EXPORT_DIR, f'export-{digest}.{EXPORT_FORMATS[fmt]["ext"]}')
+
+
+def _prune_cache() -> None:
+    try:
+        files = [
+            os.path.join(EXPORT_DIR, f) for f in os.listdir(EXPORT_DIR)
+            if f.startswith('export-') and not f.endswith('.tmp')
+        ]
+    except FileNotFoundError:
+        return
+    files.sort(key=os.path.getmtime, reverse=True)
+    for old in files[EXPORT_CACHE_MAX_FILES:]:
+        try:
+            os.remove(old)
+        except OSError:
+            pass
+
+
+def _read_blocks(path: str) -> Iterator[bytes]:
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(_READ_BLOCK)
+            if not block:
+                return
+            yield block
+
+
+def iter_export_cached(key: str, make_frames: FrameFactory, fmt: str) -> Iterator[bytes]:
+    """Como `iter_export`, pero sirve desde caché si `key` ya se exportó.
+
+    En un fallo de caché transmite los bloques a medida que se generan y a
+    la vez los escribe en disco; el archivo sólo queda en caché si la
+    exportación terminó completa.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f'Formato no soportado: {fmt!r}')
+    path = cache_path(key, fmt)
+    if os.path.exists(path):
+        os.utime(path)
+        yield from _read_blocks(path)
+        return
+    if fmt == 'parquet':
+        # Parquet necesita el archivo completo (footer) antes de poder leerse
+        yield from _read_blocks(export_to_file(key, make_frames, fmt))
+        return
+
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    tmp = f'{path}.{uuid.uuid4().hex}.tmp'
+    completed = False
+    try:
+        with open(tmp, 'wb') as out:
+            for block in iter_export(make_frames(), fmt):
+                out.write(block)
+                yield block
+        completed = True
+    finally:
+        if completed:
+            os.replace(tmp, path)
+            _prune_cache()
+        elif os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def export_to_file(key: str, make_frames: FrameFactory, fmt: str) -> str:
+    """Escribe la exportación en disco (si no está en caché) y devuelve su ruta."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f'Formato no soportado: {fmt!r}')
+    path = cache_path(key, fmt)
+    if os.path.exists(path):
+        os.utime(path)
+        return path
+
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    tmp = f'{path}.{uuid.uuid4().hex}.tmp'
+    try:
+        if fmt == 'parquet':
+            _write_parquet(make_frames(), tmp)
+        else:
+            with open(tmp, 'wb') as out:
+                for block in iter_export(make_frames(), fmt):
+                    out.write(block)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    _prune_cache()
+    return path
+
+
+# --- Trabajos en segundo plano -------------------------------------------
+
+_job_slots = threading.BoundedSemaphore(max(1, EXPORT_JOB_CONCURRENCY))
+_jobs_lock = threading.Lock()
+# (formato, clave) -> id del trabajo en curso en este proceso
+_running: Dict[tuple, str] = {}
+
+
+class ExportBusy(RuntimeError):
+    """Ya hay `EXPORT_JOB_CONCURRENCY` trabajos en curso en este proceso."""
+
+
+def _job_path(job_id: str) -> str:
+    return os.path.join(EXPORT_DIR, 'jobs', f'{job_id}.json')
+
+
+def _write_job(job_id: str, status: Dict[str, Any]) -> None:
+    path = _job_path(job_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(status, f)
+    os.replace(tmp, path)
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """Estado de un trabajo: `running`, `done` (con `path`), `error` o `expired`.
+
+    `expired` es un trabajo terminado cuyo archivo ya salió de la caché
+    (`_prune_cache`): hay que lanzar la exportación de nuevo.
+    """
+    if not all(c in '0123456789abcdef' for c in job_id):
+        return None
+    try:
+        with open(_job_path(job_id), 'r', encoding='utf-8') as f:
+            status = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if status.get('status') == 'done' and not os.path.exists(status.get('path', '')):
+        status = {k: v for k, v in status.items() if k not in ('path', 'size_bytes')}
+        status['status'] = 'expired'
+    return status
+
+
+def _done_status(base: Dict[str, Any], path: str) -> Dict[str, Any]:
+    return {
+        **base,
+        'status': 'done',
+        'path': path,
+        'size_bytes': os.path.getsize(path),
+        'finished_at': datetime.utcnow().isoformat(),
+    }
+
+
+def start_export_job(key: str, make_frames: FrameFactory, fmt: str) -> str:
+    """Lanza la exportación en un hilo y devuelve el id del trabajo.
+
+    Si la misma exportación ya está en curso en este proceso devuelve ese
+    trabajo; si ya está en caché, el trabajo queda terminado sin lanzar
+    nada.
+
+    @raises ExportBusy Si ya hay `EXPORT_JOB_CONCURRENCY` trabajos en curso.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f'Formato no soportado: {fmt!r}')
+    job_id = uuid.uuid4().hex
+    base = {'job_id': job_id, 'format': fmt, 'created_at': datetime.utcnow().isoformat()}
+    path = cache_path(key, fmt)
+    if os.path.exists(path):
+        os.utime(path)
+        _write_job(job_id, _done_status(base, path))
+        return job_id
+
+    with _jobs_lock:
+        running = _running.get((fmt, key))
+        if running is not None:
+            return running
+        if not _job_slots.acquire(blocking=False):
+            raise ExportBusy(f'Hay {EXPORT_JOB_CONCURRENCY} exportaciones en curso')
+        _running[(fmt, key)] = job_id
+    try:
+        _write_job(job_id, {**base, 'status': 'running'})
+    except Exception:
+        _finish_job(fmt, key)
+        raise
+
+    def _run() -> None:
+        try:
+            _write_job(job_id, _done_status(base, export_to_file(key, make_frames, fmt)))
+        except Exception as e:
+            _write_job(job_id, {**base, 'status': 'error', 'error': str(e)})
+        finally:
+            _finish_job(fmt, key)
+
+    threading.Thread(target=_run, name=f'export-{job_id[:8]}', daemon=True).start()
+    return job_id
+
+
+def _finish_job(fmt: str, key: str) -> None:
+    with _jobs_lock:
+        _running.pop((fmt, key), None)
+        _job_slots.release()
@@ -0,0 +1,34 @@
+"""Configuración de gunicorn para la API Flask (`api:app`).
+
+Por defecto usa workers `gthread`: cada proceso atiende `API_THREADS`
+peticiones a la vez, de modo que una petición esperando a la base de datos
+no bloquea al worker completo. Las conexiones a Postgres salen de un pool
+por proceso (`PG_POOL_MAX` en db_postgres.py), que debe ser >= `API_THREADS`.
+
+Para workers asíncronos usar `API_WORKER_CLASS=gevent` (requiere `gevent`
+y `psycogreen` instalados para que psycopg2 ceda el control al hacer I/O).
+
+Las opciones pasadas por línea de comandos (`-w`, `-b`, `--timeout`)
+tienen prioridad sobre este archivo: los comandos de arranque (start.sh,
+Procfile, docker-compose, railway.json, supervisord) sólo pasan `-b`, para
+que `API_WORKERS`, `API_THREADS` y `API_TIMEOUT` se respeten.
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('API_WORKERS', '4'))
+worker_class = os.getenv('API_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('API_THREADS', '8'))
+worker_connections = int(os.getenv('API_WORKER_CONNECTIONS', '200'))
+timeout = int(os.getenv('API_TIMEOUT', '120'))
+keepalive = int(os.getenv('API_KEEPALIVE', '5'))
+
+
+def post_fork(server, worker):
+    if worker_class != 'gevent':
+        return
+    try:
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+    except Exception as e:
+        server.log.warning(f'psycogreen no disponible, psycopg2 bloqueará el worker: {e}')
@@ -0,0 +1,195 @@
+"""Generador de carga: produce incidentes sintéticos de forma continua.
+
+Genera registros dentro de las `AREQUIPA_ZONES` configuradas a una tasa
+objetivo (eventos/segundo) y los envía por `POST /records?mode=synthetic`
+(`--target api`) o directamente a `db_postgres.insert_crimes`
+(`--target db`). Limita las peticiones en vuelo con `--concurrency` y
+reporta periódicamente throughput logrado y latencias por lote.
+
+Ejemplo:
+    python loadgen.py --rate 200 --batch-size 50 --concurrency 8 --duration 120
+    python loadgen.py --target db --zones Yanahuara --rate 500
+
+@returns Imprime reportes periódicos y un resumen final.
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+
+from loadtest import percentile
+
+
+class _Stats:
+    """Contadores compartidos entre los hilos de envío."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.errors = 0
+        self.latencies: List[float] = []
+
+    def record(self, n: int, latency: float, ok: bool) -> None:
+        with self.lock:
+            if ok:
+                self.sent += n
+                self.latencies.append(latency)
+            else:
+                self.errors += n
+
+    def snapshot(self, reset_latencies: bool = False) -> Tuple[int, int, List[float]]:
+        with self.lock:
+            lat = list(self.latencies)
+            if reset_latencies:
+                self.latencies = []
+            return self.sent, self.errors, lat
+
+
+def make_batch(n: int, zones: List[Dict[str, Any]], days_back: int = 0) -> List[Dict[str, Any]]:
+    """Genera `n` incidentes repartidos entre las zonas dadas, listos para JSON."""
+    import data
+
+    per_zone = [n // len(zones) + (1 if i < n % len(zones) else 0) for i in range(len(zones))]
+    records: List[Dict[str, Any]] = []
+    for zone, count in zip(zones, per_zone):
+        if count == 0:
+            continue
+        df = data.generate_random_records_in_zone(
+            n=count,
+            zone_bounds=zone['bounds'],
+            days_back=days_back,
+            store_in_session=False,
+            preferred_ratio=0.0,
+        )
+        records.extend(json.loads(df.to_json(orient='records', date_format='iso')))
+    # Ids únicos aunque varios hilos generen en el mismo milisegundo
+    for rec in records:
+        rec['id'] = f'LOAD-{uuid.uuid4().hex}'
+    return records
+
+
+def _api_sender(url: str) -> Callable[[List[Dict[str, Any]]], None]:
+    import requests
+
+    local = threading.local()
+
+    def _send(records: List[Dict[str, Any]]) -> None:
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        resp = session.post(f'{url}/records', params={'mode': 'synthetic'}, json=records, timeout=60)
+        resp.raise_for_status()
+
+    return _send
+
+
+def _db_sender() -> Callable[[List[Dict[str, Any]]], None]:
+    import db_postgres as db
+
+    def _send(records: List[Dict[str, Any]]) -> None:
+        db.insert_crimes(records, mode=db.INGEST_SYNTHETIC)
+
+    return _send
+
+
+def run(
+    send: Callable[[List[Dict[str, Any]]], None],
+    zones: List[Dict[str, Any]],
+    rate: float,
+    batch_size: int,
+    concurrency: int,
+    duration: float,
+    report_every: float,
+) -> Dict[str, Any]:
+    """Envía lotes a `rate` eventos/s hasta agotar `duration` (0 = sin fin)."""
+    stats = _Stats()
+    slots = threading.BoundedSemaphore(concurrency)
+    interval = batch_size / rate
+    started = time.perf_counter()
+    next_due = started
+    next_report = started + report_every
+    last_sent = 0
+
+    def _task(records: List[Dict[str, Any]]) -> None:
+        t0 = time.perf_counter()
+        try:
+            send(records)
+            stats.record(len(records), time.perf_counter() - t0, True)
+        except Exception as e:
+            stats.record(len(records), 0.0, False)
+            print(f'error: {e}')
+        finally:
+            slots.release()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        try:
+            while duration <= 0 or time.perf_counter() - started < duration:
+                now = time.perf_counter()
+                if now < next_due:
+                    time.sleep(next_due - now)
+                # Bloquea si ya hay `concurrency` lotes en vuelo (backpressure)
+                slots.acquire()
+                pool.submit(_task, make_batch(batch_size, zones))
+                next_due += interval
+
+                now = time.perf_counter()
+                if now >= next_report:
+                    sent, errors, lat = stats.snapshot(reset_latencies=True)
+                    window_rate = (sent - last_sent) / report_every
+                    lag = max(0.0, now - next_due)
+                    print(
+                        f'[{now - started:7.1f}s] {window_rate:8.1f} ev/s (objetivo {rate:.0f}) '
+                        f'enviados={sent} errores={errors} '
+                        f'p50={percentile(lat, 50) * 1000:.0f}ms p95={percentile(lat, 95) * 1000:.0f}ms '
+                        f'p99={percentile(lat, 99) * 1000:.0f}ms retraso={lag:.1f}s'
+                    )
+                    last_sent = sent
+                    next_report += report_every
+        except KeyboardInterrupt:
+            print('Interrumpido, esperando lotes en vuelo...')
+
+    elapsed = time.perf_counter() - started
+    sent, errors, _ = stats.snapshot()
+    return {
+        'elapsed_s': elapsed,
+        'sent': sent,
+        'errors': errors,
+        'achieved_rate': sent / elapsed if elapsed > 0 else 0.0,
+        'target_rate': rate,
+    }
+
+
+def main() -> None:
+    import data
+
+    parser = argparse.ArgumentParser(description='Generador de carga de incidentes sintéticos')
+    parser.add_argument('--target', choices=['api', 'db'], default='api')
+    parser.add_argument('--url', default='http://localhost:5000', help='API destino (--target api)')
+    parser.add_argument('--zones', nargs='+', default=None, help='Zonas de AREQUIPA_ZONES (por defecto todas)')
+    parser.add_argument('--rate', type=float, default=50.0, help='Eventos por segundo')
+    parser.add_argument('--batch-size', type=int, default=25, help='Registros por petición')
+    parser.add_argument('--concurrency', type=int, default=4, help='Lotes en vuelo como máximo')
+    parser.add_argument('--duration', type=float, default=60.0, help='Segundos (0 = hasta Ctrl+C)')
+    parser.add_argument('--report-every', type=float, default=5.0, help='Segundos entre reportes')
+    args = parser.parse_args()
+
+    names = args.zones or list(data.AREQUIPA_ZONES.keys())
+    unknown = [z for z in names if z not in data.AREQUIPA_ZONES]
+    if unknown:
+        parser.error(f'Zonas desconocidas: {unknown}. Disponibles: {list(data.AREQUIPA_ZONES)}')
+    zones = [data.AREQUIPA_ZONES[z] for z in names]
+
+    send = _api_sender(args.url.rstrip('/')) if args.target == 'api' else _db_sender()
+    summary = run(send, zones, args.rate, args.batch_size, args.concurrency, args.duration, args.report_every)
+    print(
+        f"\nResumen: {summary['sent']} eventos en {summary['elapsed_s']:.1f}s "
+        f"({summary['achieved_rate']:.1f} ev/s de {summary['target_rate']:.0f} objetivo), "
+        f"errores={summary['errors']}"
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""Prueba de carga de lectura para la API Flask.
+
+Lanza peticiones concurrentes contra `/health`, `/records` y `/records/<id>`
+y reporta throughput (req/s) y latencias (p50/p95/p99) por nivel de
+concurrencia. Con `--baseline-url` compara el despliegue actual
+(p. ej. `gunicorn -w 4` con workers sync) contra el nuevo modo concurrente.
+
+Ejemplo:
+    python loadtest.py --url http://localhost:5001 \\
+        --baseline-url http://localhost:5002 --concurrency 1 8 32 64
+
+@returns Imprime una tabla con los resultados por URL y concurrencia.
+"""
+import argparse
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import requests
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def _pick_record_id(base_url: str) -> Optional[str]:
+    try:
+        resp = requests.get(f'{base_url}/records', params={'limit': 1}, timeout=10)
+        records = resp.json().get('records', [])
+        return str(records[0]['id']) if records else None
+    except Exception:
+        return None
+
+
+def run_level(base_url: str, paths: List[str], concurrency: int, duration: float) -> Dict[str, Any]:
+    """Ejecuta `concurrency` clientes durante `duration` segundos."""
+    latencies: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def _client(worker_idx: int) -> None:
+        nonlocal errors
+        session = requests.Session()
+        local_lat: List[float] = []
+        local_err = 0
+        i = worker_idx
+        while time.perf_counter() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            t0 = time.perf_counter()
+            try:
+                resp = session.get(f'{base_url}{path}', timeout=60)
+                if resp.status_code >= 400:
+                    local_err += 1
+                else:
+                    local_lat.append(time.perf_counter() - t0)
+            except Exception:
+                local_err += 1
+        with lock:
+            latencies.extend(local_lat)
+            errors += local_err
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=_client, args=(n,), daemon=True) for n in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / elapsed if elapsed > 0 else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+
+def run(base_url: str, levels: List[int], duration: float, limit: int) -> List[Dict[str, Any]]:
+    base_url = base_url.rstrip('/')
+    paths = ['/health', f'/records?limit={limit}']
+    record_id = _pick_record_id(base_url)
+    if record_id:
+        paths.append(f'/records/{record_id}')
+    return [run_level(base_url, paths, c, duration) for c in levels]
+
+
+def _print_results(label: str, results: List[Dict[str, Any]]) -> None:
+    print(f'\n== {label}')
+    print(f"{'conc':>5} {'req':>7} {'err':>5} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for r in results:
+        print(
+            f"{r['concurrency']:>5} {r['requests']:>7} {r['errors']:>5} {r['rps']:>9.1f} "
+            f"{r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Prueba de carga de lectura para la API')
+    parser.add_argument('--url', default='http://localhost:5000', help='API a medir')
+    parser.add_argument('--baseline-url', default=None, help='Despliegue actual para comparar')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--duration', type=float, default=10.0, help='Segundos por nivel')
+    parser.add_argument('--limit', type=int, default=100, help='limit para GET /records')
+    args = parser.parse_args()
+
+    targets = [('nuevo', args.url)]
+    if args.baseline_url:
+        targets.insert(0, ('baseline', args.baseline_url))
+
+    all_results = {}
+    for label, url in targets:
+        all_results[label] = run(url, args.concurrency, args.duration, args.limit)
+        _print_results(f'{label} ({url})', all_results[label])
+
+    if args.baseline_url:
+        print('\n== Speedup (req/s nuevo / baseline)')
+        for base, new in zip(all_results['baseline'], all_results['nuevo']):
+            ratio = new['rps'] / base['rps'] if base['rps'] else float('inf')
+            print(f"{base['concurrency']:>5} x{ratio:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -8,10 +8,11 @@ y conexión a base de datos PostgreSQL.
 
 @returns Inicializa y ejecuta la aplicación principal de Streamlit.
 """
+import logging
 import os
+import time
 import streamlit as st
 import pandas as pd
-import requests
 from typing import Any, Tuple
 from dotenv import load_dotenv
 
@@ -22,39 +23,33 @@ API_URL = os.getenv("API_URL", "http://localhost:5000")
 
 try:
     import CHICAGO.data as data_module
-    from CHICAGO.viz import show_primary_type_bar, show_map_points_and_heat, show_additional_charts
+    import CHICAGO.export as export_module
+    import CHICAGO.querylog as querylog
+    import CHICAGO.tracing as tracing
+    import CHICAGO.profiling as profiling
+    import CHICAGO.session_store as session_store
+    from CHICAGO.validation import validate_records
+    from CHICAGO.viz import show_primary_type_bar, show_map_points_and_heat, show_additional_charts, cached_by_version
     from CHICAGO.auth import admin_login_ui, admin_logout
-    from CHICAGO.db_postgres import insert_crimes
+    from CHICAGO.db_postgres import insert_crimes, search_crimes, detect_anomalies, INGEST_REAL, INGEST_SYNTHETIC
 except Exception:
     import data as data_module
-    from viz import show_primary_type_bar, show_map_points_and_heat, show_additional_charts
+    import export as export_module
+    import querylog
+    import tracing
+    import profiling
+    import session_store
+    from validation import validate_records
+    from viz import show_primary_type_bar, show_map_points_and_heat, show_additional_charts, cached_by_version
     from auth import admin_login_ui, admin_logout
-    from db_postgres import insert_crimes
-import inspect
+    from db_postgres import insert_crimes, search_crimes, detect_anomalies, INGEST_REAL, INGEST_SYNTHETIC
 
 DEFAULT_LIMIT: int = 5000
 
-# Definición de zonas de Arequipa con sus coordenadas
-AREQUIPA_ZONES: dict[str, dict[str, Any]] = {
-    "Centro Histórico": {
-        "bounds": [
-            (-16.424240, -71.556179),
-            (-16.424528, -71.556496),
-            (-16.423735, -71.557225),
-            (-16.423735, -71.557225)
-        ],
-        "center": (-16.424060, -71.556775)
-    },
-    "Yanahuara": {
-        "bounds": [
-            (-16.390, -71.545),
-            (-16.395, -71.550),
-            (-16.400, -71.545),
-            (-16.395, -71.540)
-        ],
-        "center": (-16.395, -71.545)
-    }
-}
+logger = logging.getLogger(__name__)
+
+# Zonas de Arequipa (definidas en data.py para que las compartan otras herramientas)
+AREQUIPA_ZONES: dict[str, dict[str, Any]] = data_module.AREQUIPA_ZONES
 
 
 #Panel de control del administrador.
@@ -108,9 +103,11 @@ def admin_panel() -> Tuple[str, dict[str, Any]]:
                 synth = gen_fn(int(inject_count))
             
             # Insertar en base de datos (Postgres o SQLite según DB_MODE)
-            records = synth.to_dict(orient='records')
-            insert_crimes(records)
-            st.sidebar.success(f'{len(records)} registros generados e insertados en base de datos')
+            records, errors = validate_records(synth.to_dict(orient='records'))
+            stats = insert_crimes(records, mode=INGEST_SYNTHETIC)
+            st.sidebar.success(f"{len(synth)} registros generados: {stats['inserted']} insertados en base de datos")
+            if errors:
+                st.sidebar.warning(f"{len(errors)} registros inválidos omitidos (p. ej. {errors[0]['errors']})")
         except Exception as e:
             st.sidebar.error(f'Error al generar/insertar: {e}')
     
@@ -118,10 +115,16 @@ def admin_panel() -> Tuple[str, dict[str, Any]]:
     st.sidebar.markdown("### 🔄 Actualizar Base de Datos")
     if st.sidebar.button('Actualizar con últimos 5000 de Chicago (PostgreSQL)'):
         try:
-            df_chicago = data_module.fetch_latest(limit=5000)
-            records = df_chicago.to_dict(orient='records')
-            insert_crimes(records)
-            st.sidebar.success(f'Se insertaron/actualizaron {len(records)} registros en PostgreSQL')
+            # Sólo la fuente de Chicago: sintéticos, archivos y webhooks no son registros reales
+            df_chicago = data_module.fetch_chicago(limit=5000)
+            records, errors = validate_records(df_chicago.to_dict(orient='records'))
+            stats = insert_crimes(records, mode=INGEST_REAL)
+            st.sidebar.success(
+                f"{stats['inserted']} insertados, {stats['updated']} actualizados, "
+                f"{stats['unchanged']} sin cambios (de {len(df_chicago)} registros)"
+            )
+            if errors:
+                st.sidebar.warning(f"{len(errors)} registros inválidos omitidos (p. ej. {errors[0]['errors']})")
         except Exception as e:
             st.sidebar.error(f'Error al actualizar base: {e}')
     
@@ -132,7 +135,7 @@ def admin_panel() -> Tuple[str, dict[str, Any]]:
     col1, col2 = st.sidebar.columns(2)
     with col1:
         if st.button('Guardar', width='stretch'):
-            df = st.session_state.get('_chicago_last_df', pd.DataFrame())
+            df = data_module.get_last_frame()
             if not df.empty:
                 persist_fn = getattr(data_module, 'persist_dataframe_to_sqlite')
                 persist_fn(df)
@@ -142,7 +145,6 @@ def admin_panel() -> Tuple[str, dict[str, Any]]:
     
     with col2:
         if st.button('Limpiar', width='stretch'):
-            import os
             try:
                 os.remove('chicago.db')
                 st.sidebar.success(' DB eliminada')
@@ -155,16 +157,26 @@ def admin_panel() -> Tuple[str, dict[str, Any]]:
     st.sidebar.markdown("---")
     st.sidebar.markdown("### 📤 Exportar Datos")
     
-    df = st.session_state.get('_chicago_last_df', pd.DataFrame())
+    df = data_module.get_last_frame()
     if not df.empty:
-        csv = df.to_csv(index=False).encode('utf-8')
-        st.sidebar.download_button(
-            label="Descargar CSV",
-            data=csv,
-            file_name=f"crimenes_arequipa_{pd.Timestamp.now().strftime('%Y%m%d')}.csv",
-            mime="text/csv",
-            width='stretch'
-        )
+        fmt = st.sidebar.selectbox("Formato", options=export_module.available_formats(), key='export_format')
+        # Clave por versión de datos: mientras no cambien, la descarga reutiliza el archivo ya generado
+        export_key = f"session:{data_module.get_frame_version()}"
+        ready = os.path.exists(export_module.cache_path(export_key, fmt))
+        if st.sidebar.button('Preparar exportación', width='stretch') or ready:
+            try:
+                path = export_module.export_to_file(export_key, lambda: export_module.chunk_frame(df), fmt)
+                ext = export_module.EXPORT_FORMATS[fmt]['ext']
+                with open(path, 'rb') as f:
+                    st.sidebar.download_button(
+                        label=f"Descargar {fmt.upper()}",
+                        data=f,
+                        file_name=f"crimenes_arequipa_{pd.Timestamp.now().strftime('%Y%m%d')}.{ext}",
+                        mime=export_module.EXPORT_FORMATS[fmt]['mime'],
+                        width='stretch'
+                    )
+            except Exception as e:
+                st.sidebar.error(f'Error al exportar: {e}')
     
     return zone_name, zone_info
 
@@ -183,6 +195,313 @@ def public_view() -> None:
         st.rerun()
 
 
+#Secciones del panel, cada una ejecutada como fragmento de Streamlit.
+
+#Cada fragmento obtiene el DataFrame con `fetch_latest` (que lo reutiliza
+#mientras la versión de datos no cambie) y registra su tiempo de render.
+#Cada fragmento es además un span de la traza de la ejecución completa, o
+#la raíz de su propia traza cuando se re-ejecuta solo (ver tracing.py).
+
+def _log_render(section: str, started: float) -> None:
+    logger.info("fragmento %s renderizado en %.1f ms", section, (time.perf_counter() - started) * 1000)
+
+
+def _section_data(fetch_kwargs: dict[str, Any]) -> Tuple[pd.DataFrame, Any]:
+    df = data_module.fetch_latest(**fetch_kwargs)
+    return df, data_module.get_frame_version()
+
+
+def _compute_metrics(df: pd.DataFrame) -> dict[str, Any]:
+    latest = 'N/A'
+    if 'date' in df.columns and not df['date'].isna().all():
+        last = df['date'].max()
+        latest = last.strftime('%d/%m/%Y %H:%M') if pd.notna(last) else 'N/A'
+    return {
+        'total': len(df),
+        'latest': latest,
+        'arrests': int(df['arrest'].sum()) if 'arrest' in df.columns else 0,
+        'domestic': int(df['domestic'].sum()) if 'domestic' in df.columns else 0,
+    }
+
+
+@tracing.traced('render.metricas', root=True)
+@profiling.profiled('streamlit', 'render.metricas')
+def metrics_section(fetch_kwargs: dict[str, Any]) -> None:
+    started = time.perf_counter()
+    df, version = _section_data(fetch_kwargs)
+    metrics = cached_by_version('metrics', version, lambda: _compute_metrics(df))
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Total Registros", metrics['total'])
+    with col2:
+        st.metric("Último Reporte", metrics['latest'])
+    with col3:
+        st.metric("Arrestos", metrics['arrests'])
+    with col4:
+        st.metric("Domésticos", metrics['domestic'])
+    _log_render('metricas', started)
+
+
+@tracing.traced('render.mapa', root=True)
+@profiling.profiled('streamlit', 'render.mapa')
+def map_section(fetch_kwargs: dict[str, Any], zone_name: str) -> None:
+    started = time.perf_counter()
+    df, version = _section_data(fetch_kwargs)
+    st.subheader(f"Mapa de Incidentes - {zone_name}")
+    show_map_points_and_heat(df, heat_threshold=30, data_version=version)
+    _log_render('mapa', started)
+
+
+@tracing.traced('render.estadisticas', root=True)
+@profiling.profiled('streamlit', 'render.estadisticas')
+def stats_section(fetch_kwargs: dict[str, Any]) -> None:
+    started = time.perf_counter()
+    df, version = _section_data(fetch_kwargs)
+    col1, col2 = st.columns(2)
+    with col1:
+        show_primary_type_bar(df, data_version=version)
+    with col2:
+        show_additional_charts(df, data_version=version)
+    _log_render('estadisticas', started)
+
+
+@tracing.traced('render.alertas', root=True)
+@profiling.profiled('streamlit', 'render.alertas')
+def anomaly_section() -> None:
+    started = time.perf_counter()
+    st.subheader("Zonas con actividad inusual")
+    st.caption(
+        "Celdas (~1 km) y tipos de crimen cuya tasa reciente supera de forma significativa "
+        "su línea base, calculadas de forma incremental al ingresar registros a la base de datos."
+    )
+    try:
+        result = detect_anomalies(limit=100)
+    except Exception as e:
+        st.error(f"Error al consultar anomalías: {e}")
+        return
+    anomalies = result['anomalies']
+    if not anomalies:
+        st.info("Sin anomalías detectadas" + (f" (al {result['as_of']})" if result['as_of'] else ""))
+        _log_render('alertas', started)
+        return
+    adf = pd.DataFrame(anomalies)
+    st.caption(f"{len(adf)} celdas anómalas al {result['as_of']}")
+    st.map(adf[['latitude', 'longitude']])
+    st.dataframe(
+        adf[['primary_type', 'latitude', 'longitude', 'recent_count', 'current_rate_per_h',
+             'baseline_rate_per_h', 'ratio', 'z', 'total']],
+        width='stretch',
+        hide_index=True,
+    )
+    _log_render('alertas', started)
+
+
+TABLE_PAGE_SIZES: list[int] = [50, 100, 250, 500]
+SEARCH_PAGE_SIZE: int = 50
+
+
+@tracing.traced('render.busqueda', root=True)
+@profiling.profiled('streamlit', 'render.busqueda')
+def search_section() -> None:
+    started = time.perf_counter()
+    query = st.text_input(
+        "🔎 Buscar en la base de datos",
+        placeholder="descripción, cuadra, ubicación o tipo (p. ej. robo mercado)",
+    )
+    if not query.strip():
+        return
+    page = st.number_input("Página de resultados", min_value=1, value=1, step=1, key='search_page')
+    try:
+        result = search_crimes(query, limit=SEARCH_PAGE_SIZE, offset=(int(page) - 1) * SEARCH_PAGE_SIZE)
+    except Exception as e:
+        st.error(f"Error en la búsqueda: {e}")
+        return
+    st.caption(f"{result['total']} coincidencias (ordenadas por relevancia)")
+    if result['records']:
+        st.dataframe(pd.DataFrame(result['records']), width='stretch', hide_index=True)
+    _log_render('busqueda', started)
+
+
+def _slow_queries_section() -> None:
+    """Consultas SQL lentas de este proceso (ver querylog.py) con su plan de ejecución."""
+    query_stats = querylog.stats()
+    st.write(
+        f"**Consultas lentas** (≥ {query_stats['threshold_ms']:g} ms): "
+        f"{query_stats['slow']} de {query_stats['statements']} sentencias"
+    )
+    entries = querylog.recent()
+    if not entries:
+        st.caption("Sin consultas lentas registradas.")
+        return
+    st.dataframe(
+        pd.DataFrame(entries)[['at', 'ms', 'backend', 'sql', 'params']].astype({'params': str}),
+        width='stretch',
+    )
+    with_plan = [e for e in entries if e.get('plan') or e.get('plan_error')]
+    if with_plan:
+        choice = st.selectbox(
+            "Plan de ejecución",
+            range(len(with_plan)),
+            format_func=lambda i: f"{with_plan[i]['at'][11:19]} · {with_plan[i]['ms']} ms · {with_plan[i]['sql'][:80]}",
+            key='slow_query_plan',
+        )
+        entry = with_plan[choice]
+        if entry.get('plan_mode') == 'plan':
+            st.caption("Escritura: plan estimado (EXPLAIN sin ANALYZE, no se volvió a ejecutar).")
+        st.code(entry.get('plan') or entry.get('plan_error'), language='text')
+
+
+def _traces_section() -> None:
+    """Trazas recientes de este proceso: etapas que dominan el p99 y vista de llama de una traza."""
+    traces = tracing.recent(50)
+    st.write(f"**Trazas** ({len(traces)} recientes)")
+    if not traces:
+        st.caption("Sin trazas registradas.")
+        return
+    stages = tracing.stage_summary(min_percentile=99)
+    if stages:
+        st.caption("Tiempo propio por etapa en las trazas más lentas (p99):")
+        st.dataframe(pd.DataFrame(stages), width='stretch', hide_index=True)
+    choice = st.selectbox(
+        "Traza",
+        range(len(traces)),
+        format_func=lambda i: f"{traces[i]['started_at'][11:19]} · {traces[i]['duration_ms']:.0f} ms · {traces[i]['name']}",
+        key='trace_flame',
+    )
+    finished = tracing.get(traces[choice]['trace_id'])
+    if finished is not None:
+        st.code(tracing.flame(finished), language='text')
+
+
+def _memory_section() -> None:
+    """Uso de memoria de los DataFrames de todas las sesiones (ver session_store.py)."""
+    usage = session_store.stats()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("En memoria", f"{usage['memory_mb']:.1f} MB", help=f"Presupuesto: {usage['store_budget_mb']:g} MB")
+    col2.metric("Compartido", f"{usage['shared_mb']:.1f} MB", help=f"{usage['shared_frames']} DataFrames compartidos")
+    col3.metric("En disco", f"{usage['spilled_mb']:.1f} MB", help=f"{usage['spills']} bajadas, {usage['loads']} recargas")
+    col4.metric("Proceso (RSS)", f"{usage['process_rss_mb']} MB" if usage['process_rss_mb'] is not None else "N/A")
+    st.caption(f"Presupuesto por sesión: {usage['session_budget_mb']:g} MB · sesiones cerradas eliminadas: {usage['reaped_sessions']}")
+    if usage['sessions']:
+        st.dataframe(pd.DataFrame(usage['sessions']), width='stretch', hide_index=True)
+
+
+def _profiling_section() -> None:
+    """Activa el modo de perfilado y muestra los perfiles guardados (ver profiling.py)."""
+    st.toggle(
+        "Perfilar cada ejecución y petición a la API",
+        value=profiling.enabled(),
+        disabled=profiling.PROFILING_ENABLED,
+        help="Activado por PROFILING_ENABLED" if profiling.PROFILING_ENABLED else None,
+        key='profiling_toggle',
+        on_change=lambda: profiling.set_enabled(st.session_state['profiling_toggle']),
+    )
+    profiles = profiling.list_profiles()
+    if not profiles:
+        st.caption(f"Sin perfiles guardados en {profiling.PROFILE_DIR}/.")
+        return
+    st.dataframe(
+        pd.DataFrame(profiles)[['at', 'kind', 'name', 'duration_ms', 'total_calls']],
+        width='stretch',
+        hide_index=True,
+    )
+    choice = st.selectbox(
+        "Perfil",
+        range(len(profiles)),
+        format_func=lambda i: f"{profiles[i]['at'][11:19]} · {profiles[i]['duration_ms']:.0f} ms · {profiles[i]['name']}",
+        key='profile_choice',
+    )
+    summary = profiling.get_profile(profiles[choice]['id'])
+    if summary is None:
+        st.caption("El perfil ya fue rotado.")
+        return
+    order = st.radio("Ordenar por", ['cumulative', 'tottime'], horizontal=True, key='profile_order',
+                     format_func=lambda o: 'Tiempo acumulado' if o == 'cumulative' else 'Tiempo propio')
+    st.dataframe(pd.DataFrame(summary[order]), width='stretch', hide_index=True)
+    path = profiling.profile_path(summary['id'])
+    if path is not None:
+        with open(path, 'rb') as f:
+            st.download_button("Descargar .prof", f.read(), file_name=f"{summary['id']}.prof",
+                               mime='application/octet-stream', key='profile_download')
+
+
+@tracing.traced('render.datos', root=True)
+@profiling.profiled('streamlit', 'render.datos')
+def data_section(fetch_kwargs: dict[str, Any], is_admin: bool) -> None:
+    started = time.perf_counter()
+    df, version = _section_data(fetch_kwargs)
+    index = cached_by_version('filter_index', version, lambda: data_module.build_filter_index(df))
+    st.subheader("Tabla de Datos")
+
+    # Filtros interactivos (resueltos con los bitmaps del índice)
+    filters: dict[str, list[Any]] = {}
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        filters['primary_type'] = st.multiselect(
+            "Filtrar por tipo",
+            options=data_module.filter_index_values(index, 'primary_type'),
+            default=None
+        )
+        if st.checkbox("Solo con arresto", value=False):
+            filters['arrest'] = [True]
+    with col2:
+        filters['zone'] = st.multiselect(
+            "Zona",
+            options=data_module.filter_index_values(index, 'zone'),
+            default=None
+        )
+        if st.checkbox("Solo domésticos", value=False):
+            filters['domestic'] = [True]
+    with col3:
+        filters['district'] = st.multiselect(
+            "Distrito",
+            options=data_module.filter_index_values(index, 'district'),
+            default=None
+        )
+
+    rows = data_module.filter_index_rows(index, filters)
+    total = len(rows)
+
+    # Paginación: sólo la página visible se envía al navegador
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        page_size = st.selectbox("Filas por página", TABLE_PAGE_SIZES, index=1)
+    pages = max(1, -(-total // page_size))
+    with col2:
+        page = st.number_input("Página", min_value=1, max_value=pages, value=1, step=1)
+    start = (int(page) - 1) * page_size
+    page_df = df.iloc[rows[start:start + page_size]]
+    st.caption(f"Mostrando {start + 1 if total else 0}-{start + len(page_df)} de {total} registros")
+
+    per_row_px = 35
+    max_height = 1200
+    min_height = 200
+    desired_height = min(max_height, max(min_height, per_row_px * len(page_df) + 40))
+
+    st.dataframe(
+        page_df,
+        width='stretch',
+        height=int(desired_height)
+    )
+
+    # Información técnica solo visible para admin
+    if is_admin:
+        with st.expander("ℹ️ Información Técnica"):
+            st.write("**Columnas disponibles:**", list(df.columns))
+            st.write("**Registros nulos por columna:**")
+            st.write(cached_by_version('null_counts', version, lambda: df.isnull().sum()))
+            st.write("**Fuentes de datos:**")
+            st.dataframe(pd.DataFrame(data_module.sources.status()), width='stretch')
+            _slow_queries_section()
+            _traces_section()
+        with st.expander("🔬 Perfilado"):
+            _profiling_section()
+        with st.expander("🧠 Memoria de sesiones"):
+            _memory_section()
+    _log_render('datos', started)
+
+
 #Función principal de la aplicación Streamlit.
 
 #Controla la configuración general, autenticación, visualización de métricas,
@@ -190,6 +509,8 @@ def public_view() -> None:
 
 #@returns None. Renderiza toda la interfaz principal.
 
+@tracing.traced('streamlit.rerun', root=True)
+@profiling.profiled('streamlit', 'main.app')
 def app() -> None:
     st.set_page_config(
         page_title='Sistema de Alertas - Arequipa',
@@ -229,92 +550,37 @@ def app() -> None:
             auto_refresh = True
             force_refresh = False
     
-    # Obtener datos actualizados
-    fetch_fn = getattr(data_module, 'fetch_latest')
-    df = fetch_fn(
-        limit=int(limit),
-        force=force_refresh,
-        refresh_interval=60 if auto_refresh else 999999
-    )
-    
-    # Mostrar métricas principales
-    col1, col2, col3, col4 = st.columns(4)
-    
-    with col1:
-        st.metric("Total Registros", len(df))
-    
-    with col2:
-        if 'date' in df.columns and not df['date'].isna().all():
-            latest = df['date'].max()
-            st.metric("Último Reporte", latest.strftime('%d/%m/%Y %H:%M') if pd.notna(latest) else 'N/A')
-        else:
-            st.metric("Último Reporte", "N/A")
-    
-    with col3:
-        arrests = df['arrest'].sum() if 'arrest' in df.columns else 0
-        st.metric("Arrestos", int(arrests))
-    
-    with col4:
-        domestic = df['domestic'].sum() if 'domestic' in df.columns else 0
-        st.metric("Domésticos", int(domestic))
-    
+    # Cada sección es un fragmento: al interactuar con ella (o cuando vence
+    # su auto-refresh) sólo se re-ejecuta esa sección, no toda la página.
+    fetch_kwargs = {
+        'limit': int(limit),
+        'refresh_interval': 60 if auto_refresh else 999999,
+    }
+    run_every = 60 if auto_refresh else None
+
+    # "Refrescar Ahora" fuerza la descarga una vez, antes de los fragmentos
+    if force_refresh:
+        data_module.fetch_latest(force=True, **fetch_kwargs)
+
+    st.fragment(metrics_section, run_every=run_every)(fetch_kwargs)
+
     # Secciones con pestañas (mapa, estadísticas, datos)
-    tab1, tab2, tab3 = st.tabs(["Mapa", "Estadísticas", "Datos"])
-    
+    tab1, tab2, tab3, tab4 = st.tabs(["Mapa", "Estadísticas", "Datos", "Alertas"])
+
     with tab1:
-        st.subheader(f"Mapa de Incidentes - {zone_name}")
-        show_map_points_and_heat(df, heat_threshold=30)
-    
+        st.fragment(map_section, run_every=run_every)(fetch_kwargs, zone_name)
+
     with tab2:
-        col1, col2 = st.columns(2)
-        with col1:
-            show_primary_type_bar(df)
-        with col2:
-            show_additional_charts(df)
-    
+        st.fragment(stats_section, run_every=run_every)(fetch_kwargs)
+
     with tab3:
-        st.subheader("Tabla de Datos")
-        
-        # Filtros interactivos
-        col1, col2 = st.columns(2)
-        with col1:
-            if 'primary_type' in df.columns:
-                types = st.multiselect(
-                    "Filtrar por tipo",
-                    options=df['primary_type'].dropna().unique(),
-                    default=None
-                )
-                if types:
-                    df = df[df['primary_type'].isin(types)]
-        
-        with col2:
-            if 'arrest' in df.columns:
-                show_arrests = st.checkbox("Solo con arresto", value=False)
-                if show_arrests:
-                    df = df[df['arrest'] == True]
-        
-        # Ajustar la altura de la tabla para mostrar más filas generadas
-        try:
-            rows_count = len(df)
-        except Exception:
-            rows_count = 0
-        per_row_px = 32
-        max_height = 1200
-        min_height = 400
-        desired_height = min(max_height, max(min_height, per_row_px * rows_count + 140))
-
-        st.dataframe(
-            df,
-            width='stretch',
-            height=int(desired_height)
-        )
-        
-        # Información técnica solo visible para admin
-        if is_admin:
-            with st.expander("ℹ️ Información Técnica"):
-                st.write("**Columnas disponibles:**", list(df.columns))
-                st.write("**Registros nulos por columna:**")
-                st.write(df.isnull().sum())
+        st.fragment(search_section)()
+
+        # Sin auto-refresh: la tabla sólo se vuelve a dibujar al usar sus filtros
+        st.fragment(data_section)(fetch_kwargs, is_admin)
+
+    with tab4:
+        st.fragment(anomaly_section, run_every=run_every)()
 
 
 if __name__ == '__main__':
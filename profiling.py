@@ -0,0 +1,231 @@
+"""Modo de perfilado para el dashboard y la API.
+
+Cuando está activo, cada ejecución del script de Streamlit (o de un
+fragmento que se re-ejecuta solo) y cada petición a la API corren dentro de
+`cProfile`. Cada perfil se guarda en `PROFILE_DIR` como:
+
+- `<id>.prof`: estadísticas completas en formato `pstats`, para analizarlas
+  fuera (`python -m pstats`, snakeviz...).
+- `<id>.json`: metadatos y las `PROFILE_TOP_N` funciones con más tiempo
+  acumulado y con más tiempo propio.
+
+Sólo se conservan los `PROFILE_KEEP` perfiles más recientes (los viejos se
+borran al guardar uno nuevo) y, con `PROFILE_MIN_MS`, sólo los de
+ejecuciones que tardaron al menos eso.
+
+Se activa con `PROFILING_ENABLED=1` o desde el panel de administración /
+`POST /admin/profiling`, que crean o borran el archivo `PROFILE_DIR/.enabled`
+(compartido por todos los procesos que usan la misma carpeta). Desactivado
+cuesta una comparación por ejecución: el archivo se consulta como mucho una
+vez cada `_FLAG_CHECK_S` segundos.
+
+`cProfile` sólo mide el hilo donde se activa: el tiempo de los hilos de
+`sources.collect` aparece como espera. Los perfiles anidados (un fragmento
+dentro de la ejecución completa) se ignoran, el exterior ya los cubre.
+"""
+import cProfile
+import json
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import wraps
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILING_ENABLED: bool = os.getenv('PROFILING_ENABLED', '0').lower() in ('1', 'true', 'yes')
+PROFILE_DIR: str = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_KEEP: int = int(os.getenv('PROFILE_KEEP', '50'))
+PROFILE_TOP_N: int = int(os.getenv('PROFILE_TOP_N', '25'))
+PROFILE_MIN_MS: float = float(os.getenv('PROFILE_MIN_MS', '0'))
+
+_FLAG_FILE = '.enabled'
+_FLAG_CHECK_S = 2.0
+_VALID_ID = re.compile(r'^[0-9]+-[a-z]+-[A-Za-z0-9_.-]+$')
+
+_flag = {'value': False, 'checked_at': float('-inf')}
+_local = threading.local()
+_write_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    """True si hay que perfilar (variable de entorno o archivo de activación)."""
+    if PROFILING_ENABLED:
+        return True
+    now = time.monotonic()
+    if now - _flag['checked_at'] >= _FLAG_CHECK_S:
+        _flag['value'] = os.path.exists(os.path.join(PROFILE_DIR, _FLAG_FILE))
+        _flag['checked_at'] = now
+    return _flag['value']
+
+
+def set_enabled(value: bool) -> bool:
+    """Activa o desactiva el perfilado en todos los procesos que comparten `PROFILE_DIR`."""
+    path = os.path.join(PROFILE_DIR, _FLAG_FILE)
+    if value:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(datetime.now(timezone.utc).isoformat())
+    elif os.path.exists(path):
+        os.remove(path)
+    _flag['checked_at'] = float('-inf')
+    return enabled()
+
+
+def start() -> Optional[tuple]:
+    """Empieza a perfilar este hilo. @returns Token para `stop`, o None si no corresponde."""
+    if not enabled() or getattr(_local, 'active', False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Otro perfilador ya está activo en el proceso (Python 3.12+ admite uno solo)
+        return None
+    _local.active = True
+    return profiler, time.perf_counter()
+
+
+def stop(token: Optional[tuple], kind: str, name: str, **meta: Any) -> Optional[str]:
+    """Termina el perfil de `start` y lo guarda. @returns Id del perfil guardado."""
+    if token is None:
+        return None
+    profiler, started = token
+    profiler.disable()
+    _local.active = False
+    duration_ms = (time.perf_counter() - started) * 1000
+    if duration_ms < PROFILE_MIN_MS:
+        return None
+    try:
+        return _save(profiler, kind, name, duration_ms, meta)
+    except Exception as e:
+        logger.warning('No se pudo guardar el perfil de %s: %s', name, e)
+        return None
+
+
+@contextmanager
+def profile(kind: str, name: str, **meta: Any) -> Iterator[None]:
+    token = start()
+    try:
+        yield
+    finally:
+        stop(token, kind, name, **meta)
+
+
+def profiled(kind: str, name: str) -> Callable[[Callable], Callable]:
+    """Decorador: perfila cada llamada a la función cuando el modo está activo."""
+    def decorator(fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with profile(kind, name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _function_label(func: tuple) -> str:
+    filename, line, funcname = func
+    if filename == '~':
+        return funcname  # Funciones en C, p. ej. <built-in method time.sleep>
+    parts = filename.replace('\\', '/').split('/')
+    return f"{'/'.join(parts[-2:])}:{line}({funcname})"
+
+
+def hotspots(stats: pstats.Stats, top_n: int = PROFILE_TOP_N) -> Dict[str, List[Dict[str, Any]]]:
+    """Las `top_n` funciones con más tiempo acumulado y con más tiempo propio."""
+    rows = [
+        {
+            'function': _function_label(func),
+            'calls': nc,
+            'primitive_calls': cc,
+            'tottime_ms': round(tt * 1000, 3),
+            'cumtime_ms': round(ct * 1000, 3),
+        }
+        for func, (cc, nc, tt, ct, _) in stats.stats.items()
+    ]
+    return {
+        'cumulative': sorted(rows, key=lambda r: r['cumtime_ms'], reverse=True)[:top_n],
+        'tottime': sorted(rows, key=lambda r: r['tottime_ms'], reverse=True)[:top_n],
+    }
+
+
+def _slug(name: str) -> str:
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', name).strip('_')[:60] or 'run'
+
+
+def _save(profiler: cProfile.Profile, kind: str, name: str, duration_ms: float, meta: Dict[str, Any]) -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profile_id = f'{time.time_ns()}-{kind}-{_slug(name)}'
+    stats = pstats.Stats(profiler)
+    summary = {
+        'id': profile_id,
+        'kind': kind,
+        'name': name,
+        'at': datetime.now(timezone.utc).isoformat(),
+        'pid': os.getpid(),
+        'duration_ms': round(duration_ms, 2),
+        'total_calls': stats.total_calls,
+        **meta,
+        **hotspots(stats),
+    }
+    base = os.path.join(PROFILE_DIR, profile_id)
+    stats.dump_stats(base + '.prof.tmp')
+    os.replace(base + '.prof.tmp', base + '.prof')
+    with open(base + '.json.tmp', 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False)
+    os.replace(base + '.json.tmp', base + '.json')
+    _prune()
+    return profile_id
+
+
+def _ids() -> List[str]:
+    """Ids de los perfiles guardados, del más reciente al más antiguo."""
+    try:
+        names = os.listdir(PROFILE_DIR)
+    except FileNotFoundError:
+        return []
+    ids = [n[:-len('.json')] for n in names if n.endswith('.json') and _VALID_ID.match(n[:-len('.json')])]
+    return sorted(ids, key=lambda i: int(i.split('-', 1)[0]), reverse=True)
+
+
+def _prune() -> None:
+    with _write_lock:
+        for profile_id in _ids()[max(1, PROFILE_KEEP):]:
+            for ext in ('.json', '.prof'):
+                try:
+                    os.remove(os.path.join(PROFILE_DIR, profile_id + ext))
+                except FileNotFoundError:
+                    pass
+
+
+def list_profiles(limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Metadatos de los perfiles guardados (sin los hotspots), del más reciente al más antiguo."""
+    out = []
+    for profile_id in _ids()[:limit]:
+        summary = get_profile(profile_id)
+        if summary is not None:
+            out.append({k: v for k, v in summary.items() if k not in ('cumulative', 'tottime')})
+    return out
+
+
+def get_profile(profile_id: str) -> Optional[Dict[str, Any]]:
+    if not _VALID_ID.match(profile_id):
+        return None
+    try:
+        with open(os.path.join(PROFILE_DIR, profile_id + '.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None  # Borrado por la rotación mientras se leía
+
+
+def profile_path(profile_id: str) -> Optional[str]:
+    """Ruta del `.prof` para descargarlo, o None si no existe."""
+    if not _VALID_ID.match(profile_id):
+        return None
+    path = os.path.join(PROFILE_DIR, profile_id + '.prof')
+    return path if os.path.exists(path) else None
@@ -0,0 +1,188 @@
+"""Registro de consultas SQL lentas con su plan de ejecución.
+
+`db_postgres.py` ejecuta todas las sentencias con cursores que miden el
+tiempo de cada `execute`/`executemany` y llaman a `observe`. Las que tardan
+al menos `SLOW_QUERY_MS` milisegundos se registran en el log y se guardan
+en un buffer circular de `SLOW_QUERY_LOG_SIZE` entradas, con:
+
+- La sentencia normalizada (espacios colapsados, literales `'...'` y
+  listas de `?` resumidas) y los parámetros sustituidos por su tipo: nunca
+  se guardan valores.
+- Su plan, como mucho una vez cada `SLOW_QUERY_EXPLAIN_TTL_S` segundos por
+  forma de consulta. Los SELECT con `EXPLAIN (ANALYZE, BUFFERS)` en
+  Postgres (vuelve a ejecutarlos); las escrituras (INSERT, UPDATE, DELETE,
+  REPLACE, WITH) con `EXPLAIN` simple, que no las ejecuta. En SQLite
+  siempre `EXPLAIN QUERY PLAN`. Las de `executemany` se explican con la
+  primera fila de parámetros.
+
+El buffer es por proceso (cada worker de gunicorn tiene el suyo). Se ve en
+`GET /admin/slow-queries` (con `ADMIN_API_TOKEN`) y en "Información
+Técnica" del dashboard.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS: float = float(os.getenv('SLOW_QUERY_MS', '250'))
+SLOW_QUERY_LOG_SIZE: int = int(os.getenv('SLOW_QUERY_LOG_SIZE', '200'))
+SLOW_QUERY_EXPLAIN: bool = os.getenv('SLOW_QUERY_EXPLAIN', '1').lower() in ('1', 'true', 'yes')
+SLOW_QUERY_EXPLAIN_TTL_S: float = float(os.getenv('SLOW_QUERY_EXPLAIN_TTL_S', '60'))
+
+_MAX_SQL_CHARS = 2000
+_MAX_LISTED_PARAMS = 20
+
+_entries: Deque[Dict[str, Any]] = deque(maxlen=max(1, SLOW_QUERY_LOG_SIZE))
+_explained: Dict[str, float] = {}
+_lock = threading.Lock()
+_counters = {'statements': 0, 'total_ms': 0.0, 'slow': 0, 'explained': 0, 'explain_errors': 0}
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_PLACEHOLDER_RUN = re.compile(r'\?(?:\s*,\s*\?)+')
+_TUPLE_RUN = re.compile(r'\(\?(?:\s*,\s*\?)*\)(?:\s*,\s*\(\?(?:\s*,\s*\?)*\))+')
+
+
+def _count(name: str) -> None:
+    with _lock:
+        _counters[name] += 1
+
+
+def normalize_sql(sql: Any) -> str:
+    """Sentencia en una línea, sin literales de texto y con las listas de parámetros resumidas."""
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf-8', errors='replace')
+    text = ' '.join(str(sql).split())
+    text = _STRING_LITERAL.sub("'?'", text)
+    text = _TUPLE_RUN.sub('(?, ...), ...', text)
+    text = _PLACEHOLDER_RUN.sub('?, ...', text)
+    return text[:_MAX_SQL_CHARS]
+
+
+def _placeholder(value: Any) -> Any:
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple, set)):
+        return f'<{type(value).__name__}[{len(value)}]>'
+    return f'<{type(value).__name__}>'
+
+
+def redact_params(params: Any) -> Any:
+    """Reemplaza cada parámetro por su tipo (`<str>`, `<list[500]>`...)."""
+    if params is None:
+        return None
+    if isinstance(params, str):
+        return params  # Resumen ya redactado (p. ej. '<1000 rows>' de executemany)
+    if isinstance(params, dict):
+        return {k: _placeholder(v) for k, v in params.items()}
+    if isinstance(params, (list, tuple)):
+        if len(params) > _MAX_LISTED_PARAMS:
+            return f'<{len(params)} params>'
+        return [_placeholder(v) for v in params]
+    return _placeholder(params)
+
+
+_PLAN_ONLY_VERBS = frozenset({'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'WITH'})
+
+
+def explain_mode(sql: Any) -> Optional[str]:
+    """Cómo explicar la sentencia.
+
+    @returns `'analyze'` para SELECT (se puede volver a ejecutar), `'plan'`
+        para escrituras (EXPLAIN sin ANALYZE: ejecutarlas de nuevo duplicaría
+        el efecto) y None para DDL, PRAGMA, transacciones, etc.
+    """
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf-8', errors='replace')
+    words = str(sql).split(None, 1)
+    verb = words[0].upper() if words else ''
+    if verb == 'SELECT':
+        return 'analyze'
+    if verb in _PLAN_ONLY_VERBS:
+        return 'plan'
+    return None
+
+
+def _explain_due(shape: str) -> bool:
+    now = time.monotonic()
+    with _lock:
+        last = _explained.get(shape)
+        if last is not None and now - last < SLOW_QUERY_EXPLAIN_TTL_S:
+            return False
+        _explained[shape] = now
+        if len(_explained) > 4 * SLOW_QUERY_LOG_SIZE:
+            for key in [k for k, t in _explained.items() if now - t >= SLOW_QUERY_EXPLAIN_TTL_S]:
+                del _explained[key]
+    return True
+
+
+def observe(
+    sql: Any,
+    params: Any,
+    elapsed_ms: float,
+    explain: Optional[Callable[[bool], str]] = None,
+    backend: str = '',
+) -> None:
+    """Cuenta una sentencia ejecutada y, si fue lenta, la registra con su plan.
+
+    @param explain Recibe True si se puede usar ANALYZE (ver `explain_mode`)
+        y devuelve el plan como texto.
+    """
+    with _lock:
+        _counters['statements'] += 1
+        _counters['total_ms'] += elapsed_ms
+    if SLOW_QUERY_MS < 0 or elapsed_ms < SLOW_QUERY_MS:
+        return
+
+    shape = normalize_sql(sql)
+    entry: Dict[str, Any] = {
+        'at': datetime.now(timezone.utc).isoformat(),
+        'ms': round(elapsed_ms, 2),
+        'backend': backend,
+        'sql': shape,
+        'params': redact_params(params),
+        'thread': threading.current_thread().name,
+        'plan': None,
+        'plan_mode': None,
+    }
+    mode = explain_mode(sql)
+    if SLOW_QUERY_EXPLAIN and explain is not None and mode is not None and _explain_due(shape):
+        entry['plan_mode'] = mode
+        try:
+            entry['plan'] = explain(mode == 'analyze')
+            _count('explained')
+        except Exception as e:
+            entry['plan_error'] = str(e)
+            _count('explain_errors')
+    logger.warning('Consulta lenta (%.1f ms): %s params=%s', elapsed_ms, shape, entry['params'])
+    with _lock:
+        _counters['slow'] += 1
+        _entries.append(entry)
+
+
+def recent(limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Consultas lentas registradas en este proceso, de la más reciente a la más antigua."""
+    with _lock:
+        entries = list(_entries)
+    entries.reverse()
+    return entries[:limit] if limit else entries
+
+
+def clear() -> None:
+    with _lock:
+        _entries.clear()
+        _explained.clear()
+
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        stats = dict(_counters)
+        stats['buffered'] = len(_entries)
+    stats['total_ms'] = round(stats['total_ms'], 2)
+    stats['threshold_ms'] = SLOW_QUERY_MS
+    return stats
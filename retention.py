@@ -0,0 +1,295 @@
+"""Retención, archivo y compactación de la tabla `crimes`.
+
+La tabla sólo crecía (lotes sintéticos, sincronizaciones repetidas de
+Chicago) y `chicago.db` duplicaba todo en cada "Guardar". `run_retention`:
+
+1. Por fuente (`ingest_mode`) mantiene en la base sólo la ventana caliente
+   (`RETENTION_DAYS_REAL`, `RETENTION_DAYS_SYNTHETIC`; 0, el valor por
+   defecto, = sin límite: no se archiva ni se borra nada). Las
+   filas más antiguas se escriben en archivos JSONL comprimidos con gzip,
+   particionados por fuente y mes de `date`
+   (`ARCHIVE_DIR/<fuente>/<AAAA>/<MM>/part-*.jsonl.gz`), y después se borran
+   con `delete_crimes_by_ids` (quedan en el registro de cambios como bajas).
+   El archivo se escribe antes de borrar: un corte a mitad de camino deja,
+   como mucho, una fila en ambos lados.
+2. Elimina duplicados por `id` en `chicago.db` (se conserva la última fila
+   guardada) y lo compacta.
+3. Ejecuta VACUUM/ANALYZE en la base (`db_postgres.compact`).
+
+Antes de borrar filas `ARCHIVE_DIR` tiene que estar configurado y apuntar a
+una carpeta que ya existe (un volumen persistente, no el disco efímero del
+contenedor); si no, `run_retention` falla sin tocar la base.
+
+El informe (filas archivadas, duplicados y bytes recuperados) se guarda en
+`ARCHIVE_DIR/retention_report.json`. `query_archive` consulta el archivo
+leyendo sólo las particiones del rango pedido.
+
+Nunca corre sola: se ejecuta a mano o desde cron con
+`python retention.py [--dry-run]`, o con `POST /admin/retention`. Dos
+ejecuciones no se solapan (`flock`).
+"""
+import argparse
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+import db_postgres as db
+
+logger = logging.getLogger(__name__)
+
+# Carpeta del archivo frío (volumen persistente); vacío = sin archivo configurado
+ARCHIVE_DIR: str = os.getenv('ARCHIVE_DIR', '')
+RETENTION_DAYS: Dict[str, float] = {
+    db.INGEST_REAL: float(os.getenv('RETENTION_DAYS_REAL', '0')),
+    db.INGEST_SYNTHETIC: float(os.getenv('RETENTION_DAYS_SYNTHETIC', '0')),
+}
+RETENTION_BATCH: int = int(os.getenv('RETENTION_BATCH', '5000'))
+CHICAGO_DB_PATH: str = os.getenv('CHICAGO_DB_PATH', 'chicago.db')
+
+_REPORT_FILE = 'retention_report.json'
+_LOCK_FILE = '.retention.lock'
+
+
+class RetentionBusy(RuntimeError):
+    """Otra ejecución de la retención tiene el lock."""
+
+
+def check_archive_dir() -> None:
+    """Falla si `ARCHIVE_DIR` no está configurado o no es una carpeta existente y escribible.
+
+    No se crea aquí a propósito: si el volumen no está montado, crear la
+    carpeta dejaría el archivo en el disco efímero del contenedor.
+    """
+    if not ARCHIVE_DIR:
+        raise RuntimeError('ARCHIVE_DIR no está configurado: no se borran filas sin un archivo persistente')
+    if not os.path.isdir(ARCHIVE_DIR):
+        raise RuntimeError(f'ARCHIVE_DIR ({ARCHIVE_DIR}) no existe; debe ser un volumen persistente ya montado')
+    if not os.access(ARCHIVE_DIR, os.W_OK):
+        raise RuntimeError(f'ARCHIVE_DIR ({ARCHIVE_DIR}) no es escribible')
+
+
+def _json_default(value: Any) -> Any:
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+
+def _iso(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+
+def _partition(mode: str, date: Any) -> str:
+    iso = _iso(date) or ''
+    if len(iso) >= 7 and iso[4] == '-':
+        return os.path.join(mode, iso[:4], iso[5:7])
+    return os.path.join(mode, 'sin_fecha')
+
+
+def _write_archive(mode: str, rows: List[Dict[str, Any]]) -> List[str]:
+    """Escribe las filas en su partición mensual; cada archivo aparece completo (rename atómico)."""
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for row in rows:
+        groups.setdefault(_partition(mode, row.get('date')), []).append(row)
+    written = []
+    for part, part_rows in groups.items():
+        directory = os.path.join(ARCHIVE_DIR, part)
+        os.makedirs(directory, exist_ok=True)
+        name = f'part-{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.jsonl.gz'
+        tmp = os.path.join(directory, f'.{name}.tmp')
+        with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+            for row in part_rows:
+                f.write(json.dumps(row, ensure_ascii=False, default=_json_default))
+                f.write('\n')
+        os.replace(tmp, os.path.join(directory, name))
+        written.append(os.path.join(part, name))
+    return written
+
+
+def archive_cold_rows(mode: str, days: float, now: Optional[datetime] = None, dry_run: bool = False) -> Dict[str, Any]:
+    """Archiva y borra las filas de `mode` con `date` anterior a `now - days`."""
+    now = now or datetime.utcnow()
+    cutoff = (now - timedelta(days=days)).isoformat()
+    result: Dict[str, Any] = {'cutoff': cutoff, 'archived': 0, 'files': 0}
+    if dry_run:
+        result['would_archive'] = sum(len(b) for b in db.iter_crimes(mode=mode, until=cutoff, batch_size=RETENTION_BATCH))
+        return result
+    check_archive_dir()
+    while True:
+        batches = db.iter_crimes(mode=mode, until=cutoff, limit=RETENTION_BATCH, batch_size=RETENTION_BATCH)
+        batch = next(batches, [])
+        batches.close()  # Libera el cursor antes de borrar
+        if not batch:
+            return result
+        result['files'] += len(_write_archive(mode, batch))
+        deleted = db.delete_crimes_by_ids([row['id'] for row in batch])
+        result['archived'] += sum(deleted.values())
+        if not any(deleted.values()):
+            # Nada se pudo borrar: evitar un bucle que archive lo mismo otra vez
+            logger.warning('Retención %s: el lote archivado no se borró', mode)
+            return result
+
+
+def dedupe_sqlite_table(conn: sqlite3.Connection, table: str = 'crimes') -> int:
+    """Deja una fila por `id` (la última insertada) y crea un índice único para que no vuelvan a duplicarse.
+
+    @returns Cantidad de filas duplicadas eliminadas.
+    """
+    cur = conn.execute(
+        f'DELETE FROM "{table}" WHERE id IS NOT NULL AND rowid NOT IN '
+        f'(SELECT MAX(rowid) FROM "{table}" WHERE id IS NOT NULL GROUP BY id)'
+    )
+    removed = cur.rowcount
+    conn.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS "{table}_id_uq" ON "{table}" (id)')
+    conn.commit()
+    return removed
+
+
+def compact_chicago_db(path: str = CHICAGO_DB_PATH) -> Dict[str, Any]:
+    """Quita duplicados de `chicago.db` (exportación local de la app) y lo compacta."""
+    if not os.path.exists(path):
+        return {'present': False}
+    before = os.path.getsize(path)
+    conn = sqlite3.connect(path)
+    try:
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'crimes'").fetchone()
+        removed = dedupe_sqlite_table(conn) if exists else 0
+        conn.execute('VACUUM')
+    finally:
+        conn.close()
+    after = os.path.getsize(path)
+    return {'present': True, 'duplicates_removed': removed, 'reclaimed_bytes': before - after}
+
+
+def run_retention(now: Optional[datetime] = None, dry_run: bool = False, compact: bool = True) -> Dict[str, Any]:
+    """Ejecuta retención, deduplicación y compactación; devuelve (y guarda) el informe.
+
+    @raises RuntimeError Si hay días de retención configurados y `ARCHIVE_DIR`
+        no es válido (antes de tocar la base).
+    @raises RetentionBusy Si otra ejecución está en curso.
+    """
+    if dry_run:
+        return _run(now, dry_run, compact)
+    if any(days > 0 for days in RETENTION_DAYS.values()):
+        check_archive_dir()
+    import fcntl
+
+    lock_dir = ARCHIVE_DIR or tempfile.gettempdir()
+    with open(os.path.join(lock_dir, _LOCK_FILE), 'a+') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            raise RetentionBusy('La retención ya se está ejecutando') from None
+        return _run(now, dry_run, compact)
+
+
+def _run(now: Optional[datetime], dry_run: bool, compact: bool) -> Dict[str, Any]:
+    started = time.monotonic()
+    report: Dict[str, Any] = {'started_at': datetime.utcnow().isoformat(), 'dry_run': dry_run, 'sources': {}}
+    for mode, days in RETENTION_DAYS.items():
+        if days > 0:
+            report['sources'][mode] = archive_cold_rows(mode, days, now=now, dry_run=dry_run)
+    if not dry_run:
+        report['chicago_db'] = compact_chicago_db()
+        if compact:
+            report['compaction'] = db.compact()
+        report['reclaimed_bytes'] = (
+            report.get('compaction', {}).get('reclaimed_bytes', 0)
+            + report['chicago_db'].get('reclaimed_bytes', 0)
+        )
+    report['duration_s'] = round(time.monotonic() - started, 3)
+    if not dry_run and ARCHIVE_DIR and os.path.isdir(ARCHIVE_DIR):
+        tmp = os.path.join(ARCHIVE_DIR, f'.{_REPORT_FILE}.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, os.path.join(ARCHIVE_DIR, _REPORT_FILE))
+    logger.info('Retención: %s', json.dumps(report, default=str))
+    return report
+
+
+def last_report() -> Optional[Dict[str, Any]]:
+    if not ARCHIVE_DIR:
+        return None
+    try:
+        with open(os.path.join(ARCHIVE_DIR, _REPORT_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _partitions(mode: Optional[str], since: Optional[str], until: Optional[str]) -> Iterator[str]:
+    """Archivos de las particiones que se solapan con [since, until)."""
+    if not ARCHIVE_DIR or not os.path.isdir(ARCHIVE_DIR):
+        return
+    first, last = (since or '')[:7], (until or '')[:7]
+    modes = [mode] if mode else sorted(
+        d for d in os.listdir(ARCHIVE_DIR) if os.path.isdir(os.path.join(ARCHIVE_DIR, d))
+    )
+    for m in modes:
+        for root, dirs, files in os.walk(os.path.join(ARCHIVE_DIR, m)):
+            dirs.sort()
+            rel = os.path.relpath(root, os.path.join(ARCHIVE_DIR, m)).split(os.sep)
+            if len(rel) == 2:
+                month = f'{rel[0]}-{rel[1]}'
+                if (first and month < first) or (last and month > last):
+                    continue
+            elif rel != ['sin_fecha'] or since or until:
+                continue
+            for name in sorted(files):
+                if name.endswith('.jsonl.gz'):
+                    yield os.path.join(root, name)
+
+
+def query_archive(
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    mode: Optional[str] = None,
+    primary_type: Optional[str] = None,
+    limit: int = 1000,
+) -> Dict[str, Any]:
+    """Busca en el archivo frío; sólo abre las particiones de los meses pedidos.
+
+    @returns `{'partitions': archivos leídos, 'records': [...]}` con hasta
+        `limit` filas (fechas como texto ISO 8601).
+    """
+    records: List[Dict[str, Any]] = []
+    scanned = 0
+    for path in _partitions(mode, since, until):
+        scanned += 1
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                row = json.loads(line)
+                date = row.get('date') or ''
+                if since and date < since:
+                    continue
+                if until and date >= until:
+                    continue
+                if primary_type and row.get('primary_type') != primary_type:
+                    continue
+                records.append(row)
+                if len(records) >= limit:
+                    return {'partitions': scanned, 'records': records}
+    return {'partitions': scanned, 'records': records}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Retención, archivo y compactación de la tabla crimes')
+    parser.add_argument('--dry-run', action='store_true', help='Sólo contar las filas que se archivarían')
+    parser.add_argument('--no-compact', action='store_true', help='No ejecutar VACUUM/ANALYZE')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        report = run_retention(dry_run=args.dry_run, compact=not args.no_compact)
+    except RuntimeError as e:
+        parser.exit(1, f'{e}\n')
+    print(json.dumps(report, indent=2, default=str))
+
+
+if __name__ == '__main__':
+    main()
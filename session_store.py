@@ -0,0 +1,297 @@
+"""Almacén de DataFrames por sesión de Streamlit con presupuesto de memoria.
+
+Antes cada sesión guardaba sus DataFrames en `st.session_state`: una copia
+propia del DataFrame combinado aunque fuera idéntico al de las demás
+sesiones, y los registros sintéticos concatenados sin límite. Este módulo
+los guarda en un registro del proceso:
+
+- Cada sesión tiene sus DataFrames por nombre (`put`/`get`/`drop`). La
+  memoria se mide con `memory_usage(deep=True)` al guardarlos.
+- Presupuestos: `SESSION_MEMORY_MB` por sesión y `SESSION_STORE_MB` para
+  todo el proceso. Al superarlos se bajan a disco (pickle en
+  `SESSION_SPILL_DIR`) los DataFrames usados hace más tiempo, primero los
+  de las sesiones inactivas; `get` los vuelve a cargar de forma
+  transparente. Nunca se pierde un DataFrame: sólo cambia dónde vive.
+- DataFrames compartidos: `intern` devuelve el mismo objeto a todas las
+  sesiones que piden la misma huella (p. ej. el combinado de las fuentes
+  compartidas cuando la sesión no tiene datos propios) y se cuenta una
+  sola vez. Se tratan como de sólo lectura.
+- Las sesiones cerradas (según el runtime de Streamlit) se eliminan con
+  sus archivos cada `_REAP_EVERY_S` segundos.
+
+`stats` alimenta el panel "Memoria" del administrador. Las cachés
+derivadas de `viz.cached_by_version` siguen en `st.session_state`.
+"""
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+import pandas as pd
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+SESSION_MEMORY_MB: float = float(os.getenv('SESSION_MEMORY_MB', '256'))
+SESSION_STORE_MB: float = float(os.getenv('SESSION_STORE_MB', '1024'))
+SESSION_SPILL_DIR: str = os.getenv('SESSION_SPILL_DIR', os.path.join(tempfile.gettempdir(), 'chicago_sessions'))
+SESSION_MAX_SYNTHETIC_ROWS: int = int(os.getenv('SESSION_MAX_SYNTHETIC_ROWS', '100000'))
+
+_MB = 1024 * 1024
+_REAP_EVERY_S = 30.0
+_MAX_SHARED = 4
+
+_lock = threading.RLock()
+# session_id -> {'touched': monotonic, 'frames': {key: entry}}
+_sessions: Dict[str, Dict[str, Any]] = {}
+# huella -> {'frame', 'bytes', 'rows', 'touched'}
+_shared: Dict[Hashable, Dict[str, Any]] = {}
+_counters = {'spills': 0, 'loads': 0, 'reaped_sessions': 0}
+_last_reap = {'at': 0.0}
+
+
+def frame_bytes(frame: pd.DataFrame) -> int:
+    return int(frame.memory_usage(index=True, deep=True).sum())
+
+
+def session_id() -> str:
+    """Id de la sesión de Streamlit actual (o un token propio fuera del runtime, p. ej. en pruebas)."""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+        ctx = get_script_run_ctx()
+        if ctx is not None:
+            return ctx.session_id
+    except Exception:
+        pass
+    return st.session_state.setdefault('_session_store_id', uuid.uuid4().hex)
+
+
+def _session(sid: str) -> Dict[str, Any]:
+    session = _sessions.setdefault(sid, {'touched': 0.0, 'frames': {}})
+    session['touched'] = time.monotonic()
+    return session
+
+
+def _resident_bytes(session: Dict[str, Any]) -> int:
+    return sum(e['bytes'] for e in session['frames'].values() if e['frame'] is not None and e['shared'] is None)
+
+
+def _spill(sid: str, key: str, entry: Dict[str, Any]) -> None:
+    os.makedirs(SESSION_SPILL_DIR, exist_ok=True)
+    path = entry['path'] or os.path.join(SESSION_SPILL_DIR, f'{sid}-{uuid.uuid4().hex[:8]}.pkl')
+    entry['frame'].to_pickle(path)
+    entry.update(frame=None, path=path)
+    _counters['spills'] += 1
+    logger.info('Sesión %s: %s (%.1f MB) bajado a disco', sid[:8], key, entry['bytes'] / _MB)
+
+
+def _remove_file(entry: Dict[str, Any]) -> None:
+    if entry.get('path'):
+        try:
+            os.remove(entry['path'])
+        except FileNotFoundError:
+            pass
+        entry['path'] = None
+
+
+def _release_shared(fingerprint: Optional[Hashable]) -> None:
+    """Quita del pool un DataFrame compartido que ya ninguna sesión usa."""
+    if fingerprint is None or fingerprint not in _shared:
+        return
+    for session in _sessions.values():
+        if any(e['shared'] == fingerprint for e in session['frames'].values()):
+            return
+    del _shared[fingerprint]
+
+
+def _enforce(sid: str, protect: Optional[str] = None) -> None:
+    """Baja a disco DataFrames hasta cumplir los presupuestos (no toca `protect` de la sesión `sid`)."""
+    session = _sessions[sid]
+    limit = SESSION_MEMORY_MB * _MB
+    while _resident_bytes(session) > limit:
+        candidates = [
+            (e['touched'], k) for k, e in session['frames'].items()
+            if e['frame'] is not None and e['shared'] is None and k != protect
+        ]
+        if not candidates:
+            break
+        _, key = min(candidates)
+        _spill(sid, key, session['frames'][key])
+
+    limit = SESSION_STORE_MB * _MB
+    total = sum(_resident_bytes(s) for s in _sessions.values()) + sum(e['bytes'] for e in _shared.values())
+    if total <= limit:
+        return
+    # Primero las sesiones inactivas hace más tiempo; dentro de cada una, lo menos usado
+    candidates = sorted(
+        (s['touched'], e['touched'], other, k)
+        for other, s in _sessions.items()
+        for k, e in s['frames'].items()
+        if e['frame'] is not None and e['shared'] is None and not (other == sid and k == protect)
+    )
+    for _, _, other, key in candidates:
+        if total <= limit:
+            break
+        entry = _sessions[other]['frames'][key]
+        total -= entry['bytes']
+        _spill(other, key, entry)
+
+
+def _reap() -> None:
+    """Elimina las sesiones que el runtime de Streamlit ya cerró."""
+    now = time.monotonic()
+    if now - _last_reap['at'] < _REAP_EVERY_S:
+        return
+    _last_reap['at'] = now
+    try:
+        from streamlit import runtime
+
+        if not runtime.exists():
+            return
+        instance = runtime.get_instance()
+        closed = [sid for sid in _sessions if not instance.is_active_session(sid)]
+    except Exception:
+        return
+    for sid in closed:
+        _drop_session(sid)
+        _counters['reaped_sessions'] += 1
+
+
+def _drop_session(sid: str) -> None:
+    session = _sessions.pop(sid, None)
+    if session is None:
+        return
+    for entry in session['frames'].values():
+        _remove_file(entry)
+        _release_shared(entry['shared'])
+
+
+def put(key: str, frame: pd.DataFrame, shared_key: Optional[Hashable] = None) -> None:
+    """Guarda `frame` como `key` de la sesión actual.
+
+    @param shared_key Huella de un DataFrame obtenido con `intern`: la
+        sesión sólo guarda la referencia y no consume su presupuesto.
+    """
+    with _lock:
+        _reap()
+        sid = session_id()
+        session = _session(sid)
+        previous = session['frames'].pop(key, None)
+        if previous is not None:
+            _remove_file(previous)
+            if previous['shared'] != shared_key:
+                _release_shared(previous['shared'])
+        nbytes = _shared[shared_key]['bytes'] if shared_key in _shared else frame_bytes(frame)
+        session['frames'][key] = {
+            'frame': frame,
+            'bytes': nbytes,
+            'rows': len(frame),
+            'path': None,
+            'shared': shared_key if shared_key in _shared else None,
+            'touched': time.monotonic(),
+        }
+        _enforce(sid, protect=key)
+
+
+def get(key: str) -> Optional[pd.DataFrame]:
+    """DataFrame `key` de la sesión actual (cargándolo de disco si estaba bajado), o None."""
+    with _lock:
+        sid = session_id()
+        session = _sessions.get(sid)
+        entry = session['frames'].get(key) if session is not None else None
+        if entry is None:
+            return None
+        _session(sid)
+        entry['touched'] = time.monotonic()
+        if entry['shared'] is not None:
+            _shared[entry['shared']]['touched'] = entry['touched']
+            return entry['frame']
+        if entry['frame'] is None:
+            entry['frame'] = pd.read_pickle(entry['path'])
+            _remove_file(entry)
+            _counters['loads'] += 1
+            _enforce(sid, protect=key)
+        return entry['frame']
+
+
+def drop(key: str) -> bool:
+    with _lock:
+        session = _sessions.get(session_id())
+        entry = session['frames'].pop(key, None) if session is not None else None
+        if entry is None:
+            return False
+        _remove_file(entry)
+        _release_shared(entry['shared'])
+        return True
+
+
+def intern(fingerprint: Hashable, build: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+    """DataFrame compartido por todas las sesiones con la misma huella (se construye una vez)."""
+    with _lock:
+        entry = _shared.get(fingerprint)
+        if entry is not None:
+            entry['touched'] = time.monotonic()
+            return entry['frame']
+    frame = build()
+    with _lock:
+        entry = _shared.get(fingerprint)
+        if entry is None:
+            entry = {'frame': frame, 'bytes': frame_bytes(frame), 'rows': len(frame), 'touched': time.monotonic()}
+            _shared[fingerprint] = entry
+            # Las huellas viejas que nadie usa salen del pool
+            for old in sorted(_shared, key=lambda f: _shared[f]['touched'])[:-_MAX_SHARED]:
+                _release_shared(old)
+        return entry['frame']
+
+
+def _process_rss_bytes() -> Optional[int]:
+    try:
+        with open('/proc/self/status', encoding='ascii') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def stats() -> Dict[str, Any]:
+    """Uso de memoria del almacén: totales, presupuestos y detalle por sesión."""
+    now = time.monotonic()
+    with _lock:
+        current = session_id()
+        sessions: List[Dict[str, Any]] = []
+        for sid, session in sorted(_sessions.items(), key=lambda kv: kv[1]['touched'], reverse=True):
+            frames = session['frames']
+            sessions.append({
+                'sesion': sid[:8],
+                'actual': sid == current,
+                'inactiva_s': round(now - session['touched'], 1),
+                'memoria_mb': round(_resident_bytes(session) / _MB, 2),
+                'disco_mb': round(sum(e['bytes'] for e in frames.values() if e['path']) / _MB, 2),
+                'filas': sum(e['rows'] for e in frames.values()),
+                'dataframes': ', '.join(
+                    f"{k} ({'compartido' if e['shared'] is not None else 'disco' if e['frame'] is None else 'memoria'})"
+                    for k, e in frames.items()
+                ),
+            })
+        shared_bytes = sum(e['bytes'] for e in _shared.values())
+        resident = sum(_resident_bytes(s) for s in _sessions.values())
+        spilled = sum(e['bytes'] for s in _sessions.values() for e in s['frames'].values() if e['path'])
+        counters = dict(_counters)
+    rss = _process_rss_bytes()
+    return {
+        'session_budget_mb': SESSION_MEMORY_MB,
+        'store_budget_mb': SESSION_STORE_MB,
+        'memory_mb': round((resident + shared_bytes) / _MB, 2),
+        'shared_mb': round(shared_bytes / _MB, 2),
+        'shared_frames': len(_shared),
+        'spilled_mb': round(spilled / _MB, 2),
+        'process_rss_mb': round(rss / _MB, 1) if rss is not None else None,
+        **counters,
+        'sessions': sessions,
+    }
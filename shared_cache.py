@@ -0,0 +1,241 @@
+"""Caché de respuestas compartida entre los workers de gunicorn.
+
+Los workers son procesos separados, así que una caché en memoria de cada
+uno se llenaría (y se invalidaría) cuatro veces. Esta caché vive en un
+archivo mapeado en memoria (por defecto en `/dev/shm`) que todos los
+workers de la máquina abren con `MAP_SHARED`. Sin `SHARED_CACHE_PATH`, el
+nombre del archivo lleva un hash de la base de datos configurada, para que
+dos instancias de la API en la misma máquina contra bases distintas
+(staging y producción, SQLite y Postgres) no se sirvan respuestas entre sí.
+
+- Un contador global de versión en la cabecera. Cada escritura por la API
+  lo incrementa (`bump_version`) y con eso invalida las entradas de todos
+  los workers a la vez. Además la API incluye en cada clave la versión de
+  datos de la base (`db_postgres.data_version`), así que las escrituras
+  hechas fuera de la API también invalidan.
+- `SHARED_CACHE_SLOTS` ranuras de tamaño fijo, direccionadas por el hash
+  de la clave (una entrada por ranura; una colisión reemplaza la anterior).
+
+Las lecturas no toman ningún lock: cada ranura lleva un contador de
+secuencia (seqlock) que el escritor deja impar mientras escribe, y el
+lector descarta la copia si la secuencia cambió o era impar. Las
+escrituras se serializan con `flock` sobre el archivo. Las entradas
+también caducan a los `SHARED_CACHE_TTL` segundos.
+
+Si la plataforma no tiene `fcntl`/`mmap` compartido, o el archivo no se
+puede crear, la caché queda deshabilitada y `get` siempre falla.
+"""
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+SHARED_CACHE_ENABLED: bool = os.getenv('SHARED_CACHE_ENABLED', '1').lower() in ('1', 'true', 'yes')
+# Vacío = archivo propio de la base configurada (ver `cache_path`)
+SHARED_CACHE_PATH: str = os.getenv('SHARED_CACHE_PATH', '')
+SHARED_CACHE_SLOTS: int = int(os.getenv('SHARED_CACHE_SLOTS', '64'))
+SHARED_CACHE_SLOT_BYTES: int = int(os.getenv('SHARED_CACHE_SLOT_BYTES', str(1 << 20)))
+SHARED_CACHE_TTL: float = float(os.getenv('SHARED_CACHE_TTL', '5'))
+
+_MAGIC = b'CHCACHE1'
+# Cabecera: magic, versión global, ranuras, bytes por ranura
+_HEADER = struct.Struct('<8sQII')
+_HEADER_SIZE = 64
+_VERSION_OFFSET = 8
+# Ranura: secuencia, hash de la clave, versión, expira (epoch), largo
+_SLOT = struct.Struct('<Q16sQdI')
+_U64 = struct.Struct('<Q')
+
+_state_lock = threading.Lock()
+# flock excluye entre procesos; entre hilos del mismo worker hace falta este lock
+_write_lock = threading.Lock()
+_state: Optional[Dict[str, Any]] = None
+_stats = {'hits': 0, 'misses': 0, 'stores': 0, 'too_large': 0}
+
+
+def _backend_identity() -> str:
+    import db_postgres as db
+
+    if db.DB_MODE == 'sqlite':
+        return f'sqlite:{os.path.abspath(db.SQLITE_PATH)}'
+    return f'postgres:{db.PG_HOST}:{db.PG_PORT}/{db.PG_DBNAME}'
+
+
+def cache_path() -> str:
+    """Archivo de la caché: `SHARED_CACHE_PATH` o uno por base de datos en `/dev/shm`."""
+    if SHARED_CACHE_PATH:
+        return SHARED_CACHE_PATH
+    digest = hashlib.blake2b(_backend_identity().encode('utf-8'), digest_size=8).hexdigest()
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(base, f'chicago_api_cache_{digest}')
+
+
+def _open() -> Optional[Dict[str, Any]]:
+    """Abre (o crea) el archivo compartido la primera vez que se usa en el proceso."""
+    global _state
+    # Tras un fork se reabre: flock no excluye entre procesos que comparten el descriptor
+    if _state is not None and _state['pid'] == os.getpid():
+        return _state if _state['mm'] is not None else None
+    with _state_lock:
+        if _state is not None and _state['pid'] == os.getpid():
+            return _state if _state['mm'] is not None else None
+        _state = {'mm': None, 'pid': os.getpid()}
+        if not SHARED_CACHE_ENABLED:
+            return None
+        path = cache_path()
+        try:
+            import fcntl
+
+            size = _HEADER_SIZE + SHARED_CACHE_SLOTS * SHARED_CACHE_SLOT_BYTES
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                header = os.pread(fd, _HEADER.size, 0)
+                valid = (
+                    len(header) == _HEADER.size
+                    and _HEADER.unpack(header)[0] == _MAGIC
+                    and _HEADER.unpack(header)[2:] == (SHARED_CACHE_SLOTS, SHARED_CACHE_SLOT_BYTES)
+                    and os.fstat(fd).st_size == size
+                )
+                if not valid:
+                    # Archivo nuevo o con otra geometría: se reinicia (ranuras vacías)
+                    os.ftruncate(fd, 0)
+                    os.ftruncate(fd, size)
+                    os.pwrite(fd, _HEADER.pack(_MAGIC, 0, SHARED_CACHE_SLOTS, SHARED_CACHE_SLOT_BYTES), 0)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            mm = mmap.mmap(fd, size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+            _state = {
+                'mm': mm,
+                'fd': fd,
+                'pid': os.getpid(),
+                'path': path,
+                'flock': fcntl.flock,
+                'LOCK_EX': fcntl.LOCK_EX,
+                'LOCK_UN': fcntl.LOCK_UN,
+            }
+        except Exception as e:
+            logger.warning('Caché compartida deshabilitada (%s): %s', path, e)
+            return None
+    return _state
+
+
+@contextmanager
+def _exclusive(state: Dict[str, Any]) -> Iterator[None]:
+    with _write_lock:
+        state['flock'](state['fd'], state['LOCK_EX'])
+        try:
+            yield
+        finally:
+            state['flock'](state['fd'], state['LOCK_UN'])
+
+
+def _key_hash(key: str) -> bytes:
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+
+
+def _slot_offset(digest: bytes) -> int:
+    index = int.from_bytes(digest[:8], 'little') % SHARED_CACHE_SLOTS
+    return _HEADER_SIZE + index * SHARED_CACHE_SLOT_BYTES
+
+
+def _read_version(mm: mmap.mmap) -> int:
+    # Un u64 alineado no debería leerse a medias, pero se confirma con una segunda lectura
+    while True:
+        first = _U64.unpack_from(mm, _VERSION_OFFSET)[0]
+        if _U64.unpack_from(mm, _VERSION_OFFSET)[0] == first:
+            return first
+
+
+def current_version() -> int:
+    """Versión global actual (0 si la caché está deshabilitada)."""
+    state = _open()
+    return _read_version(state['mm']) if state else 0
+
+
+def bump_version() -> int:
+    """Incrementa la versión global: invalida lo cacheado en todos los workers."""
+    state = _open()
+    if not state:
+        return 0
+    mm = state['mm']
+    with _exclusive(state):
+        version = _U64.unpack_from(mm, _VERSION_OFFSET)[0] + 1
+        _U64.pack_into(mm, _VERSION_OFFSET, version)
+        return version
+
+
+def get(key: str) -> Optional[bytes]:
+    """Devuelve el valor cacheado para `key` si sigue vigente, sin tomar locks."""
+    state = _open()
+    if not state:
+        return None
+    mm = state['mm']
+    digest = _key_hash(key)
+    offset = _slot_offset(digest)
+    for _ in range(3):
+        seq, slot_key, version, expires_at, length = _SLOT.unpack_from(mm, offset)
+        if seq % 2 or slot_key != digest:
+            break
+        start = offset + _SLOT.size
+        payload = mm[start:start + length]
+        if _U64.unpack_from(mm, offset)[0] != seq:
+            # Un escritor pasó por la ranura mientras se copiaba: reintentar
+            continue
+        if version != _read_version(mm) or expires_at < time.time():
+            break
+        _stats['hits'] += 1
+        return payload
+    _stats['misses'] += 1
+    return None
+
+
+def put(key: str, payload: bytes, version: int, ttl: Optional[float] = None) -> bool:
+    """Guarda `payload` para `key` calculado con la versión global `version`.
+
+    `version` debe leerse con `current_version()` *antes* de calcular el
+    valor: si entretanto hubo una escritura, la entrada nace invalidada en
+    lugar de servir datos viejos con la versión nueva.
+    """
+    state = _open()
+    if not state:
+        return False
+    if _SLOT.size + len(payload) > SHARED_CACHE_SLOT_BYTES:
+        _stats['too_large'] += 1
+        return False
+    mm = state['mm']
+    digest = _key_hash(key)
+    offset = _slot_offset(digest)
+    expires_at = time.time() + (SHARED_CACHE_TTL if ttl is None else ttl)
+    with _exclusive(state):
+        seq = _U64.unpack_from(mm, offset)[0]
+        # Secuencia impar: los lectores ignoran la ranura mientras se escribe
+        _U64.pack_into(mm, offset, seq + 1)
+        start = offset + _SLOT.size
+        mm[start:start + len(payload)] = payload
+        _SLOT.pack_into(mm, offset, seq + 1, digest, version, expires_at, len(payload))
+        _U64.pack_into(mm, offset, seq + 2)
+    _stats['stores'] += 1
+    return True
+
+
+def stats() -> Dict[str, Any]:
+    """Estado de la caché y contadores de este worker (aciertos, fallos, guardados)."""
+    state = _open()
+    return {
+        'enabled': bool(state),
+        'path': state['path'] if state else SHARED_CACHE_PATH or None,
+        'version': current_version(),
+        'slots': SHARED_CACHE_SLOTS,
+        'slot_bytes': SHARED_CACHE_SLOT_BYTES,
+        'ttl_s': SHARED_CACHE_TTL,
+        'worker': {'pid': os.getpid(), **_stats},
+    }
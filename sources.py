@@ -0,0 +1,442 @@
+"""Fuentes de datos del dashboard con adaptadores intercambiables.
+
+Cada fuente implementa `SourceAdapter.iter_batches(watermark)`, que produce
+lotes ya mapeados a `SCHEMA_COLUMNS` junto con la marca de agua alcanzada
+tras cada lote. `collect` consulta las fuentes en paralelo:
+
+- Las fuentes compartidas (portal de Chicago, carpeta de archivos, spool de
+  webhooks) guardan su último DataFrame, su marca de agua y una revisión
+  en una caché del proceso, común a todas las sesiones. Sólo se vuelven a
+  consultar cada `refresh_interval` segundos, y desde la marca de agua:
+  lo nuevo se fusiona por `id` con lo ya cargado.
+- Cada fuente corre en su propio hilo. Si tarda más de `SOURCE_WAIT_S`
+  segundos (o su `timeout` la primera vez) se usa su último resultado y la
+  consulta sigue en segundo plano; si falla se conserva el resultado
+  anterior y el error queda en su estado. Una fuente lenta o caída no
+  frena a las demás.
+- Las fuentes de sesión (registros sintéticos de Arequipa) no se cachean
+  ni van a hilos: ya están en memoria.
+
+Los adaptadores no usan `st.*`: corren fuera del hilo del script. pandas se
+importa dentro de las funciones: la API importa este módulo para el spool
+de webhooks y no necesita cargarlo.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import tracing
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+SOURCE_WAIT_S: float = float(os.getenv('SOURCE_WAIT_S', '3'))
+SOURCE_WORKERS: int = int(os.getenv('SOURCE_WORKERS', '4'))
+SOURCE_DROP_DIR: str = os.getenv('SOURCE_DROP_DIR', '')
+SOURCE_WEBHOOK_DIR: str = os.getenv('SOURCE_WEBHOOK_DIR', '')
+SOURCE_MAX_ROWS: int = int(os.getenv('SOURCE_MAX_ROWS', '50000'))
+SOCRATA_PAGE_SIZE: int = int(os.getenv('SOCRATA_PAGE_SIZE', '5000'))
+CHUNK_ROWS: int = 5000
+CSV_DATETIME_FORMAT: str = '%m/%d/%Y %I:%M:%S %p'
+
+# Convierte registros (dicts con claves del esquema) en un DataFrame tipado
+Decoder = Callable[[List[Dict[str, Any]]], 'pd.DataFrame']
+
+_BOOL_TEXT: Dict[str, bool] = {'true': True, 't': True, '1': True, 'false': False, 'f': False, '0': False}
+
+_executor = ThreadPoolExecutor(max_workers=max(1, SOURCE_WORKERS), thread_name_prefix='source')
+_lock = threading.Lock()
+_states: Dict[str, Dict[str, Any]] = {}
+
+
+class SourceAdapter:
+    """Interfaz común de las fuentes.
+
+    Las subclases definen `iter_batches`; `merge` (por defecto: lo nuevo
+    primero, sin ids repetidos, ordenado por fecha y recortado a
+    `max_rows`) combina esos lotes con el resultado anterior.
+    """
+
+    name: str = ''
+    refresh_interval: float = 60.0
+    timeout: float = 30.0
+    shared: bool = True
+    max_rows: Optional[int] = SOURCE_MAX_ROWS
+
+    @property
+    def key(self) -> str:
+        """Clave del estado en la caché del proceso."""
+        return self.name
+
+    def iter_batches(self, watermark: Any) -> Iterator[Tuple['pd.DataFrame', Any]]:
+        raise NotImplementedError
+
+    def problems(self, watermark: Any) -> List[str]:
+        """Fallos parciales que deja la marca de agua; `collect` los muestra como error de la fuente."""
+        return []
+
+    def merge(self, previous: Optional['pd.DataFrame'], batches: List['pd.DataFrame']) -> 'pd.DataFrame':
+        import pandas as pd
+
+        frames = [b for b in batches if not b.empty]
+        if not frames:
+            return previous if previous is not None else pd.DataFrame()
+        if previous is not None and not previous.empty:
+            frames.append(previous)
+        df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+        if 'id' in df.columns:
+            # Gana la versión más nueva de cada id; las filas sin id se conservan
+            df = df[df['id'].isna() | ~df['id'].duplicated(keep='first')]
+        if 'date' in df.columns:
+            df = df.sort_values('date', ascending=False, kind='stable')
+        if self.max_rows is not None:
+            df = df.head(self.max_rows)
+        return df.reset_index(drop=True)
+
+
+class SocrataSource(SourceAdapter):
+    """Portal de datos abiertos (Socrata). La marca de agua es el `updated_on` más reciente visto."""
+
+    def __init__(self, name: str, url: str, limit: int, decode: Decoder, refresh_interval: float = 60.0) -> None:
+        self.name = name
+        self.url = url
+        self.limit = limit
+        self.decode = decode
+        self.refresh_interval = refresh_interval
+        self.max_rows = limit
+
+    @property
+    def key(self) -> str:
+        return f'{self.name}:{self.limit}'
+
+    def iter_batches(self, watermark: Any) -> Iterator[Tuple['pd.DataFrame', Any]]:
+        import pandas as pd
+        import requests
+
+        if watermark is None:
+            # Primera carga: los `limit` más recientes
+            base = {'$order': 'date DESC, :id'}
+        else:
+            # Después sólo lo creado o modificado desde la marca de agua
+            base = {'$order': 'updated_on ASC, :id', '$where': f"updated_on > '{watermark}'"}
+        offset = 0
+        while offset < self.limit:
+            page = min(SOCRATA_PAGE_SIZE, self.limit - offset)
+            with tracing.span('socrata.fetch', offset=offset):
+                resp = requests.get(self.url, params={**base, '$limit': page, '$offset': offset}, timeout=self.timeout)
+                resp.raise_for_status()
+            with tracing.span('socrata.parse'):
+                records = resp.json()
+                if not records:
+                    return
+                df = self.decode(records)
+            newest = df['updated_on'].max() if 'updated_on' in df.columns else None
+            if newest is not None and not pd.isna(newest):
+                mark = newest.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]
+                watermark = mark if watermark is None else max(watermark, mark)
+            yield df, watermark
+            if len(records) < page:
+                return
+            offset += len(records)
+
+
+def normalize_columns(df: 'pd.DataFrame') -> 'pd.DataFrame':
+    """Encabezados de exportaciones ('Primary Type', 'ID') a nombres del esquema y booleanos en texto a bool."""
+    import pandas as pd
+
+    df = df.rename(columns=lambda c: str(c).strip().lower().replace(' ', '_'))
+    for col in ('arrest', 'domestic'):
+        if col in df.columns:
+            df[col] = df[col].map(lambda v: _BOOL_TEXT.get(v.strip().lower(), v) if isinstance(v, str) else v)
+    for col in ('date', 'updated_on'):
+        if col in df.columns:
+            # Formato de las descargas CSV del portal ('01/02/2024 10:00:00 PM');
+            # lo que no encaje queda como texto para el decodificador
+            parsed = pd.to_datetime(df[col], format=CSV_DATETIME_FORMAT, errors='coerce')
+            df[col] = parsed.astype(object).where(parsed.notna(), df[col])
+    # NaN de pandas como None, igual que un campo ausente en JSON
+    return df.astype(object).where(df.notna(), None)
+
+
+class FileDropSource(SourceAdapter):
+    """Archivos CSV/Parquet dejados en una carpeta.
+
+    La marca de agua es `{archivo: (mtime_ns, tamaño)}`: sólo se leen los
+    archivos nuevos o modificados, por bloques de `CHUNK_ROWS` filas. Un
+    archivo ilegible no bloquea a los demás: queda en la marca de agua como
+    `(mtime_ns, tamaño, error)` y se vuelve a intentar en cada consulta (p.
+    ej. si se leyó mientras todavía se estaba copiando). El primer fallo de
+    cada versión del archivo se registra como warning y el error se ve en el
+    estado de la fuente hasta que se lee bien.
+    """
+
+    def __init__(self, name: str, directory: str, decode: Decoder, refresh_interval: float = 10.0) -> None:
+        self.name = name
+        self.directory = directory
+        self.decode = decode
+        self.refresh_interval = refresh_interval
+
+    def _read(self, path: str) -> Iterator['pd.DataFrame']:
+        import pandas as pd
+
+        if path.endswith('.csv'):
+            for chunk in pd.read_csv(path, chunksize=CHUNK_ROWS, dtype=str, keep_default_na=True):
+                yield chunk
+        else:
+            df = pd.read_parquet(path)
+            for start in range(0, len(df), CHUNK_ROWS):
+                yield df.iloc[start:start + CHUNK_ROWS]
+
+    def iter_batches(self, watermark: Any) -> Iterator[Tuple['pd.DataFrame', Any]]:
+        import pandas as pd
+
+        seen = dict(watermark or {})
+        if not os.path.isdir(self.directory):
+            return
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(('.csv', '.parquet')):
+                stat = entry.stat()
+                if seen.get(entry.name) != (stat.st_mtime_ns, stat.st_size):
+                    entries.append((stat.st_mtime_ns, entry.name, stat.st_size))
+        for mtime_ns, file_name, size in sorted(entries):
+            try:
+                for chunk in self._read(os.path.join(self.directory, file_name)):
+                    yield self.decode(normalize_columns(chunk).to_dict(orient='records')), seen
+            except Exception as e:
+                previous = seen.get(file_name)
+                if previous is None or tuple(previous[:2]) != (mtime_ns, size):
+                    logger.warning('Fuente %s: no se pudo leer %s (se reintentará): %s', self.name, file_name, e)
+                seen = {**seen, file_name: (mtime_ns, size, str(e))}
+            else:
+                seen = {**seen, file_name: (mtime_ns, size)}
+            yield pd.DataFrame(), seen
+
+    def problems(self, watermark: Any) -> List[str]:
+        return [
+            f'no se pudo leer {name}: {entry[2]}'
+            for name, entry in sorted((watermark or {}).items())
+            if len(entry) > 2
+        ]
+
+
+class WebhookSpoolSource(SourceAdapter):
+    """Registros JSON recibidos por webhook (`POST /sources/webhook`) y guardados con `spool_webhook`.
+
+    Los archivos se nombran por instante de llegada, así que la marca de
+    agua es simplemente el último nombre procesado.
+    """
+
+    def __init__(self, name: str, directory: str, decode: Decoder, refresh_interval: float = 5.0) -> None:
+        self.name = name
+        self.directory = directory
+        self.decode = decode
+        self.refresh_interval = refresh_interval
+
+    def iter_batches(self, watermark: Any) -> Iterator[Tuple['pd.DataFrame', Any]]:
+        import pandas as pd
+
+        if not os.path.isdir(self.directory):
+            return
+        pending = sorted(
+            n for n in os.listdir(self.directory)
+            if n.endswith('.json') and (watermark is None or n > watermark)
+        )
+        records: List[Dict[str, Any]] = []
+        for file_name in pending:
+            try:
+                with open(os.path.join(self.directory, file_name), encoding='utf-8') as f:
+                    payload = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning('Fuente %s: no se pudo leer %s: %s', self.name, file_name, e)
+                payload = []
+            records.extend(r for r in payload_records(payload) if isinstance(r, dict))
+            watermark = file_name
+            if len(records) >= CHUNK_ROWS:
+                yield self.decode(records), watermark
+                records = []
+        if records or pending:
+            yield self.decode(records) if records else pd.DataFrame(), watermark
+
+
+class SessionFrameSource(SourceAdapter):
+    """DataFrame que ya vive en la sesión (p. ej. registros sintéticos); se usa tal cual."""
+
+    shared = False
+
+    def __init__(self, name: str, frame: 'pd.DataFrame') -> None:
+        self.name = name
+        self.frame = frame
+
+    def iter_batches(self, watermark: Any) -> Iterator[Tuple['pd.DataFrame', Any]]:
+        yield self.frame, None
+
+    def merge(self, previous: Optional['pd.DataFrame'], batches: List['pd.DataFrame']) -> 'pd.DataFrame':
+        return batches[-1]
+
+
+def payload_records(payload: Any) -> List[Any]:
+    """Acepta una lista de registros, `{"records": [...]}` o un solo registro."""
+    if isinstance(payload, dict):
+        return payload['records'] if isinstance(payload.get('records'), list) else [payload]
+    return payload if isinstance(payload, list) else []
+
+
+def spool_webhook(payload: Any, directory: str = SOURCE_WEBHOOK_DIR) -> int:
+    """Guarda un push de webhook para `WebhookSpoolSource`.
+
+    @returns Cantidad de registros guardados.
+    """
+    records = [r for r in payload_records(payload) if isinstance(r, dict)]
+    if not records:
+        return 0
+    os.makedirs(directory, exist_ok=True)
+    name = f'{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.json'
+    tmp = os.path.join(directory, f'.{name}.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(records, f, ensure_ascii=False, default=str)
+    # Renombrar es atómico: la fuente nunca ve un archivo a medio escribir
+    os.replace(tmp, os.path.join(directory, name))
+    return len(records)
+
+
+def _new_state(adapter: SourceAdapter) -> Dict[str, Any]:
+    return {
+        'name': adapter.name,
+        'frame': None,
+        'watermark': None,
+        'revision': 0,
+        'attempted_at': None,
+        'fetched_at': None,
+        'duration_s': None,
+        'error': None,
+        'error_at': None,
+        'future': None,
+    }
+
+
+def _run(
+    adapter: SourceAdapter, watermark: Any, previous: Optional['pd.DataFrame'],
+) -> Tuple['pd.DataFrame', Any, bool, float, List[str]]:
+    started = time.monotonic()
+    batches = []
+    with tracing.span(f'source.{adapter.name}'):
+        for batch, watermark in adapter.iter_batches(watermark):
+            batches.append(batch)
+        changed = any(not b.empty for b in batches)
+        with tracing.span('source.merge'):
+            frame = adapter.merge(previous, batches) if changed or previous is None else previous
+    return frame, watermark, changed or previous is None, time.monotonic() - started, adapter.problems(watermark)
+
+
+def _finish(key: str, future: Future) -> None:
+    """Vuelca el resultado de una consulta en el estado de su fuente (idempotente)."""
+    with _lock:
+        state = _states.get(key)
+        if state is None or state['future'] is not future:
+            return
+        state['future'] = None
+        error = future.exception()
+        if error is not None:
+            state['error'], state['error_at'] = str(error), time.time()
+            logger.warning('Fuente %s falló: %s', state['name'], error)
+            return
+        frame, watermark, changed, duration, problems = future.result()
+        error = '; '.join(problems) or None
+        if error is not None and error != state['error']:
+            state['error_at'] = time.time()
+        state.update(watermark=watermark, fetched_at=time.time(), duration_s=duration, error=error)
+        if changed:
+            state['frame'] = frame
+            state['revision'] += 1
+
+
+def _snapshot(state: Dict[str, Any], shared: bool) -> Dict[str, Any]:
+    out = {k: v for k, v in state.items() if k != 'future'}
+    out['pending'] = state.get('future') is not None
+    out['shared'] = shared
+    return out
+
+
+@tracing.traced('sources.collect')
+def collect(adapters: List[SourceAdapter], force: bool = False) -> Dict[str, Dict[str, Any]]:
+    """Estado actual de cada fuente, en el orden de `adapters`, lanzando las consultas que tocan.
+
+    @returns `{nombre: {'frame', 'revision', 'watermark', 'fetched_at',
+        'duration_s', 'error', 'pending', ...}}`. `frame` es None si la fuente
+        nunca respondió.
+    """
+    now = time.time()
+    waits: List[Tuple[SourceAdapter, Future, float]] = []
+    submitted: List[Tuple[str, Future]] = []
+    with _lock:
+        for adapter in adapters:
+            if not adapter.shared:
+                continue
+            state = _states.setdefault(adapter.key, _new_state(adapter))
+            due = (
+                force
+                or state['attempted_at'] is None
+                or now - state['attempted_at'] >= adapter.refresh_interval
+            )
+            if due and state['future'] is None:
+                state['attempted_at'] = now
+                future = _executor.submit(tracing.bind(_run), adapter, state['watermark'], state['frame'])
+                state['future'] = future
+                submitted.append((adapter.key, future))
+            if state['future'] is not None:
+                budget = adapter.timeout if force or state['frame'] is None else SOURCE_WAIT_S
+                waits.append((adapter, state['future'], now + budget))
+    # Fuera del candado: si la consulta ya terminó, el callback corre aquí mismo y `_finish` lo toma
+    for key, future in submitted:
+        future.add_done_callback(lambda f, key=key: _finish(key, f))
+
+    with tracing.span('sources.wait', sources=len(waits)):
+        for adapter, future, deadline in waits:
+            wait([future], timeout=max(0.0, deadline - time.time()))
+            if future.done():
+                _finish(adapter.key, future)
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for adapter in adapters:
+        if adapter.shared:
+            with _lock:
+                results[adapter.name] = _snapshot(_states[adapter.key], shared=True)
+            continue
+        state = _new_state(adapter)
+        started = time.monotonic()
+        try:
+            with tracing.span(f'source.{adapter.name}'):
+                state['frame'] = adapter.merge(None, [b for b, _ in adapter.iter_batches(None)])
+            state['fetched_at'] = now
+        except Exception as e:
+            state['error'], state['error_at'] = str(e), now
+        state['duration_s'] = time.monotonic() - started
+        results[adapter.name] = _snapshot(state, shared=False)
+    return results
+
+
+def status() -> List[Dict[str, Any]]:
+    """Resumen de las fuentes compartidas del proceso (sin los DataFrames)."""
+    with _lock:
+        return [
+            {
+                'fuente': s['name'],
+                'clave': key,
+                'filas': 0 if s['frame'] is None else len(s['frame']),
+                'revision': s['revision'],
+                'marca_de_agua': s['watermark'] if not isinstance(s['watermark'], dict) else f"{len(s['watermark'])} archivos",
+                'actualizado': s['fetched_at'],
+                'duracion_s': None if s['duration_s'] is None else round(s['duration_s'], 3),
+                'en_curso': s['future'] is not None,
+                'error': s['error'],
+            }
+            for key, s in _states.items()
+        ]
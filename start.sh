@@ -1,2 +1,2 @@
 #!/bin/bash
-exec gunicorn -w 4 -b 0.0.0.0:${PORT:-8000} --timeout 120 api:app
+exec gunicorn -c gunicorn.conf.py -b 0.0.0.0:${PORT:-8000} api:app
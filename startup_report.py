@@ -0,0 +1,121 @@
+"""Reporte de tiempo de arranque (import-time budget) y latencia de worker en frío.
+
+Para cada módulo de entrada (`db_postgres`, `api`, `data`, `viz`, `main`)
+mide en un proceso nuevo cuánto tarda `import <módulo>`, y para la API mide
+el arranque de un worker en frío: proceso nuevo -> `import api` -> primera
+respuesta de `/health` y de `/records?limit=1` (primer uso de la BD).
+
+Con `--baseline-ref` extrae esa revisión de git a un directorio temporal y
+ejecuta las mismas mediciones para comparar antes/después.
+
+Ejemplo:
+    DB_MODE=sqlite python startup_report.py --baseline-ref HEAD~1 --repeat 5
+
+@returns Imprime una tabla con medianas en milisegundos.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+MODULES: List[str] = ['db_postgres', 'api', 'data', 'viz', 'main']
+
+_IMPORT_SNIPPET = (
+    "import time, json; t = time.perf_counter(); import {mod}; "
+    "print(json.dumps({{'import_ms': (time.perf_counter() - t) * 1000}}))"
+)
+
+_COLD_WORKER_SNIPPET = """
+import json, time
+t0 = time.perf_counter()
+import api
+t1 = time.perf_counter()
+client = api.app.test_client()
+client.get('/health')
+t2 = time.perf_counter()
+client.get('/records?limit=1')
+t3 = time.perf_counter()
+print(json.dumps({
+    'import_api_ms': (t1 - t0) * 1000,
+    'first_health_ms': (t2 - t1) * 1000,
+    'first_records_ms': (t3 - t2) * 1000,
+}))
+"""
+
+
+def _run_child(code: str, cwd: str) -> Optional[Dict[str, float]]:
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, '-c', code],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        timeout=300,
+        env={**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'},
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+    if proc.returncode != 0:
+        print(f'  fallo en {cwd}: {proc.stderr.strip().splitlines()[-1:]}', file=sys.stderr)
+        return None
+    out = json.loads(proc.stdout.strip().splitlines()[-1])
+    out['process_ms'] = wall_ms
+    return out
+
+
+def _median_of(samples: List[Optional[Dict[str, float]]], key: str) -> Optional[float]:
+    values = [s[key] for s in samples if s and key in s]
+    return statistics.median(values) if values else None
+
+
+def measure(cwd: str, repeat: int) -> Dict[str, Optional[float]]:
+    """Mide imports por módulo y el worker en frío en el árbol `cwd`."""
+    results: Dict[str, Optional[float]] = {}
+    for mod in MODULES:
+        samples = [_run_child(_IMPORT_SNIPPET.format(mod=mod), cwd) for _ in range(repeat)]
+        results[f'import {mod}'] = _median_of(samples, 'import_ms')
+    cold = [_run_child(_COLD_WORKER_SNIPPET, cwd) for _ in range(repeat)]
+    for key in ('import_api_ms', 'first_health_ms', 'first_records_ms', 'process_ms'):
+        results[f'cold worker: {key}'] = _median_of(cold, key)
+    return results
+
+
+def _extract_ref(ref: str, dest: str) -> None:
+    archive = subprocess.run(['git', 'archive', ref], capture_output=True, check=True)
+    subprocess.run(['tar', '-x', '-C', dest], input=archive.stdout, check=True)
+
+
+def _fmt(v: Optional[float]) -> str:
+    return f'{v:10.1f}' if v is not None else f"{'error':>10}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Reporte de tiempo de arranque')
+    parser.add_argument('--baseline-ref', default=None, help='Revisión git para comparar (p. ej. HEAD~1)')
+    parser.add_argument('--repeat', type=int, default=3, help='Repeticiones por medición (mediana)')
+    args = parser.parse_args()
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    current = measure(here, args.repeat)
+
+    if not args.baseline_ref:
+        print(f"{'medición':<36} {'ms':>10}")
+        for key, value in current.items():
+            print(f'{key:<36} {_fmt(value)}')
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _extract_ref(args.baseline_ref, tmp)
+        baseline = measure(tmp, args.repeat)
+
+    print(f"{'medición':<36} {'antes ms':>10} {'ahora ms':>10}")
+    for key in current:
+        print(f'{key:<36} {_fmt(baseline.get(key))} {_fmt(current[key])}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Fixtures comunes: SQLite temporal por prueba y cliente de la API.
+
+Las variables de entorno se fijan antes de importar los módulos del
+proyecto, que leen su configuración al importarse: sin caché compartida
+entre workers, sin límites de escritura que corten las pruebas y con todas
+las carpetas de trabajo en un directorio temporal.
+"""
+import os
+import tempfile
+import threading
+
+import pytest
+
+_WORK_DIR = tempfile.mkdtemp(prefix='chicago-tests-')
+
+os.environ.update({
+    'DB_MODE': 'sqlite',
+    'SQLITE_PATH': os.path.join(_WORK_DIR, 'import.db'),
+    'CHICAGO_DB_PATH': os.path.join(_WORK_DIR, 'chicago.db'),
+    'SHARED_CACHE_ENABLED': '0',
+    'WRITE_RATE': '1000',
+    'WRITE_BURST': '1000',
+    'TRACE_FILE': '',
+    'PROFILING_ENABLED': '0',
+    'PROFILE_DIR': os.path.join(_WORK_DIR, 'profiles'),
+    'EXPORT_DIR': os.path.join(_WORK_DIR, 'exports'),
+    'ARCHIVE_DIR': '',
+    'SESSION_SPILL_DIR': os.path.join(_WORK_DIR, 'sessions'),
+    'SLOW_QUERY_EXPLAIN': '0',
+})
+
+
+def make_record(crime_id: str, **overrides):
+    """Registro válido mínimo para `insert_crimes` / `POST /records`."""
+    record = {
+        'id': crime_id,
+        'case_number': f'CASE-{crime_id}',
+        'date': '2024-03-01T12:00:00',
+        'block': '001XX W MADISON ST',
+        'primary_type': 'THEFT',
+        'description': 'RETAIL THEFT',
+        'location_description': 'STORE',
+        'arrest': False,
+        'domestic': False,
+        'latitude': 41.88,
+        'longitude': -87.63,
+    }
+    record.update(overrides)
+    return record
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """`db_postgres` apuntando a un archivo SQLite nuevo (esquema creado en el primer uso)."""
+    import db_postgres
+
+    monkeypatch.setattr(db_postgres, 'SQLITE_PATH', str(tmp_path / 'crimes.db'))
+    monkeypatch.setattr(db_postgres, '_schema_ready', False)
+    monkeypatch.setattr(db_postgres, '_sqlite_local', threading.local())
+    monkeypatch.setattr(db_postgres, '_sqlite_writer', None)
+    yield db_postgres
+    reader = getattr(db_postgres._sqlite_local, 'conn', None)
+    for conn in (reader, db_postgres._sqlite_writer):
+        if conn is not None:
+            conn.close()
+
+
+@pytest.fixture
+def client(db):
+    import api
+
+    api.app.config['TESTING'] = True
+    return api.app.test_client()
@@ -0,0 +1,116 @@
+import threading
+
+import pytest
+
+import admission
+import api
+from tests.conftest import make_record
+
+NGINX = {'REMOTE_ADDR': '10.0.0.2'}
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(admission, '_buckets', {})
+    monkeypatch.setattr(admission, 'WRITE_RATE', 0.5)
+    monkeypatch.setattr(admission, 'WRITE_BURST', 2)
+    return admission
+
+
+def _post(client, records=None, forwarded_for='203.0.113.7', **kwargs):
+    headers = {'X-Forwarded-For': forwarded_for} if forwarded_for else {}
+    return client.post(
+        '/records', json=records if records is not None else [make_record('a')],
+        headers=headers, environ_base=NGINX, **kwargs,
+    )
+
+
+def test_token_bucket_returns_429_with_retry_after(client, limits):
+    assert _post(client).status_code == 200
+    assert _post(client).status_code == 200
+    resp = _post(client)
+    assert resp.status_code == 429
+    # Un token cada 2 s (WRITE_RATE = 0.5)
+    assert resp.headers['Retry-After'] == '2'
+    assert resp.get_json()['error'] == 'Write rate limit exceeded'
+    assert admission.stats()['rate_limited'] >= 1
+
+
+def test_token_bucket_refills_over_time(limits):
+    assert limits.take_token('c', now=100.0) == 0
+    assert limits.take_token('c', now=100.0) == 0
+    assert limits.take_token('c', now=100.0) == pytest.approx(2.0)
+    assert limits.take_token('c', now=102.0) == 0
+
+
+def test_buckets_are_per_client(client, limits):
+    for _ in range(2):
+        _post(client, forwarded_for='203.0.113.7')
+    assert _post(client, forwarded_for='203.0.113.7').status_code == 429
+    assert _post(client, forwarded_for='198.51.100.9').status_code == 200
+
+
+def test_forged_forwarded_for_does_not_escape_the_limit(client, limits):
+    # El cliente antepone una IP distinta en cada petición; nginx agrega la real al final
+    statuses = [
+        _post(client, forwarded_for=f'192.0.2.{i}, 203.0.113.7').status_code for i in range(3)
+    ]
+    assert statuses == [200, 200, 429]
+
+
+def test_proxy_appended_address_is_the_client_key(client, limits, monkeypatch):
+    seen = []
+    monkeypatch.setattr(admission, 'take_token', lambda key: seen.append(key) or 0.0)
+    _post(client, forwarded_for='192.0.2.1, 203.0.113.7')
+    _post(client, forwarded_for=None)
+    assert seen == ['203.0.113.7', '10.0.0.2']
+
+
+def test_write_budget_exhausted_returns_503(client, monkeypatch):
+    slots = threading.BoundedSemaphore(1)
+    monkeypatch.setattr(admission, '_write_slots', slots)
+    monkeypatch.setattr(admission, 'BUSY_RETRY_AFTER', 3)
+    slots.acquire()  # otra escritura en curso
+    try:
+        resp = _post(client)
+    finally:
+        slots.release()
+    assert resp.status_code == 503
+    assert resp.headers['Retry-After'] == '3'
+    assert _post(client).status_code == 200
+
+
+def test_write_slot_is_released_after_an_error(client, monkeypatch):
+    slots = threading.BoundedSemaphore(1)
+    monkeypatch.setattr(admission, '_write_slots', slots)
+
+    def _broken(records, mode):
+        raise RuntimeError('disk full')
+
+    monkeypatch.setattr(api.db, 'insert_crimes', _broken)
+    assert _post(client).status_code == 500
+    assert slots.acquire(blocking=False)
+    slots.release()
+
+
+def test_declared_body_over_the_limit_returns_413(client, monkeypatch):
+    monkeypatch.setattr(admission, 'MAX_BODY_BYTES', 64)
+    resp = _post(client)
+    assert resp.status_code == 413
+    assert 'max 64 bytes' in resp.get_json()['error']
+
+
+def test_flask_body_limit_returns_json_413(client, monkeypatch):
+    monkeypatch.setitem(api.app.config, 'MAX_CONTENT_LENGTH', 64)
+    resp = _post(client)
+    assert resp.status_code == 413
+    assert resp.is_json and 'Payload too large' in resp.get_json()['error']
+
+
+def test_too_many_records_returns_413(client, db, monkeypatch):
+    monkeypatch.setattr(admission, 'MAX_RECORDS_PER_REQUEST', 2)
+    resp = _post(client, [make_record(i) for i in 'abc'])
+    assert resp.status_code == 413
+    assert resp.get_json() == {'error': 'Too many records (3, max 2)'}
+    assert db.fetch_crime_by_id('a') is None
+    assert _post(client, {'records': [make_record(i) for i in 'ab']}).status_code == 200
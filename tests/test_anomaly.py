@@ -0,0 +1,89 @@
+import sqlite3
+
+import pytest
+
+import anomaly
+from tests.conftest import make_record
+
+HOUR = 3600.0
+KEY = (41.88, -87.63, 'THEFT')
+START = 1_700_000_000.0
+
+
+def _cell(timestamps):
+    cell = anomaly.new_cell()
+    for ts in timestamps:
+        anomaly.add_event(cell, ts)
+    return cell
+
+
+def _steady(days, every_h=4):
+    return [START + i * every_h * HOUR for i in range(int(days * 24 / every_h))]
+
+
+def test_cold_start_burst_is_not_flagged():
+    # Celda nueva con 6 eventos juntos: sin el calentamiento se marcaría
+    cell = _cell([START + i * 60 for i in range(6)])
+    now = START + 10 * 60
+    assert anomaly.score(cell, now)['z'] > anomaly.ANOMALY_Z
+    assert anomaly.detect([(KEY, cell)], now) == []
+    assert anomaly.detect([(KEY, cell)], now, warmup_h=0)[0]['primary_type'] == 'THEFT'
+
+
+def test_steady_rate_scores_near_zero():
+    events = _steady(days=30)
+    cell = _cell(events)
+    s = anomaly.score(cell, events[-1])
+    assert s['z'] == pytest.approx(0, abs=1)
+    assert s['ratio'] == pytest.approx(1, abs=0.35)
+    assert anomaly.detect([(KEY, cell)], events[-1]) == []
+
+
+def test_spike_over_an_established_baseline_is_flagged():
+    events = _steady(days=30)
+    spike_at = events[-1] + HOUR
+    cell = _cell(events + [spike_at + i * 60 for i in range(12)])
+    [flagged] = anomaly.detect([(KEY, cell)], spike_at + 15 * 60)
+    assert flagged['z'] >= anomaly.ANOMALY_Z
+    assert flagged['total'] == len(events) + 12
+
+
+def test_first_ts_follows_out_of_order_events():
+    cell = _cell([START + 10 * HOUR, START, START + 5 * HOUR])
+    assert cell['first_ts'] == START
+    assert cell['last_ts'] == START + 10 * HOUR
+
+
+def test_legacy_cells_without_first_ts_are_evaluated():
+    cell = _cell([START + i * 60 for i in range(6)])
+    cell['first_ts'] = None
+    assert len(anomaly.detect([(KEY, cell)], START + 10 * 60)) == 1
+
+
+def test_first_sync_of_a_fresh_db_flags_nothing(db):
+    db.insert_crimes([make_record(f'r{i}', date=f'2024-03-01T12:0{i}:00') for i in range(8)])
+    assert db.detect_anomalies()['anomalies'] == []
+    # Con historial suficiente, una ráfaga sí se marca
+    history = [
+        make_record(f'h{i}', date=f'2024-01-{1 + i // 6:02d}T{(i % 6) * 4:02d}:00:00') for i in range(6 * 28)
+    ]
+    db.insert_crimes(history)
+    db.insert_crimes([make_record(f's{i}', date=f'2024-03-01T13:{i:02d}:00') for i in range(10)])
+    [flagged] = db.detect_anomalies()['anomalies']
+    assert (flagged['latitude'], flagged['longitude'], flagged['primary_type']) == KEY
+
+
+def test_schema_adds_first_ts_to_existing_cells(tmp_path, monkeypatch, db):
+    path = tmp_path / 'legacy.db'
+    conn = sqlite3.connect(path)
+    conn.execute(
+        'CREATE TABLE crimes_anomaly_cells (lat_bin REAL NOT NULL, lon_bin REAL NOT NULL, '
+        'primary_type TEXT NOT NULL, fast REAL NOT NULL, slow REAL NOT NULL, last_ts REAL NOT NULL, '
+        'total BIGINT NOT NULL, PRIMARY KEY (lat_bin, lon_bin, primary_type))'
+    )
+    conn.execute("INSERT INTO crimes_anomaly_cells VALUES (41.88, -87.63, 'THEFT', 9, 9, ?, 9)", (START,))
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(db, 'SQLITE_PATH', str(path))
+    [flagged] = db.detect_anomalies(now=START)['anomalies']
+    assert flagged['total'] == 9
@@ -0,0 +1,78 @@
+import pytest
+
+import api
+from tests.conftest import make_record
+
+
+@pytest.fixture
+def stored(db):
+    db.insert_crimes([make_record('a'), make_record('b'), make_record('c')])
+    return db
+
+
+@pytest.mark.parametrize('path', ['/records/batch-get', '/records/batch-delete'])
+@pytest.mark.parametrize('body', [{'ids': 'a'}, {'other': ['a']}, 'a', 5, None])
+def test_batch_rejects_bodies_without_an_id_list(client, path, body):
+    resp = client.post(path, json=body)
+    assert resp.status_code == 400
+    assert 'Expected a list of ids' in resp.get_json()['error']
+
+
+@pytest.mark.parametrize('path', ['/records/batch-get', '/records/batch-delete'])
+def test_batch_rejects_non_json_body(client, path):
+    resp = client.post(path, data='a,b', content_type='text/plain')
+    assert resp.status_code == 400
+
+
+@pytest.mark.parametrize('path', ['/records/batch-get', '/records/batch-delete'])
+def test_batch_rejects_too_many_ids(client, monkeypatch, path):
+    monkeypatch.setattr(api, 'MAX_BATCH_IDS', 2)
+    resp = client.post(path, json=['a', 'b', 'c'])
+    assert resp.status_code == 413
+    assert 'max 2' in resp.get_json()['error']
+
+
+def test_batch_get_reports_found_and_missing_in_request_order(client, stored):
+    resp = client.post('/records/batch-get', json={'ids': ['c', 'zz', 'a', 'c']})
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert body['count'] == 2
+    assert [(r['id'], r['status']) for r in body['results']] == [
+        ('c', 'found'), ('zz', 'not_found'), ('a', 'found'),
+    ]
+    assert body['results'][0]['record']['primary_type'] == 'THEFT'
+
+
+def test_batch_get_empty_list(client, stored):
+    resp = client.post('/records/batch-get', json=[])
+    assert resp.status_code == 200
+    assert resp.get_json() == {'count': 0, 'results': []}
+
+
+def test_batch_delete_reports_per_id_status(client, stored):
+    resp = client.post('/records/batch-delete', json=['a', 'missing', 'b'])
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert body['deleted'] == 2
+    assert {r['id']: r['status'] for r in body['results']} == {
+        'a': 'deleted', 'missing': 'not_found', 'b': 'deleted',
+    }
+    assert stored.fetch_crimes_by_ids(['a', 'b', 'c']) == {
+        'a': None, 'b': None, 'c': stored.fetch_crime_by_id('c'),
+    }
+
+
+def test_batch_delete_twice_is_not_found(client, stored):
+    client.post('/records/batch-delete', json=['a'])
+    resp = client.post('/records/batch-delete', json=['a'])
+    assert resp.get_json() == {'deleted': 0, 'results': [{'id': 'a', 'status': 'not_found'}]}
+
+
+def test_batch_get_surfaces_backend_errors(client, monkeypatch):
+    def _broken(ids, replay=None):
+        raise RuntimeError('database is locked')
+
+    monkeypatch.setattr(api.db, 'fetch_crimes_by_ids', _broken)
+    resp = client.post('/records/batch-get', json=['a'])
+    assert resp.status_code == 500
+    assert resp.get_json() == {'error': 'database is locked'}
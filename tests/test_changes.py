@@ -0,0 +1,87 @@
+import pytest
+
+import api
+from tests.conftest import make_record
+
+
+def _sync(client, since=0, limit=2):
+    """Recorre todas las páginas como un cliente de sincronización."""
+    upserts, deletes, pages = {}, set(), 0
+    while True:
+        body = client.get('/records/changes', query_string={'since': since, 'limit': limit}).get_json()
+        pages += 1
+        for row in body['upserts']:
+            upserts[row['id']] = row
+            deletes.discard(row['id'])
+        for crime_id in body['deletes']:
+            upserts.pop(crime_id, None)
+            deletes.add(crime_id)
+        assert body['next_since'] >= since
+        since = body['next_since']
+        if not body['has_more']:
+            return upserts, deletes, since, pages
+
+
+def test_pages_are_bounded_and_chain_through_next_since(db):
+    db.insert_crimes([make_record(i) for i in 'abcde'])
+    first = db.fetch_changes(since=0, limit=2)
+    assert first['has_more'] and len(first['upserts']) == 2
+    second = db.fetch_changes(since=first['next_since'], limit=2)
+    third = db.fetch_changes(since=second['next_since'], limit=2)
+    assert not third['has_more']
+    seen = [r['id'] for page in (first, second, third) for r in page['upserts']]
+    assert sorted(seen) == list('abcde')
+    assert third['next_since'] == db.latest_change_version()
+
+
+def test_empty_page_keeps_since(db):
+    db.insert_crimes([make_record('a')])
+    latest = db.latest_change_version()
+    assert db.fetch_changes(since=latest) == {
+        'since': latest, 'next_since': latest, 'has_more': False, 'upserts': [], 'deletes': [],
+    }
+
+
+def test_repeated_upserts_collapse_to_the_current_row(db):
+    since = db.latest_change_version()
+    db.insert_crimes([make_record('a')])
+    db.insert_crimes([make_record('a', description='SHOPLIFTING')])
+    page = db.fetch_changes(since=since)
+    assert [(r['id'], r['description']) for r in page['upserts']] == [('a', 'SHOPLIFTING')]
+
+
+def test_deletes_come_back_as_tombstones(client, db):
+    db.insert_crimes([make_record(i) for i in 'abcd'])
+    since = db.latest_change_version()
+    assert client.delete('/records/a').status_code == 200
+    assert client.post('/records/batch-delete', json=['b', 'zz']).status_code == 200
+    page = client.get('/records/changes', query_string={'since': since}).get_json()
+    assert page['upserts'] == []
+    assert sorted(page['deletes']) == ['a', 'b']
+
+
+def test_sync_client_converges_to_the_table(client, db):
+    db.insert_crimes([make_record(i) for i in 'abcdef'])
+    upserts, deletes, since, pages = _sync(client)
+    assert sorted(upserts) == list('abcdef') and pages > 1
+
+    client.delete('/records/c')
+    db.insert_crimes([make_record('a', arrest=True), make_record('g')])
+    client.post('/records/batch-delete', json=['g'])
+    changed, deleted, _, _ = _sync(client, since=since)
+    assert sorted(changed) == ['a'] and changed['a']['arrest']
+    assert deleted == {'c', 'g'}
+
+
+def test_limit_is_capped(client, db, monkeypatch):
+    monkeypatch.setattr(api, 'MAX_CHANGES_PAGE', 3)
+    db.insert_crimes([make_record(i) for i in 'abcde'])
+    body = client.get('/records/changes', query_string={'limit': 100}).get_json()
+    assert len(body['upserts']) == 3 and body['has_more']
+
+
+@pytest.mark.parametrize('args', [{'since': 'yesterday'}, {'since': '1.5'}, {'limit': 'all'}])
+def test_bad_paging_values_are_rejected(client, args):
+    resp = client.get('/records/changes', query_string=args)
+    assert resp.status_code == 400
+    assert resp.get_json() == {'error': 'since and limit must be integers'}
@@ -0,0 +1,125 @@
+import time
+from datetime import datetime
+
+import pytest
+
+import clustering
+from tests.conftest import make_record
+
+# Campos que lee `UbicacionPeligrosa` en la app Android
+ANDROID_FIELDS = {
+    'id', 'latitud', 'longitud', 'tipo_crimen', 'descripcion', 'fecha', 'radio_metros', 'nivel_peligro',
+}
+
+
+def _around(prefix, lat, lon, n, primary_type='THEFT', **fields):
+    return [
+        make_record(f'{prefix}{i}', latitude=lat + i * 1e-4, longitude=lon, primary_type=primary_type, **fields)
+        for i in range(n)
+    ]
+
+
+@pytest.fixture
+def zones(db, monkeypatch):
+    monkeypatch.setattr(clustering, '_state', {
+        'loaded': False, 'loading': False, 'refreshing': False, 'load_error': None, 'since': 0,
+        'data_version': None, 'checked_at': 0.0, 'clock': 0.0, 'points': {}, 'cells': {}, 'zones': None,
+    })
+    monkeypatch.setattr(clustering, 'CLUSTER_REFRESH_S', 0)
+    return clustering
+
+
+def _load(clustering):
+    deadline = time.monotonic() + 5
+    while not clustering.warm():
+        assert time.monotonic() < deadline, 'la carga de zonas no terminó'
+        time.sleep(0.01)
+
+
+def test_zone_has_the_android_fields(db, zones):
+    db.insert_crimes(_around('a', 41.88, -87.63, 6) + _around('r', 41.8805, -87.63, 1, 'ROBBERY'))
+    _load(zones)
+    [zone] = zones.danger_zones()
+    assert ANDROID_FIELDS <= set(zone)
+    assert int(zone['id']) >= 0
+    assert zone['latitud'] == pytest.approx(41.8803, abs=1e-3)
+    assert (zone['incidentes'], zone['tipo_crimen'], zone['nivel_peligro']) == (7, 'THEFT', 'ALTO')
+    assert zone['radio_metros'] >= zones.CLUSTER_MIN_RADIUS_M
+    assert datetime.strptime(zone['fecha'], '%Y-%m-%d %H:%M:%S') == datetime(2024, 3, 1, 12)
+    assert zone['tipos_dominantes'] == [{'tipo': 'THEFT', 'cantidad': 6}, {'tipo': 'ROBBERY', 'cantidad': 1}]
+    assert zones.find_zone(zone['id']) == zone
+
+
+def test_sparse_points_form_no_zone(db, zones):
+    db.insert_crimes(_around('a', 41.88, -87.63, zones.CLUSTER_MIN_POINTS - 1))
+    _load(zones)
+    assert zones.danger_zones() == []
+
+
+def test_new_records_are_applied_incrementally(db, zones, monkeypatch):
+    db.insert_crimes(_around('a', 41.88, -87.63, 6))
+    _load(zones)
+    assert len(zones.danger_zones()) == 1
+
+    def _no_reload():
+        raise AssertionError('no debería recargar la tabla completa')
+
+    monkeypatch.setattr(zones, '_start_load', _no_reload)
+    db.insert_crimes(_around('b', 41.95, -87.70, 5, 'HOMICIDE'))
+    found = zones.danger_zones()
+    assert len(found) == 2
+    assert found[0]['tipo_crimen'] == 'HOMICIDE'  # más grave: más puntaje
+    assert [z['nivel_peligro'] for z in found] == ['ALTO', 'BAJO']
+    assert zones.stats()['points'] == 11
+
+
+def test_deletes_remove_points_and_zones(db, zones):
+    db.insert_crimes(_around('a', 41.88, -87.63, 6) + _around('b', 41.95, -87.70, 5))
+    _load(zones)
+    assert len(zones.danger_zones()) == 2
+    db.delete_crimes_by_ids(['b0', 'b1'])
+    [zone] = zones.danger_zones()
+    assert zone['incidentes'] == 6
+    assert zones.stats()['points'] == 9
+    db.delete_crimes_by_ids([f'a{i}' for i in range(6)] + ['b2', 'b3', 'b4'])
+    assert zones.danger_zones() == []
+    assert zones.stats()['cells'] == 0
+
+
+def test_moved_record_leaves_its_old_cell(db, zones):
+    db.insert_crimes(_around('a', 41.88, -87.63, 5))
+    _load(zones)
+    assert len(zones.danger_zones()) == 1
+    db.insert_crimes([make_record('a0', latitude=41.95, longitude=-87.70)])
+    assert zones.danger_zones() == []
+    assert zones.stats()['points'] == 5
+
+
+def test_refresh_reads_the_database_without_the_lock(db, zones, monkeypatch):
+    db.insert_crimes(_around('a', 41.88, -87.63, 6))
+    _load(zones)
+    held = []
+    for name in ('data_version', 'fetch_changes'):
+        real = getattr(db, name)
+
+        def _spy(*args, _real=real, **kwargs):
+            held.append(zones._lock.locked())
+            return _real(*args, **kwargs)
+
+        monkeypatch.setattr(db, name, _spy)
+    db.insert_crimes(_around('b', 41.95, -87.70, 5))
+    assert len(zones.danger_zones()) == 2
+    assert held and not any(held)
+
+
+def test_ubicaciones_endpoint(client, db, zones):
+    db.insert_crimes(_around('a', 41.88, -87.63, 6))
+    _load(zones)
+    body = client.get('/ubicaciones').get_json()
+    assert body['success'] and body['message'] is None
+    assert ANDROID_FIELDS <= set(body['data'][0])
+    zone_id = body['data'][0]['id']
+    assert client.get(f'/ubicaciones/{zone_id}').get_json()['data']['id'] == zone_id
+    assert client.get('/ubicaciones/123').status_code == 404
+    near = client.get('/ubicaciones/cercanas', query_string={'lat': 41.88, 'lng': -87.63, 'radio': 10}).get_json()
+    assert near['data'][0]['distancia_metros'] < 100
@@ -0,0 +1,69 @@
+import sqlite3
+import threading
+
+import pytest
+
+from tests.conftest import make_record
+
+
+def _counters(db):
+    stats = db.routing_stats()
+    return stats['reads'], stats['writes']
+
+
+def test_reader_connection_is_read_only(db):
+    db.insert_crimes([make_record('a')])
+    with db._sqlite_connection() as conn:
+        with pytest.raises(sqlite3.OperationalError, match='readonly'):
+            conn.execute("DELETE FROM crimes")
+    assert db.fetch_crime_by_id('a') is not None
+
+
+def test_reused_reader_sees_later_writes(db):
+    # Abre el lector de este hilo antes de escribir: debe ver el commit sin reconectar
+    assert db.fetch_crime_by_id('a') is None
+    reader = db._sqlite_local.conn
+    db.insert_crimes([make_record('a')])
+    assert db.fetch_crime_by_id('a')['id'] == 'a'
+    assert db._sqlite_local.conn is reader
+    assert db.delete_crime_by_id('a')
+    assert db.fetch_crime_by_id('a') is None
+
+
+def test_each_thread_gets_its_own_reader(db):
+    db.insert_crimes([make_record('a')])
+    readers = []
+    # Todos los hilos mantienen su lector abierto hasta que los demás leyeron
+    all_read = threading.Barrier(3)
+
+    def _read():
+        assert db.fetch_crime_by_id('a') is not None
+        readers.append(id(db._sqlite_local.conn))
+        all_read.wait()
+        db._sqlite_local.conn.close()
+
+    threads = [threading.Thread(target=_read) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(set(readers)) == 3
+    assert id(db._sqlite_writer) not in readers
+
+
+def test_writer_uses_wal(db):
+    db.insert_crimes([make_record('a')])
+    assert db.routing_stats()['journal_mode'] == 'wal'
+
+
+def test_routing_stats_count_reads_and_writes(db):
+    db.insert_crimes([make_record('a')])
+    reads, writes = _counters(db)
+    db.fetch_crime_by_id('a')
+    db.fetch_crime_by_id('a')
+    db.insert_crimes([make_record('b')])
+    after_reads, after_writes = _counters(db)
+    # routing_stats también lee (journal_mode) a través del lector
+    assert after_reads - reads == 3
+    assert after_writes - writes == 1
+    assert db.routing_stats()['backend'] == 'sqlite'
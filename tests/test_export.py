@@ -0,0 +1,173 @@
+import io
+import os
+import json
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+import export
+from tests.conftest import make_record
+
+
+@pytest.fixture
+def exports(tmp_path, monkeypatch):
+    monkeypatch.setattr(export, 'EXPORT_DIR', str(tmp_path / 'exports'))
+    monkeypatch.setattr(export, '_running', {})
+    monkeypatch.setattr(export, '_job_slots', threading.BoundedSemaphore(2))
+    return export
+
+
+@pytest.fixture
+def stored(db):
+    db.insert_crimes([
+        make_record('a', primary_type='THEFT'),
+        make_record('b', primary_type='ROBBERY', date='2024-03-02T12:00:00'),
+        make_record('c', primary_type='THEFT', latitude=None, longitude=None, date='2024-02-01T00:00:00'),
+    ])
+    return db
+
+
+def _frames(calls=None, frame=None):
+    frame = frame if frame is not None else pd.DataFrame({'id': ['x'], 'latitude': [1.0], 'longitude': [2.0]})
+
+    def _make():
+        if calls is not None:
+            calls.append(1)
+        yield frame
+
+    return _make
+
+
+def _wait(job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = export.get_job(job_id)
+        if job['status'] != 'running':
+            return job
+        assert time.monotonic() < deadline, 'el trabajo no terminó'
+        time.sleep(0.01)
+
+
+def test_csv_export_streams_filtered_rows(client, exports, stored):
+    resp = client.get('/export', query_string={'format': 'csv', 'primary_type': 'THEFT'})
+    assert resp.status_code == 200
+    assert resp.mimetype == 'text/csv'
+    df = pd.read_csv(io.BytesIO(resp.data))
+    assert df['id'].tolist() == ['a', 'c']
+    assert 'ingest_mode' not in df.columns
+
+
+def test_geojson_export_has_point_geometries(client, exports, stored):
+    resp = client.get('/export', query_string={'format': 'geojson'})
+    body = json.loads(resp.data)
+    assert body['type'] == 'FeatureCollection'
+    features = {f['properties']['id']: f for f in body['features']}
+    assert features['a']['geometry'] == {'type': 'Point', 'coordinates': [-87.63, 41.88]}
+    assert features['c']['geometry'] is None
+    assert 'latitude' not in features['a']['properties']
+
+
+def test_geojson_of_no_rows_is_valid(exports):
+    chunks = export.iter_export(iter([pd.DataFrame(columns=['id', 'latitude', 'longitude'])]), 'geojson')
+    assert json.loads(b''.join(chunks)) == {'type': 'FeatureCollection', 'features': []}
+
+
+def test_parquet_export_round_trips(exports, stored, client):
+    resp = client.post('/export/jobs', json={'format': 'parquet', 'limit': 2})
+    assert resp.status_code == 202
+    job = _wait(resp.get_json()['job_id'])
+    assert job['status'] == 'done'
+    download = client.get(f"/export/jobs/{job['job_id']}/download")
+    df = pd.read_parquet(io.BytesIO(download.data))
+    assert df['id'].tolist() == ['b', 'a']
+
+
+def test_repeated_exports_are_served_from_the_cache(exports):
+    calls = []
+    first = b''.join(export.iter_export_cached('k', _frames(calls), 'csv'))
+    second = b''.join(export.iter_export_cached('k', _frames(calls), 'csv'))
+    assert first == second and len(calls) == 1
+    assert export.export_to_file('k', _frames(calls), 'csv') == export.cache_path('k', 'csv')
+    assert len(calls) == 1
+
+
+def test_data_version_is_part_of_the_cache_key(client, exports, stored):
+    client.get('/export', query_string={'format': 'csv'})
+    stored.insert_crimes([make_record('d')])
+    df = pd.read_csv(io.BytesIO(client.get('/export', query_string={'format': 'csv'}).data))
+    assert 'd' in df['id'].tolist()
+
+
+def test_interrupted_stream_leaves_no_cache_file(exports):
+    stream = export.iter_export_cached('k', _frames(), 'csv')
+    next(stream)
+    stream.close()
+    assert not any(f.endswith('.csv') for f in os.listdir(export.EXPORT_DIR))
+
+
+def test_cached_export_job_is_done_immediately(exports):
+    export.export_to_file('k', _frames(), 'csv')
+    job = export.get_job(export.start_export_job('k', _frames(), 'csv'))
+    assert job['status'] == 'done' and job['size_bytes'] > 0
+
+
+def test_running_export_is_deduplicated_and_bounded(exports, monkeypatch):
+    monkeypatch.setattr(export, '_job_slots', threading.BoundedSemaphore(1))
+    release = threading.Event()
+
+    def _slow():
+        release.wait(5)
+        yield pd.DataFrame({'id': ['x']})
+
+    first = export.start_export_job('k', _slow, 'csv')
+    assert export.start_export_job('k', _slow, 'csv') == first
+    with pytest.raises(export.ExportBusy):
+        export.start_export_job('other', _frames(), 'csv')
+    release.set()
+    assert _wait(first)['status'] == 'done'
+    # El hueco se liberó al terminar
+    assert _wait(export.start_export_job('other', _frames(), 'csv'))['status'] == 'done'
+
+
+def test_failed_job_reports_the_error_and_frees_its_slot(exports, monkeypatch):
+    monkeypatch.setattr(export, '_job_slots', threading.BoundedSemaphore(1))
+
+    def _broken():
+        raise RuntimeError('database is locked')
+        yield  # pragma: no cover
+
+    job = _wait(export.start_export_job('k', _broken, 'csv'))
+    assert (job['status'], job['error']) == ('error', 'database is locked')
+    assert export._running == {}
+    assert export._job_slots.acquire(blocking=False)
+
+
+def test_busy_export_endpoint_returns_503(client, exports, stored, monkeypatch):
+    def _busy(*args):
+        raise export.ExportBusy('busy')
+
+    monkeypatch.setattr(export, 'start_export_job', _busy)
+    resp = client.get('/export', query_string={'format': 'csv', 'async': '1'})
+    assert resp.status_code == 503
+    assert resp.headers['Retry-After'] == '1'
+
+
+def test_pruned_export_is_reported_as_expired(client, exports, monkeypatch):
+    monkeypatch.setattr(export, 'EXPORT_CACHE_MAX_FILES', 1)
+    job_id = export.start_export_job('first', _frames(), 'csv')
+    assert _wait(job_id)['status'] == 'done'
+    time.sleep(0.01)  # mtime posterior
+    export.export_to_file('second', _frames(), 'csv')
+
+    job = export.get_job(job_id)
+    assert job['status'] == 'expired' and 'path' not in job
+    body = client.get(f'/export/jobs/{job_id}').get_json()
+    assert body['status'] == 'expired' and 'download_url' not in body
+    assert client.get(f'/export/jobs/{job_id}/download').status_code == 410
+
+
+def test_unknown_job_ids(client, exports):
+    assert client.get('/export/jobs/deadbeef').status_code == 404
+    assert client.get('/export/jobs/../../etc').status_code == 404
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import data
+
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(7)
+    n = 203  # no múltiplo de 8: ejercita el relleno de los bitmaps
+    return pd.DataFrame({
+        'primary_type': rng.choice(['THEFT', 'ROBO', 'BATTERY', None], n),
+        'arrest': rng.choice([True, False], n),
+        'domestic': rng.choice(['true', 'false'], n),
+        'district': rng.choice([1, 2, 3], n),
+        'latitude': rng.uniform(-16.45, -16.37, n),
+        'longitude': rng.uniform(-71.58, -71.50, n),
+    })
+
+
+def _expected(df, filters):
+    mask = pd.Series(True, index=df.index)
+    for column, values in filters.items():
+        if values:
+            mask &= df[column].isin(values)
+    return np.flatnonzero(mask.to_numpy())
+
+
+@pytest.mark.parametrize('filters', [
+    {'primary_type': ['THEFT']},
+    {'primary_type': ['THEFT', 'ROBO']},
+    {'primary_type': ['THEFT', 'BATTERY'], 'district': [2]},
+    {'arrest': [True], 'district': [1, 3]},
+    {'primary_type': ['ROBO'], 'arrest': [False], 'district': [3]},
+    {'primary_type': ['ARSON']},
+    {'district': [99, 2]},
+])
+def test_rows_match_equivalent_pandas_mask(frame, filters):
+    index = data.build_filter_index(frame)
+    np.testing.assert_array_equal(data.filter_index_rows(index, filters), _expected(frame, filters))
+
+
+def test_empty_filters_return_every_row(frame):
+    index = data.build_filter_index(frame)
+    np.testing.assert_array_equal(data.filter_index_rows(index, {}), np.arange(len(frame)))
+    np.testing.assert_array_equal(
+        data.filter_index_rows(index, {'primary_type': [], 'district': []}), np.arange(len(frame))
+    )
+
+
+def test_string_booleans_are_indexed_as_booleans(frame):
+    index = data.build_filter_index(frame)
+    rows = data.filter_index_rows(index, {'domestic': [True]})
+    np.testing.assert_array_equal(rows, np.flatnonzero((frame['domestic'] == 'true').to_numpy()))
+
+
+def test_nulls_are_not_indexed(frame):
+    index = data.build_filter_index(frame)
+    assert None not in data.filter_index_values(index, 'primary_type')
+    assert data.filter_index_values(index, 'primary_type') == ['BATTERY', 'ROBO', 'THEFT']
+
+
+def test_zone_filter_matches_zone_labels(frame):
+    index = data.build_filter_index(frame)
+    labels = data._zone_labels(frame)
+    zones = data.filter_index_values(index, 'zone')
+    assert zones, 'los puntos de prueba deberían caer en alguna zona'
+    for zone in zones:
+        np.testing.assert_array_equal(
+            data.filter_index_rows(index, {'zone': [zone]}),
+            np.flatnonzero((labels == zone).to_numpy()),
+        )
+
+
+def test_missing_column_filters_out_everything():
+    df = pd.DataFrame({'primary_type': ['THEFT', 'ROBO']})
+    index = data.build_filter_index(df)
+    assert data.filter_index_rows(index, {'district': [1]}).size == 0
@@ -0,0 +1,58 @@
+import pytest
+
+from tests.conftest import make_record
+
+
+def test_empty_batch_writes_nothing(db):
+    assert db.insert_crimes([]) == {'inserted': 0, 'updated': 0, 'unchanged': 0}
+
+
+def test_invalid_mode_is_rejected(db):
+    with pytest.raises(ValueError, match='Invalid ingest mode'):
+        db.insert_crimes([make_record('a')], mode='bogus')
+
+
+def test_counts_inserted_updated_and_unchanged(db):
+    first = db.insert_crimes([make_record('a'), make_record('b'), make_record('c')])
+    assert first == {'inserted': 3, 'updated': 0, 'unchanged': 0}
+
+    resync = db.insert_crimes([make_record('a'), make_record('b'), make_record('c')])
+    assert resync == {'inserted': 0, 'updated': 0, 'unchanged': 3}
+
+    mixed = db.insert_crimes([
+        make_record('a'),
+        make_record('b', description='SHOPLIFTING'),
+        make_record('d'),
+    ])
+    assert mixed == {'inserted': 1, 'updated': 1, 'unchanged': 1}
+    assert db.fetch_crime_by_id('b')['description'] == 'SHOPLIFTING'
+
+
+def test_unchanged_resync_does_not_bump_the_data_version(db):
+    db.insert_crimes([make_record('a')])
+    version = db.data_version()
+    db.insert_crimes([make_record('a')])
+    assert db.data_version() == version
+    db.insert_crimes([make_record('a', arrest=True)])
+    assert db.data_version() > version
+
+
+def test_duplicate_ids_in_one_batch_keep_the_last(db):
+    stats = db.insert_crimes([make_record('a'), make_record('a', primary_type='ROBBERY')])
+    assert stats == {'inserted': 1, 'updated': 0, 'unchanged': 0}
+    assert db.fetch_crime_by_id('a')['primary_type'] == 'ROBBERY'
+
+
+def test_changing_the_ingest_mode_counts_as_an_update(db):
+    db.insert_crimes([make_record('a')])
+    stats = db.insert_crimes([make_record('a')], mode=db.INGEST_SYNTHETIC)
+    assert stats == {'inserted': 0, 'updated': 1, 'unchanged': 0}
+
+
+def test_unchanged_rows_are_not_logged_as_changes(db):
+    db.insert_crimes([make_record('a'), make_record('b')])
+    since = db.latest_change_version()
+    db.insert_crimes([make_record('a'), make_record('b', primary_type='BATTERY')])
+    changes = db.fetch_changes(since=since)
+    assert [r['id'] for r in changes['upserts']] == ['b']
+    assert changes['deletes'] == []
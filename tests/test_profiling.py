@@ -0,0 +1,93 @@
+import os
+import time
+
+import pytest
+
+import profiling
+
+
+@pytest.fixture
+def profiles(tmp_path, monkeypatch):
+    """`profiling` sobre una carpeta vacía, apagado y sin el archivo de activación cacheado."""
+    monkeypatch.setattr(profiling, 'PROFILE_DIR', str(tmp_path))
+    monkeypatch.setattr(profiling, 'PROFILING_ENABLED', False)
+    monkeypatch.setattr(profiling, '_flag', {'value': False, 'checked_at': float('-inf')})
+    return profiling
+
+
+def _run_profiled(module, name):
+    with module.profile('script', name):
+        sum(range(1000))
+
+
+def test_flag_file_toggles_profiling(profiles):
+    flag = os.path.join(profiles.PROFILE_DIR, profiles._FLAG_FILE)
+    assert not profiles.enabled()
+    assert profiles.set_enabled(True) and os.path.exists(flag)
+    token = profiles.start()
+    assert token is not None
+    profiles.stop(token, 'script', 'activado')
+    assert not profiles.set_enabled(False) and not os.path.exists(flag)
+    assert profiles.start() is None
+    assert [p['name'] for p in profiles.list_profiles()] == ['activado']
+
+
+def test_flag_written_by_another_process_is_seen_after_the_check_interval(profiles, monkeypatch):
+    assert not profiles.enabled()
+    open(os.path.join(profiles.PROFILE_DIR, profiles._FLAG_FILE), 'w').close()
+    # Dentro del intervalo se usa el valor cacheado: desactivado cuesta una comparación
+    assert not profiles.enabled()
+    monkeypatch.setattr(profiles, '_FLAG_CHECK_S', 0.0)
+    assert profiles.enabled()
+
+
+def test_saved_profile_has_hotspots_and_a_pstats_file(profiles):
+    profiles.set_enabled(True)
+    _run_profiled(profiles, 'app.py rerun')
+    [summary] = profiles.list_profiles()
+    assert summary['kind'] == 'script' and summary['name'] == 'app.py rerun'
+    full = profiles.get_profile(summary['id'])
+    assert full['cumulative'] and full['tottime']
+    assert profiles.profile_path(summary['id']).endswith('.prof')
+    assert profiles.get_profile('../../etc/passwd') is None
+
+
+def test_nested_profiles_are_ignored(profiles):
+    profiles.set_enabled(True)
+    with profiles.profile('script', 'exterior'):
+        with profiles.profile('fragment', 'interior'):
+            pass
+    assert [p['name'] for p in profiles.list_profiles()] == ['exterior']
+
+
+def test_ring_keeps_only_the_newest_profiles(profiles, monkeypatch):
+    monkeypatch.setattr(profiles, 'PROFILE_KEEP', 3)
+    profiles.set_enabled(True)
+    for i in range(5):
+        _run_profiled(profiles, f'corrida-{i}')
+        time.sleep(0.001)
+    assert [p['name'] for p in profiles.list_profiles()] == ['corrida-4', 'corrida-3', 'corrida-2']
+    files = [n for n in os.listdir(profiles.PROFILE_DIR) if n != profiles._FLAG_FILE]
+    assert len(files) == 6 and not any(n.endswith('.tmp') for n in files)
+
+
+def test_short_runs_are_not_saved_with_min_ms(profiles, monkeypatch):
+    monkeypatch.setattr(profiles, 'PROFILE_MIN_MS', 10_000)
+    profiles.set_enabled(True)
+    _run_profiled(profiles, 'rapida')
+    assert profiles.list_profiles() == []
+
+
+def test_admin_endpoint_toggles_and_profiles_requests(profiles, client, monkeypatch):
+    import api
+
+    monkeypatch.setattr(api, 'ADMIN_API_TOKEN', 'secret')
+    headers = {'X-Admin-Token': 'secret'}
+    resp = client.post('/admin/profiling', json={'enabled': True}, headers=headers)
+    assert resp.status_code == 200 and resp.get_json()['enabled'] is True
+    client.get('/health')
+    resp = client.post('/admin/profiling', json={'enabled': False}, headers=headers)
+    assert resp.get_json()['enabled'] is False
+    names = [p['name'] for p in resp.get_json()['profiles']]
+    assert 'GET /health' in names
+    assert client.post('/admin/profiling', json={'enabled': 'si'}, headers=headers).status_code == 400
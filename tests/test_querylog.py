@@ -0,0 +1,87 @@
+import pytest
+
+import querylog
+from tests.conftest import make_record
+
+
+@pytest.fixture
+def slow_log(monkeypatch):
+    """Registra todas las sentencias como lentas y con plan, sobre un buffer vacío."""
+    monkeypatch.setattr(querylog, 'SLOW_QUERY_MS', 0.0)
+    monkeypatch.setattr(querylog, 'SLOW_QUERY_EXPLAIN', True)
+    querylog.clear()
+    yield querylog
+    querylog.clear()
+
+
+def test_params_are_replaced_by_their_type():
+    assert querylog.redact_params(('secreto', 42, None, ['a', 'b'])) == ['<str>', '<int>', None, '<list[2]>']
+    assert querylog.redact_params({'password': 'hunter2'}) == {'password': '<str>'}
+    assert querylog.redact_params(list(range(100))) == '<100 params>'
+    assert querylog.redact_params('<1000 rows>') == '<1000 rows>'
+
+
+def test_normalized_sql_drops_literals_and_collapses_placeholder_lists():
+    sql = "SELECT *\n  FROM crimes WHERE block = 'O''HARE' AND id IN (?, ?, ?)"
+    assert querylog.normalize_sql(sql) == "SELECT * FROM crimes WHERE block = '?' AND id IN (?, ...)"
+    values = 'INSERT INTO crimes VALUES (?, ?), (?, ?), (?, ?)'
+    assert querylog.normalize_sql(values) == 'INSERT INTO crimes VALUES (?, ...), ...'
+
+
+@pytest.mark.parametrize('sql, mode', [
+    ('SELECT 1', 'analyze'),
+    ('  select * from crimes', 'analyze'),
+    ('INSERT INTO crimes VALUES (?)', 'plan'),
+    ('update crimes SET arrest = ?', 'plan'),
+    ('DELETE FROM crimes', 'plan'),
+    ('WITH x AS (SELECT 1) DELETE FROM crimes', 'plan'),
+    (b'REPLACE INTO crimes VALUES (?)', 'plan'),
+    ('CREATE TABLE t (x INT)', None),
+    ('PRAGMA journal_mode', None),
+    ('', None),
+])
+def test_explain_mode_only_analyzes_selects(sql, mode):
+    assert querylog.explain_mode(sql) == mode
+
+
+def test_slow_statement_is_logged_without_values(slow_log):
+    calls = []
+    slow_log.observe(
+        "SELECT * FROM crimes WHERE id = ?", ('JB-SECRETO',), 300.0,
+        explain=lambda analyze: calls.append(analyze) or 'SCAN crimes', backend='sqlite',
+    )
+    [entry] = slow_log.recent()
+    assert entry['params'] == ['<str>'] and 'JB-SECRETO' not in str(entry)
+    assert entry['plan'] == 'SCAN crimes' and entry['plan_mode'] == 'analyze'
+    assert calls == [True]
+
+
+def test_writes_are_explained_without_analyze(slow_log):
+    calls = []
+    slow_log.observe('DELETE FROM crimes WHERE id = ?', ('a',), 300.0, explain=lambda analyze: calls.append(analyze) or '')
+    assert calls == [False] and slow_log.recent()[0]['plan_mode'] == 'plan'
+
+
+def test_each_shape_is_explained_once_per_ttl(slow_log):
+    calls = []
+    for crime_id in ('a', 'b', 'c'):
+        slow_log.observe('SELECT * FROM crimes WHERE id = ?', (crime_id,), 300.0, explain=lambda analyze: calls.append(1) or '')
+    assert len(calls) == 1
+    assert [e['plan_mode'] for e in slow_log.recent()] == [None, None, 'analyze']
+
+
+def test_explain_failure_keeps_the_entry(slow_log):
+    def broken(analyze):
+        raise RuntimeError('sin permiso')
+
+    slow_log.observe('SELECT 1', (), 300.0, explain=broken)
+    assert slow_log.recent()[0]['plan_error'] == 'sin permiso'
+
+
+def test_sqlite_statements_reach_the_log_with_a_query_plan(db, slow_log):
+    db.insert_crimes([make_record('secreto-1')])
+    slow_log.clear()
+    assert db.fetch_crime_by_id('secreto-1') is not None
+    selects = [e for e in slow_log.recent() if e['sql'].startswith('SELECT') and 'crimes' in e['sql']]
+    assert selects and selects[0]['backend'] == 'sqlite'
+    assert selects[0]['plan'] and 'secreto-1' not in str(selects[0])
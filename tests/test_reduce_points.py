@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from viz import reduce_points
+
+
+def _points(n, seed=3):
+    rng = np.random.default_rng(seed)
+    # Un cúmulo denso y puntos dispersos: las celdas escasas no deben desaparecer
+    dense = rng.normal([-16.40, -71.53], 0.002, size=(n - 20, 2))
+    sparse = rng.uniform([-16.45, -71.58], [-16.35, -71.48], size=(20, 2))
+    coords = np.vstack([dense, sparse])
+    return pd.DataFrame({'id': np.arange(n), 'latitude': coords[:, 0], 'longitude': coords[:, 1]})
+
+
+def _cells(df, grid_size, bounds):
+    (lat_min, lat_span), (lon_min, lon_span) = bounds
+    gy = np.minimum(((df['latitude'] - lat_min) / lat_span * grid_size).astype(int), grid_size - 1)
+    gx = np.minimum(((df['longitude'] - lon_min) / lon_span * grid_size).astype(int), grid_size - 1)
+    return set(gy * grid_size + gx)
+
+
+def test_under_budget_keeps_everything():
+    df = _points(50)
+    reduced, dropped = reduce_points(df, budget=50, grid_size=8)
+    assert dropped == 0
+    assert len(reduced) == 50
+    assert (reduced['weight'] == 1.0).all()
+
+
+def test_over_budget_respects_budget_and_preserves_mass():
+    df = _points(2000)
+    reduced, dropped = reduce_points(df, budget=300, grid_size=8)
+    assert len(reduced) <= 300
+    assert dropped == len(df) - len(reduced)
+    assert reduced['weight'].sum() == pytest.approx(len(df))
+    assert reduced['id'].is_unique
+
+
+def test_every_occupied_cell_keeps_a_point():
+    df = _points(2000)
+    bounds = (
+        (df['latitude'].min(), df['latitude'].max() - df['latitude'].min()),
+        (df['longitude'].min(), df['longitude'].max() - df['longitude'].min()),
+    )
+    reduced, _ = reduce_points(df, budget=300, grid_size=8)
+    assert _cells(reduced, 8, bounds) == _cells(df, 8, bounds)
+
+
+def test_reduction_is_deterministic():
+    df = _points(2000)
+    first, _ = reduce_points(df, budget=300, grid_size=8)
+    second, _ = reduce_points(df, budget=300, grid_size=8)
+    pd.testing.assert_frame_equal(first, second)
+
+
+def test_identical_coordinates_do_not_divide_by_zero():
+    df = pd.DataFrame({'latitude': [-16.4] * 100, 'longitude': [-71.5] * 100})
+    reduced, dropped = reduce_points(df, budget=10, grid_size=8)
+    assert len(reduced) == 10 and dropped == 90
+    assert reduced['weight'].sum() == pytest.approx(100)
@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from tests.conftest import make_record
+
+
+@pytest.fixture
+def mixed(db):
+    db.insert_crimes([
+        make_record('real-new', date='2024-05-01T10:00:00'),
+        make_record('real-mid', date='2024-04-01T10:00:00'),
+        make_record('real-old', date='2024-03-01T10:00:00'),
+    ])
+    db.insert_crimes([
+        make_record('syn-1', date='2023-01-01T10:00:00'),
+        make_record('syn-2', date='2023-01-02T10:00:00'),
+    ], mode=db.INGEST_SYNTHETIC)
+    return db
+
+
+def _date(row):
+    return datetime.fromisoformat(row['date'])
+
+
+def test_replay_off_returns_stored_dates(mixed):
+    rows = mixed.fetch_latest_crimes(replay=False)
+    assert [r['id'] for r in rows] == ['real-new', 'real-mid', 'real-old', 'syn-2', 'syn-1']
+    assert rows[-1]['date'] == '2023-01-01T10:00:00'
+    assert 'ingest_mode' not in rows[0]
+
+
+def test_replayed_synthetic_rows_get_fresh_dates(mixed):
+    before = datetime.utcnow()
+    rows = {r['id']: r for r in mixed.fetch_latest_crimes(replay=True)}
+    after = datetime.utcnow()
+    for crime_id in ('syn-1', 'syn-2'):
+        row = rows[crime_id]
+        assert before - timedelta(hours=2) <= _date(row) <= after - timedelta(hours=1)
+        assert before <= datetime.fromisoformat(row['updated_on']) <= after
+        assert row['year'] == _date(row).year
+    assert rows['real-new']['date'] == '2024-05-01T10:00:00'
+
+
+def test_replay_merges_by_the_replayed_date(mixed):
+    rows = mixed.fetch_latest_crimes(limit=3, replay=True)
+    ids = [r['id'] for r in rows]
+    assert sorted(ids[:2]) == ['syn-1', 'syn-2']
+    assert ids[2] == 'real-new'
+    assert [_date(r) for r in rows] == sorted((_date(r) for r in rows), reverse=True)
+
+
+def test_replay_offset_is_stable_per_row(mixed):
+    first = {r['id']: _date(r) for r in mixed.fetch_latest_crimes(replay=True) if r['id'].startswith('syn')}
+    second = {r['id']: _date(r) for r in mixed.fetch_latest_crimes(replay=True) if r['id'].startswith('syn')}
+    gap = first['syn-1'] - first['syn-2']
+    # Cada fila lee su propio "ahora": la diferencia sólo varía en microsegundos
+    assert abs((second['syn-1'] - second['syn-2']) - gap) < timedelta(seconds=1)
+
+
+def test_rows_without_ingest_mode_are_not_replayed(mixed):
+    with mixed._sqlite_connection(write=True) as conn:
+        conn.execute("UPDATE crimes SET ingest_mode = NULL WHERE id = 'real-old'")
+        conn.commit()
+    rows = {r['id']: r for r in mixed.fetch_latest_crimes(replay=True)}
+    assert rows['real-old']['date'] == '2024-03-01T10:00:00'
+
+
+def test_single_and_batch_fetch_follow_replay(mixed):
+    assert mixed.fetch_crime_by_id('syn-1', replay=False)['date'] == '2023-01-01T10:00:00'
+    assert _date(mixed.fetch_crime_by_id('syn-1', replay=True)).year >= 2024
+    found = mixed.fetch_crimes_by_ids(['syn-2', 'real-mid'], replay=True)
+    assert _date(found['syn-2']) > datetime.utcnow() - timedelta(hours=2)
+    assert found['real-mid']['date'] == '2024-04-01T10:00:00'
+
+
+def test_replay_default_comes_from_the_setting(mixed, monkeypatch, client):
+    monkeypatch.setattr(mixed, 'SYNTHETIC_REPLAY', True)
+    assert mixed.fetch_latest_crimes(limit=1)[0]['id'].startswith('syn')
+    body = client.get('/records', query_string={'limit': 1, 'replay': '0'}).get_json()
+    assert body['records'][0]['id'] == 'real-new'
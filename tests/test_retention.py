@@ -0,0 +1,150 @@
+import gzip
+import json
+import os
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+import api
+import retention
+import shared_cache
+from tests.conftest import make_record
+
+NOW = datetime(2024, 6, 1)
+
+
+@pytest.fixture
+def archive(db, tmp_path, monkeypatch):
+    archive_dir = tmp_path / 'archive'
+    archive_dir.mkdir()
+    monkeypatch.setattr(retention, 'ARCHIVE_DIR', str(archive_dir))
+    monkeypatch.setattr(retention, 'CHICAGO_DB_PATH', str(tmp_path / 'chicago.db'))
+    db.insert_crimes([
+        make_record('old-1', date='2024-01-10T08:00:00'),
+        make_record('old-2', date='2024-02-20T09:00:00', primary_type='ROBBERY'),
+        make_record('new-1', date='2024-05-30T10:00:00'),
+    ])
+    db.insert_crimes([make_record('syn-1', date='2024-01-15T10:00:00')], mode=db.INGEST_SYNTHETIC)
+    return archive_dir
+
+
+def _ids(db):
+    return sorted(r['id'] for batch in db.iter_crimes() for r in batch)
+
+
+def test_dry_run_counts_without_touching_the_db(db, archive):
+    before = db.latest_change_version()
+    result = retention.archive_cold_rows(db.INGEST_REAL, 30, now=NOW, dry_run=True)
+    assert result['would_archive'] == 2
+    assert _ids(db) == ['new-1', 'old-1', 'old-2', 'syn-1']
+    assert db.latest_change_version() == before
+    assert not any(archive.rglob('*.jsonl.gz'))
+
+
+def test_archive_round_trip(db, archive):
+    since = db.latest_change_version()
+    result = retention.archive_cold_rows(db.INGEST_REAL, 30, now=NOW)
+    assert (result['archived'], result['files']) == (2, 2)
+    # Los sintéticos tienen su propia ventana
+    assert _ids(db) == ['new-1', 'syn-1']
+    assert sorted(db.fetch_changes(since=since)['deletes']) == ['old-1', 'old-2']
+
+    parts = sorted(p.relative_to(archive).parts[:3] for p in archive.rglob('*.jsonl.gz'))
+    assert parts == [('real', '2024', '01'), ('real', '2024', '02')]
+
+    found = retention.query_archive(since='2024-02-01', until='2024-03-01', mode=db.INGEST_REAL)
+    assert found['partitions'] == 1
+    assert [(r['id'], r['primary_type']) for r in found['records']] == [('old-2', 'ROBBERY')]
+    assert len(retention.query_archive()['records']) == 2
+    assert retention.query_archive(primary_type='THEFT')['records'][0]['id'] == 'old-1'
+
+
+def test_rows_without_ingest_mode_are_archived_as_real(db, archive):
+    # Filas anteriores a los modos de ingesta: ingest_mode NULL
+    with db._sqlite_connection(write=True) as conn:
+        conn.execute("UPDATE crimes SET ingest_mode = NULL WHERE id LIKE 'old-%'")
+        conn.commit()
+    result = retention.archive_cold_rows(db.INGEST_REAL, 30, now=NOW)
+    assert result['archived'] == 2
+    assert _ids(db) == ['new-1', 'syn-1']
+
+
+def test_archive_requires_archive_dir(db, archive, monkeypatch):
+    monkeypatch.setattr(retention, 'ARCHIVE_DIR', '')
+    with pytest.raises(RuntimeError, match='ARCHIVE_DIR'):
+        retention.archive_cold_rows(db.INGEST_REAL, 30, now=NOW)
+    monkeypatch.setattr(retention, 'ARCHIVE_DIR', str(archive / 'missing'))
+    with pytest.raises(RuntimeError, match='no existe'):
+        retention.archive_cold_rows(db.INGEST_REAL, 30, now=NOW)
+    assert len(_ids(db)) == 4
+
+
+def test_run_retention_writes_the_report(db, archive, monkeypatch):
+    monkeypatch.setattr(retention, 'RETENTION_DAYS', {db.INGEST_REAL: 0, db.INGEST_SYNTHETIC: 30})
+    report = retention.run_retention(now=NOW, compact=False)
+    assert report['sources'][db.INGEST_SYNTHETIC]['archived'] == 1
+    assert db.INGEST_REAL not in report['sources']
+    assert retention.last_report()['sources'] == json.loads(json.dumps(report['sources']))
+    with gzip.open(next(archive.rglob('*.jsonl.gz')), 'rt') as f:
+        assert json.loads(f.readline())['id'] == 'syn-1'
+
+
+def test_dedupe_sqlite_table_keeps_the_last_row(tmp_path):
+    conn = sqlite3.connect(tmp_path / 'chicago.db')
+    conn.execute('CREATE TABLE crimes (id TEXT, description TEXT)')
+    conn.executemany('INSERT INTO crimes VALUES (?, ?)', [
+        ('a', 'first'), ('b', 'only'), ('a', 'second'), (None, 'x'), (None, 'y'),
+    ])
+    assert retention.dedupe_sqlite_table(conn) == 1
+    assert conn.execute("SELECT description FROM crimes WHERE id = 'a'").fetchall() == [('second',)]
+    assert conn.execute('SELECT count(*) FROM crimes WHERE id IS NULL').fetchone()[0] == 2
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute("INSERT INTO crimes VALUES ('b', 'dup')")
+    conn.close()
+
+
+@pytest.fixture
+def admin(client, monkeypatch):
+    monkeypatch.setattr(api, 'ADMIN_API_TOKEN', 'secret')
+    return client
+
+
+def test_admin_retention_is_hidden_without_a_token(client, monkeypatch):
+    monkeypatch.setattr(api, 'ADMIN_API_TOKEN', '')
+    assert client.post('/admin/retention', json={}).status_code == 404
+
+
+def test_admin_retention_rejects_a_wrong_token(admin):
+    resp = admin.post('/admin/retention', json={}, headers={'X-Admin-Token': 'nope'})
+    assert resp.status_code == 403
+
+
+def test_admin_retention_without_archive_dir_is_a_conflict(admin, db, monkeypatch):
+    monkeypatch.setattr(retention, 'ARCHIVE_DIR', '')
+    monkeypatch.setattr(retention, 'RETENTION_DAYS', {db.INGEST_REAL: 30, db.INGEST_SYNTHETIC: 0})
+    resp = admin.post('/admin/retention', json={}, headers={'X-Admin-Token': 'secret'})
+    assert resp.status_code == 409
+    assert 'ARCHIVE_DIR' in resp.get_json()['error']
+
+
+def test_admin_retention_rejects_a_bad_payload(admin):
+    resp = admin.post('/admin/retention', json={'dry_run': 'yes'}, headers={'X-Admin-Token': 'secret'})
+    assert resp.status_code == 400
+
+
+def test_admin_retention_invalidates_the_cache_after_archiving(admin, db, archive, monkeypatch):
+    monkeypatch.setattr(retention, 'RETENTION_DAYS', {db.INGEST_REAL: 30, db.INGEST_SYNTHETIC: 0})
+    bumps = []
+    monkeypatch.setattr(shared_cache, 'bump_version', lambda: bumps.append(1))
+    headers = {'X-Admin-Token': 'secret'}
+
+    resp = admin.post('/admin/retention', json={'dry_run': True}, headers=headers)
+    assert resp.status_code == 200 and bumps == []
+
+    # Sin `now`, el corte es hoy: todas las filas reales son antiguas
+    resp = admin.post('/admin/retention', json={'compact': False}, headers=headers)
+    assert resp.status_code == 200
+    assert resp.get_json()['report']['sources']['real']['archived'] == 3
+    assert bumps == [1]
+    assert os.path.exists(archive / 'retention_report.json')
@@ -0,0 +1,75 @@
+import pytest
+
+from tests.conftest import make_record
+
+
+@pytest.fixture(params=['fts', 'like'])
+def stored(request, db, monkeypatch):
+    db.insert_crimes([
+        make_record('a', description='ROBO AGRAVADO', block='CALLE MERCADERES',
+                    date='2024-03-01T10:00:00'),
+        make_record('b', description='ROBO AL PASO', block='AV EJERCITO',
+                    date='2024-03-02T10:00:00'),
+        make_record('c', description='HURTO SIMPLE', block='CALLE MERCADERES',
+                    location_description='MERCADO', date='2024-03-03T10:00:00'),
+        make_record('d', description='RETAIL THEFT', date='2024-03-04T10:00:00'),
+    ])
+    if request.param == 'like':
+        # Builds de SQLite sin FTS5: la búsqueda cae en LIKE sobre las mismas columnas
+        monkeypatch.setattr(db, '_sqlite_fts', False)
+    else:
+        assert db._sqlite_fts, 'este SQLite no tiene FTS5'
+    return db
+
+
+def _ids(result):
+    return sorted(r['id'] for r in result['records'])
+
+
+def test_every_word_must_match(stored):
+    assert _ids(stored.search_crimes('robo')) == ['a', 'b']
+    assert _ids(stored.search_crimes('robo mercaderes')) == ['a']
+    assert _ids(stored.search_crimes('robo inexistente')) == []
+
+
+def test_prefix_and_case_insensitive_match(stored):
+    assert _ids(stored.search_crimes('Merca')) == ['a', 'c']
+    assert _ids(stored.search_crimes('HURT')) == ['c']
+
+
+def test_matches_any_search_column(stored):
+    assert _ids(stored.search_crimes('mercado')) == ['c']
+    assert _ids(stored.search_crimes('theft')) == ['a', 'b', 'c', 'd']
+
+
+def test_total_counts_every_match_across_pages(stored):
+    first = stored.search_crimes('theft', limit=3, offset=0)
+    rest = stored.search_crimes('theft', limit=3, offset=3)
+    assert first['total'] == rest['total'] == 4
+    assert len(first['records']) == 3 and len(rest['records']) == 1
+    assert not {r['id'] for r in first['records']} & {r['id'] for r in rest['records']}
+
+
+def test_query_without_words_returns_nothing(stored):
+    assert stored.search_crimes('  -- !! ') == {'total': 0, 'records': []}
+
+
+def test_search_endpoint(client, stored):
+    resp = client.get('/records/search', query_string={'q': 'robo', 'limit': 1})
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert (body['total'], body['count'], body['limit'], body['offset']) == (2, 1, 1, 0)
+
+
+@pytest.mark.parametrize('args', [{}, {'q': '   '}])
+def test_search_endpoint_requires_q(client, args):
+    resp = client.get('/records/search', query_string=args)
+    assert resp.status_code == 400
+    assert resp.get_json() == {'error': 'Missing query parameter q'}
+
+
+@pytest.mark.parametrize('args', [{'limit': 'ten'}, {'offset': '1.5'}])
+def test_search_endpoint_rejects_bad_paging(client, args):
+    resp = client.get('/records/search', query_string={'q': 'robo', **args})
+    assert resp.status_code == 400
+    assert resp.get_json() == {'error': 'limit and offset must be integers'}
@@ -0,0 +1,129 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import session_store
+
+_FRAME_BYTES = 1000 * 8 + 132  # 1000 float64 más el RangeIndex
+_current = {'sid': 'sesion-a'}
+
+
+def _use(sid):
+    """Cambia la sesión de Streamlit "actual" que ve `session_store`."""
+    _current['sid'] = sid
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """Almacén vacío con presupuestos chicos; la sesión actual se elige con `_use`."""
+    _use('sesion-a')
+    monkeypatch.setattr(session_store, 'session_id', lambda: _current['sid'])
+    monkeypatch.setattr(session_store, '_sessions', {})
+    monkeypatch.setattr(session_store, '_shared', {})
+    monkeypatch.setattr(session_store, '_counters', {'spills': 0, 'loads': 0, 'reaped_sessions': 0})
+    monkeypatch.setattr(session_store, 'SESSION_SPILL_DIR', str(tmp_path))
+    # Caben dos DataFrames de prueba por sesión y cinco en todo el proceso
+    monkeypatch.setattr(session_store, 'SESSION_MEMORY_MB', 2.5 * _FRAME_BYTES / session_store._MB)
+    monkeypatch.setattr(session_store, 'SESSION_STORE_MB', 5.5 * _FRAME_BYTES / session_store._MB)
+    return session_store
+
+
+def _frame(value):
+    return pd.DataFrame({'x': np.full(1000, float(value))})
+
+
+def _where(store, sid, key):
+    entry = store._sessions[sid]['frames'][key]
+    return 'memoria' if entry['frame'] is not None else 'disco'
+
+
+def test_frame_bytes_matches_the_fixture_size():
+    assert session_store.frame_bytes(_frame(0)) == _FRAME_BYTES
+
+
+def test_least_recently_used_frame_spills_over_the_session_budget(store, tmp_path):
+    store.put('a', _frame(1))
+    store.put('b', _frame(2))
+    store.get('a')
+    store.put('c', _frame(3))
+    # 'b' era el menos usado: baja a disco; 'c' (recién guardado) nunca se baja
+    assert [_where(store, 'sesion-a', k) for k in 'abc'] == ['memoria', 'disco', 'memoria']
+    assert len(os.listdir(tmp_path)) == 1 and store._counters['spills'] == 1
+
+
+def test_get_reloads_a_spilled_frame_transparently(store, tmp_path):
+    for i, key in enumerate('abc'):
+        store.put(key, _frame(i))
+    assert _where(store, 'sesion-a', 'a') == 'disco'
+    pd.testing.assert_frame_equal(store.get('a'), _frame(0))
+    assert store._counters['loads'] == 1
+    # Al volver a memoria se baja otro para seguir dentro del presupuesto
+    assert [_where(store, 'sesion-a', k) for k in 'abc'] == ['memoria', 'disco', 'memoria']
+    assert len(os.listdir(tmp_path)) == 1
+    assert store.get('falta') is None
+
+
+def test_store_budget_spills_idle_sessions_first(store):
+    _use('inactiva')
+    store.put('a', _frame(1))
+    store.put('b', _frame(2))
+    _use('activa')
+    store.put('a', _frame(3))
+    store.put('b', _frame(4))
+    assert all(_where(store, 'inactiva', k) == 'memoria' for k in 'ab')
+    store.put('c', _frame(5))  # la sesión activa baja su propio 'a' (presupuesto por sesión)
+    _use('otra')
+    store.put('a', _frame(6))
+    store.put('b', _frame(7))
+    # Seis en memoria superan el total del proceso: cede la sesión inactiva hace más tiempo
+    assert _where(store, 'inactiva', 'a') == 'disco'
+    assert _where(store, 'activa', 'b') == 'memoria' and _where(store, 'otra', 'b') == 'memoria'
+    stats = store.stats()
+    assert stats['memory_mb'] <= store.SESSION_STORE_MB and stats['spills'] == 2
+
+
+def test_intern_shares_one_frame_and_it_does_not_count_per_session(store):
+    builds = []
+
+    def build():
+        builds.append(1)
+        return _frame(9)
+
+    _use('uno')
+    shared = store.intern('huella', build)
+    store.put('combinado', shared, shared_key='huella')
+    _use('dos')
+    assert store.intern('huella', build) is shared
+    store.put('combinado', shared, shared_key='huella')
+    store.put('a', _frame(1))
+    store.put('b', _frame(2))
+    assert builds == [1]
+    assert store.get('combinado') is shared
+    # El compartido no ocupa presupuesto de la sesión: 'a' y 'b' siguen en memoria
+    assert _where(store, 'dos', 'a') == 'memoria' and _where(store, 'dos', 'b') == 'memoria'
+    assert store.stats()['shared_frames'] == 1
+
+
+def test_shared_frames_are_released_when_unused(store):
+    store.intern('usada', lambda: _frame(0))
+    store.put('combinado', store._shared['usada']['frame'], shared_key='usada')
+    for i in range(store._MAX_SHARED + 2):
+        store.intern(f'suelta-{i}', lambda: _frame(i))
+    # Las sueltas más viejas salen del pool; la que una sesión usa se conserva
+    assert len(store._shared) == store._MAX_SHARED + 1
+    assert 'usada' in store._shared and 'suelta-0' not in store._shared
+    assert store.drop('combinado') and 'usada' not in store._shared
+    assert not store.drop('combinado')
+
+
+def test_replacing_or_dropping_a_session_removes_its_spill_files(store, tmp_path):
+    for i, key in enumerate('abc'):
+        store.put(key, _frame(i))
+    assert len(os.listdir(tmp_path)) == 1
+    # El 'a' bajado se reemplaza (su archivo se borra) y para hacerle lugar baja 'b'
+    store.put('a', _frame(10))
+    assert len(os.listdir(tmp_path)) == 1 and _where(store, 'sesion-a', 'b') == 'disco'
+    store._drop_session('sesion-a')
+    assert os.listdir(tmp_path) == [] and 'sesion-a' not in store._sessions
@@ -0,0 +1,88 @@
+import pytest
+
+import shared_cache
+from tests.conftest import make_record
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(shared_cache, 'SHARED_CACHE_ENABLED', True)
+    monkeypatch.setattr(shared_cache, 'SHARED_CACHE_PATH', str(tmp_path / 'cache'))
+    monkeypatch.setattr(shared_cache, 'SHARED_CACHE_SLOTS', 4)
+    monkeypatch.setattr(shared_cache, 'SHARED_CACHE_SLOT_BYTES', 4096)
+    monkeypatch.setattr(shared_cache, '_state', None)
+    monkeypatch.setattr(shared_cache, '_stats', {'hits': 0, 'misses': 0, 'stores': 0, 'too_large': 0})
+    yield shared_cache
+    state = shared_cache._state
+    if state and state['mm'] is not None:
+        state['mm'].close()
+
+
+def test_put_then_get(cache):
+    assert cache.put('k', b'{"a": 1}', cache.current_version())
+    assert cache.get('k') == b'{"a": 1}'
+    assert cache.get('other') is None
+    assert cache.stats()['worker']['hits'] == 1
+
+
+def test_bump_version_invalidates_every_entry(cache):
+    cache.put('k', b'old', cache.current_version())
+    cache.bump_version()
+    assert cache.get('k') is None
+
+
+def test_fill_computed_before_a_write_is_born_stale(cache):
+    version = cache.current_version()
+    cache.bump_version()  # una escritura mientras se calculaba el valor
+    cache.put('k', b'stale', version)
+    assert cache.get('k') is None
+
+
+def test_entries_expire(cache):
+    cache.put('k', b'v', cache.current_version(), ttl=-1)
+    assert cache.get('k') is None
+
+
+def test_oversize_entries_are_not_stored(cache):
+    assert not cache.put('k', b'x' * 4096, cache.current_version())
+    assert cache.get('k') is None
+    assert cache.stats()['worker']['too_large'] == 1
+
+
+def test_reader_skips_a_slot_being_written(cache):
+    cache.put('k', b'v', cache.current_version())
+    mm = cache._state['mm']
+    offset = cache._slot_offset(cache._key_hash('k'))
+    seq = cache._U64.unpack_from(mm, offset)[0]
+    # Secuencia impar: un escritor está a mitad de la ranura
+    cache._U64.pack_into(mm, offset, seq + 1)
+    assert cache.get('k') is None
+    cache._U64.pack_into(mm, offset, seq + 2)
+    assert cache.get('k') == b'v'
+
+
+def test_new_process_state_sees_the_same_file(cache):
+    cache.put('k', b'shared', cache.current_version())
+    cache._state['mm'].close()
+    cache._state = None
+    assert cache.get('k') == b'shared'
+
+
+def test_default_path_depends_on_the_database(monkeypatch, db, tmp_path):
+    monkeypatch.setattr(shared_cache, 'SHARED_CACHE_PATH', '')
+    first = shared_cache.cache_path()
+    monkeypatch.setattr(db, 'SQLITE_PATH', str(tmp_path / 'other.db'))
+    assert shared_cache.cache_path() != first
+    monkeypatch.setattr(shared_cache, 'SHARED_CACHE_PATH', '/tmp/explicit')
+    assert shared_cache.cache_path() == '/tmp/explicit'
+
+
+def test_writes_outside_the_api_invalidate_cached_responses(cache, client, db):
+    db.insert_crimes([make_record('a')])
+    assert client.get('/records').headers['X-Cache'] == 'MISS'
+    assert client.get('/records').headers['X-Cache'] == 'HIT'
+    # Escritura directa a la base (panel, loadgen): no pasa por bump_version
+    db.insert_crimes([make_record('b')])
+    resp = client.get('/records')
+    assert resp.headers['X-Cache'] == 'MISS'
+    assert resp.get_json()['count'] == 2
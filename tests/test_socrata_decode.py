@@ -0,0 +1,96 @@
+import math
+
+import pandas as pd
+import pytest
+
+import data
+import sources
+
+
+def _socrata(crime_id, **fields):
+    record = {
+        'id': crime_id,
+        'date': '2024-03-01T12:30:00.000',
+        'updated_on': '2024-03-02T08:00:00.000',
+        'primary_type': 'THEFT',
+        'arrest': False,
+        'latitude': '41.88',
+        'longitude': '-87.63',
+        'location': {'latitude': '41.88', 'longitude': '-87.63', 'human_address': '{}'},
+    }
+    record.update(fields)
+    return record
+
+
+def test_empty_response_has_the_schema_columns():
+    df = data._records_to_dataframe([])
+    assert df.empty and list(df.columns) == data.SCHEMA_COLUMNS
+
+
+def test_decodes_into_typed_schema_columns():
+    df = data._records_to_dataframe([_socrata('1'), _socrata('2', ward='42')])
+    assert list(df.columns) == data.SCHEMA_COLUMNS
+    assert df['date'].tolist() == [pd.Timestamp('2024-03-01 12:30:00')] * 2
+    assert df['latitude'].dtype == float and df['latitude'].tolist() == [41.88, 41.88]
+    # Campos que sólo trae una fila quedan en None en las demás
+    assert df['ward'].tolist() == [None, '42']
+    assert isinstance(df['location'][0], str)
+
+
+def test_dates_outside_the_socrata_format_fall_back_to_iso8601():
+    df = data._records_to_dataframe([
+        _socrata('1', date='2024-03-01T12:30:00'),
+        _socrata('2', date='2024-03-01'),
+        _socrata('3', date='not a date'),
+        _socrata('4', date=None),
+    ])
+    assert df['date'][0] == pd.Timestamp('2024-03-01 12:30:00')
+    assert df['date'][1] == pd.Timestamp('2024-03-01')
+    assert pd.isna(df['date'][2]) and pd.isna(df['date'][3])
+
+
+def test_coordinates_come_from_location_when_missing():
+    location = {'latitude': '41.9', 'longitude': '-87.7'}
+    df = data._records_to_dataframe([
+        _socrata('1', latitude=None, longitude=None, location=location),
+        _socrata('2', latitude='bad', location=None),
+    ])
+    assert df['latitude'][0] == pytest.approx(41.9)
+    assert df['longitude'][0] == pytest.approx(-87.7)
+    assert math.isnan(df['latitude'][1])
+    assert df['longitude'][1] == pytest.approx(-87.63)
+    assert df['location'][1] is None
+
+
+class _Response:
+    def __init__(self, records):
+        self.records = records
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.records
+
+
+def test_source_pages_and_advances_the_watermark(monkeypatch):
+    pages = [
+        [_socrata('1', updated_on='2024-03-02T08:00:00.000'),
+         _socrata('2', updated_on='2024-03-05T09:15:00.250')],
+        [_socrata('3', updated_on='2024-03-04T00:00:00.000')],
+    ]
+    calls = []
+
+    def _get(url, params, timeout):
+        calls.append(params)
+        return _Response(pages[len(calls) - 1])
+
+    monkeypatch.setattr(sources, 'SOCRATA_PAGE_SIZE', 2)
+    monkeypatch.setattr('requests.get', _get)
+    source = sources.SocrataSource('chicago', 'http://portal.test', 10, data._records_to_dataframe)
+
+    batches = list(source.iter_batches('2024-03-01T00:00:00.000'))
+    assert [len(df) for df, _ in batches] == [2, 1]
+    assert [mark for _, mark in batches] == ['2024-03-05T09:15:00.250'] * 2
+    assert calls[0]['$where'] == "updated_on > '2024-03-01T00:00:00.000'"
+    assert [c['$offset'] for c in calls] == [0, 2]
@@ -0,0 +1,199 @@
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+import pandas as pd
+import pytest
+
+import data
+import sources
+
+
+@pytest.fixture(autouse=True)
+def fresh_states(monkeypatch):
+    """Cada prueba parte sin fuentes cacheadas en el proceso."""
+    monkeypatch.setattr(sources, '_states', {})
+
+
+def _drain(adapter, watermark=None):
+    batches = []
+    for batch, watermark in adapter.iter_batches(watermark):
+        batches.append(batch)
+    frame = adapter.merge(None, batches)
+    return frame, watermark
+
+
+def _write_csv(path, rows):
+    pd.DataFrame(rows).to_csv(path, index=False)
+
+
+def test_file_drop_normalizes_portal_headers(tmp_path):
+    _write_csv(tmp_path / 'a.csv', [
+        {'ID': '1', 'Primary Type': 'THEFT', 'Date': '01/02/2024 10:00:00 PM', 'Arrest': 'true'},
+    ])
+    adapter = sources.FileDropSource('archivos', str(tmp_path), data._records_to_dataframe)
+    frame, _ = _drain(adapter)
+    row = frame.iloc[0]
+    assert row['id'] == '1' and row['primary_type'] == 'THEFT'
+    assert row['date'] == pd.Timestamp('2024-01-02 22:00:00')
+    assert row['arrest'] is True
+
+
+def test_file_drop_watermark_only_reads_new_or_modified_files(tmp_path, monkeypatch):
+    _write_csv(tmp_path / 'a.csv', [{'ID': '1'}])
+    _write_csv(tmp_path / 'b.csv', [{'ID': '2'}])
+    adapter = sources.FileDropSource('archivos', str(tmp_path), data._records_to_dataframe)
+    _, watermark = _drain(adapter)
+    assert set(watermark) == {'a.csv', 'b.csv'}
+
+    read = []
+    original = adapter._read
+    monkeypatch.setattr(adapter, '_read', lambda path: read.append(os.path.basename(path)) or original(path))
+    frame, same = _drain(adapter, watermark)
+    assert read == [] and frame.empty and same == watermark
+
+    _write_csv(tmp_path / 'b.csv', [{'ID': '2'}, {'ID': '3'}])
+    _write_csv(tmp_path / 'c.csv', [{'ID': '4'}])
+    frame, watermark = _drain(adapter, watermark)
+    assert sorted(read) == ['b.csv', 'c.csv']
+    assert sorted(frame['id']) == ['2', '3', '4']
+
+
+def test_unreadable_file_is_retried_and_reported_until_it_reads(tmp_path, monkeypatch, caplog):
+    _write_csv(tmp_path / 'a.csv', [{'ID': '1'}])
+    adapter = sources.FileDropSource('archivos', str(tmp_path), data._records_to_dataframe)
+    original = adapter._read
+    failing = {'on': True}
+
+    def flaky_read(path):
+        if failing['on']:
+            raise ValueError('archivo truncado')
+        return original(path)
+
+    monkeypatch.setattr(adapter, '_read', flaky_read)
+    with caplog.at_level('WARNING', logger=sources.logger.name):
+        frame, watermark = _drain(adapter)
+        assert frame.empty
+        assert adapter.problems(watermark) == ['no se pudo leer a.csv: archivo truncado']
+        # El mismo archivo sin cambios se vuelve a intentar, pero el aviso no se repite
+        frame, watermark = _drain(adapter, watermark)
+        assert frame.empty and adapter.problems(watermark)
+    assert len([r for r in caplog.records if 'a.csv' in r.getMessage()]) == 1
+
+    failing['on'] = False
+    frame, watermark = _drain(adapter, watermark)
+    assert frame['id'].tolist() == ['1']
+    assert adapter.problems(watermark) == []
+
+
+def test_webhook_spool_watermark_is_the_last_file(tmp_path):
+    assert sources.spool_webhook([], str(tmp_path)) == 0
+    assert sources.spool_webhook({'records': [{'id': '1'}, {'id': '2'}]}, str(tmp_path)) == 2
+    adapter = sources.WebhookSpoolSource('webhook', str(tmp_path), data._records_to_dataframe)
+    frame, watermark = _drain(adapter)
+    assert sorted(frame['id']) == ['1', '2']
+    assert watermark == sorted(os.listdir(tmp_path))[-1]
+
+    frame, same = _drain(adapter, watermark)
+    assert frame.empty and same == watermark
+
+    assert sources.spool_webhook({'id': '3'}, str(tmp_path)) == 1
+    frame, newer = _drain(adapter, watermark)
+    assert frame['id'].tolist() == ['3'] and newer > watermark
+
+
+def test_merge_keeps_the_newest_version_of_each_id():
+    adapter = sources.SourceAdapter()
+    previous = pd.DataFrame({'id': ['1', '2'], 'primary_type': ['THEFT', 'THEFT']})
+    new = pd.DataFrame({'id': ['2', '3'], 'primary_type': ['ROBBERY', 'BATTERY']})
+    merged = adapter.merge(previous, [new]).set_index('id')['primary_type'].to_dict()
+    assert merged == {'1': 'THEFT', '2': 'ROBBERY', '3': 'BATTERY'}
+    assert adapter.merge(previous, [pd.DataFrame()]) is previous
+
+
+class _StubSource(sources.SourceAdapter):
+    def __init__(self, name, ids, release=None, fail=False):
+        self.name = name
+        self.ids = ids
+        self.release = release
+        self.fail = fail
+        self.timeout = 0.2
+        self.refresh_interval = 0.0
+
+    def iter_batches(self, watermark):
+        if self.release is not None:
+            self.release.wait(5)
+        if self.fail:
+            raise RuntimeError('portal caído')
+        yield pd.DataFrame({'id': self.ids}), (watermark or 0) + 1
+
+
+def test_collect_does_not_wait_for_a_slow_source():
+    release = threading.Event()
+    slow = _StubSource('lenta', ['s1'], release=release)
+    fast = _StubSource('rapida', ['f1'])
+    started = time.monotonic()
+    results = sources.collect([slow, fast])
+    assert time.monotonic() - started < 2
+    assert results['rapida']['frame']['id'].tolist() == ['f1']
+    assert results['lenta']['frame'] is None and results['lenta']['pending']
+
+    release.set()
+    results = sources.collect([slow, fast], force=True)
+    assert results['lenta']['frame']['id'].tolist() == ['s1']
+    assert results['lenta']['revision'] == 1 and not results['lenta']['pending']
+
+
+def test_collect_keeps_the_previous_frame_when_a_source_fails():
+    source = _StubSource('portal', ['1'])
+    first = sources.collect([source])['portal']
+    assert first['frame']['id'].tolist() == ['1'] and first['error'] is None
+
+    source.fail = True
+    failed = sources.collect([source], force=True)['portal']
+    assert failed['frame']['id'].tolist() == ['1'] and failed['revision'] == 1
+    assert failed['error'] == 'portal caído' and failed['error_at'] is not None
+
+    [row] = sources.status()
+    assert row['fuente'] == 'portal' and row['filas'] == 1 and row['error'] == 'portal caído'
+    assert not row['en_curso']
+
+
+def test_collect_surfaces_unreadable_files_in_the_source_error(tmp_path):
+    (tmp_path / 'roto.parquet').write_bytes(b'no es parquet')
+    _write_csv(tmp_path / 'bueno.csv', [{'ID': '1'}])
+    adapter = sources.FileDropSource('archivos', str(tmp_path), data._records_to_dataframe)
+    result = sources.collect([adapter], force=True)['archivos']
+    assert result['frame']['id'].tolist() == ['1']
+    assert result['error'].startswith('no se pudo leer roto.parquet')
+
+    pd.DataFrame({'ID': ['2']}).to_parquet(tmp_path / 'roto.parquet')
+    result = sources.collect([adapter], force=True)['archivos']
+    assert sorted(result['frame']['id']) == ['1', '2'] and result['error'] is None
+
+
+def test_session_sources_are_not_cached():
+    frame = pd.DataFrame({'id': ['a']})
+    results = sources.collect([sources.SessionFrameSource('arequipa', frame)])
+    assert results['arequipa']['frame'] is frame and not results['arequipa']['shared']
+    assert sources.status() == []
+
+
+class _InlineExecutor:
+    """Ejecuta la consulta dentro de `submit`: el future ya está terminado al registrar el callback."""
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+def test_collect_handles_a_query_that_finishes_before_its_callback(monkeypatch):
+    monkeypatch.setattr(sources, '_executor', _InlineExecutor())
+    results = {}
+    worker = threading.Thread(target=lambda: results.update(sources.collect([_StubSource('rapida', ['f1'])])), daemon=True)
+    worker.start()
+    worker.join(5)
+    assert not worker.is_alive(), 'collect quedó bloqueado en su propio candado'
+    assert results['rapida']['frame']['id'].tolist() == ['f1']
@@ -0,0 +1,76 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import tracing
+from tests.conftest import make_record
+
+
+def _by_name(finished):
+    return {s['name']: s for s in finished['spans']}
+
+
+def _ancestors(finished, span):
+    parents = {s['id']: s for s in finished['spans']}
+    chain = []
+    while span['parent'] is not None:
+        span = parents[span['parent']]
+        chain.append(span['name'])
+    return chain
+
+
+def test_spans_nest_under_the_current_span():
+    with tracing.trace('raiz', trace_id='prueba-anidada'):
+        with tracing.span('etapa', filas=3):
+            started = time.perf_counter()
+            tracing.record('db.query', started, sql='SELECT 1')
+        with tracing.span('otra'):
+            pass
+    finished = tracing.get('prueba-anidada')
+    spans = _by_name(finished)
+    assert spans['raiz']['parent'] is None
+    assert spans['etapa']['parent'] == spans['raiz']['id'] and spans['etapa']['attrs'] == {'filas': 3}
+    assert spans['db.query']['parent'] == spans['etapa']['id']
+    assert spans['otra']['parent'] == spans['raiz']['id']
+
+
+def test_bind_carries_the_trace_into_a_worker_thread():
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        with tracing.trace('raiz', trace_id='prueba-hilos'):
+            with tracing.span('envio'):
+                pool.submit(tracing.bind(lambda: tracing.record('en.hilo', time.perf_counter()))).result()
+            # Sin bind el hilo no ve la traza
+            pool.submit(lambda: tracing.record('perdido', time.perf_counter())).result()
+    spans = _by_name(tracing.get('prueba-hilos'))
+    assert spans['en.hilo']['parent'] == spans['envio']['id']
+    assert spans['en.hilo']['thread'] != spans['envio']['thread']
+    assert 'perdido' not in spans
+
+
+def test_calls_outside_a_trace_do_nothing():
+    before = tracing.recent()
+    with tracing.span('suelto'):
+        tracing.record('suelto.db', time.perf_counter())
+    assert not tracing.active() and tracing.recent() == before
+
+
+def test_request_trace_reaches_the_database_cursor(client):
+    client.post('/records', json=[make_record('a'), make_record('b')])
+    resp = client.get('/records?limit=5', headers={tracing.TRACE_HEADER: 'cliente-1234'})
+    assert resp.status_code == 200
+    assert resp.headers[tracing.TRACE_HEADER] == 'cliente-1234'
+
+    finished = tracing.get('cliente-1234')
+    spans = _by_name(finished)
+    root = finished['spans'][0]
+    assert root['name'] == 'GET /records' and root['attrs']['status'] == 200
+    assert spans['build']['parent'] == root['id']
+    queries = [s for s in finished['spans'] if s['name'] == 'db.query']
+    assert queries and any('crimes' in q['attrs']['sql'] for q in queries)
+    # El cursor de SQLite registra sus tiempos dentro de la etapa que lo llamó
+    assert any(_ancestors(finished, q)[-2:] == ['build', 'GET /records'] for q in queries)
+
+
+def test_invalid_client_trace_ids_are_replaced(client):
+    resp = client.get('/health', headers={tracing.TRACE_HEADER: 'no válido!'})
+    assert resp.headers[tracing.TRACE_HEADER] != 'no válido!'
+    assert tracing.get(resp.headers[tracing.TRACE_HEADER]) is not None
@@ -0,0 +1,72 @@
+from datetime import datetime
+
+import pytest
+
+from tests.conftest import make_record
+from validation import validate_records
+
+
+def _reasons(records):
+    valid, errors = validate_records(records)
+    return valid, {e['index']: e['errors'] for e in errors}
+
+
+def test_empty_batch():
+    assert validate_records([]) == ([], [])
+
+
+def test_valid_rows_are_normalized():
+    valid, errors = validate_records([make_record(
+        ' a ', primary_type=' theft ', arrest='yes', domestic='0',
+        latitude='41.9', longitude=-87.6, year='2024.0',
+    )])
+    assert errors == []
+    [row] = valid
+    assert row['id'] == 'a'
+    assert row['primary_type'] == 'THEFT'
+    assert row['arrest'] is True and row['domestic'] is False
+    assert row['latitude'] == pytest.approx(41.9)
+    assert row['year'] == 2024 and isinstance(row['year'], int)
+    assert row['date'] == datetime(2024, 3, 1, 12, 0)
+
+
+def test_missing_optional_fields_become_none():
+    valid, errors = validate_records([{'id': 'a'}])
+    assert errors == []
+    assert valid[0]['date'] is None and valid[0]['latitude'] is None
+
+
+@pytest.mark.parametrize('overrides, field, message', [
+    ({'id': None}, 'id', 'missing id'),
+    ({'id': '  '}, 'id', 'missing id'),
+    ({'date': '01/03/2024'}, 'date', 'invalid ISO 8601 datetime'),
+    ({'updated_on': 'yesterday'}, 'updated_on', 'invalid ISO 8601 datetime'),
+    ({'arrest': 'maybe'}, 'arrest', 'expected a boolean'),
+    ({'latitude': 'north'}, 'latitude', 'expected a number'),
+    ({'latitude': 91}, 'latitude', 'out of range [-90.0, 90.0]'),
+    ({'longitude': -181}, 'longitude', 'out of range [-180.0, 180.0]'),
+    ({'year': 2024.5}, 'year', 'expected an integer'),
+    ({'year': 'soon'}, 'year', 'expected an integer'),
+    ({'primary_type': 'JAYWALKING'}, 'primary_type', 'unknown primary_type'),
+])
+def test_reject_reasons(overrides, field, message):
+    valid, reasons = _reasons([make_record('a', **overrides)])
+    assert valid == []
+    assert reasons == {0: {field: message}}
+
+
+def test_non_object_rows_are_rejected():
+    valid, errors = validate_records(['a', make_record('b')])
+    assert [r['id'] for r in valid] == ['b']
+    assert errors == [{'index': 0, 'id': None, 'errors': {'record': 'expected a JSON object'}}]
+
+
+def test_one_bad_row_does_not_reject_the_batch():
+    records = [make_record('a'), make_record('b', latitude=200, arrest='?'), make_record('c')]
+    valid, errors = validate_records(records)
+    assert [r['id'] for r in valid] == ['a', 'c']
+    assert errors == [{
+        'index': 1,
+        'id': 'b',
+        'errors': {'latitude': 'out of range [-90.0, 90.0]', 'arrest': 'expected a boolean'},
+    }]
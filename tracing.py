@@ -0,0 +1,340 @@
+"""Trazas ligeras de extremo a extremo: dashboard, API y base de datos.
+
+Una traza es un árbol de spans (etapas con nombre, inicio y duración)
+ligado a un id. El span raíz lo abre la API al recibir una petición (o el
+dashboard en cada ejecución del script o de un fragmento) con `begin`/`end`
+o `trace`; el resto del código abre spans hijos con `span`, `traced` o
+`record` (para tiempos ya medidos, como los de los cursores de
+db_postgres.py). Fuera de una traza esas llamadas no hacen nada, así que
+los hilos de fondo (retención, clustering) no generan trazas sueltas.
+
+El span actual vive en `contextvars`: cada hilo y cada petición tiene el
+suyo. Para seguir la traza en otro hilo hay que envolver la función con
+`bind` antes de mandarla al pool.
+
+Propagación: la API adopta el id de la cabecera `X-Trace-Id` de la
+petición (si no viene, genera uno) y lo devuelve en la respuesta, así que
+un cliente puede correlacionar sus propios tiempos con los del servidor.
+
+Exportación: las últimas `TRACE_BUFFER` trazas quedan en memoria (por
+proceso) y, si `TRACE_FILE` está definido, cada traza terminada se añade
+como una línea JSON a ese archivo. `flame` dibuja una traza como texto
+(una barra por span, desplazada según su inicio) y `stage_summary` agrega
+por etapa el tiempo propio (sin contar hijos) para ver cuál domina el p99.
+"""
+import contextvars
+import functools
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TRACING_ENABLED: bool = os.getenv('TRACING_ENABLED', '1').lower() in ('1', 'true', 'yes')
+TRACE_SAMPLE_RATE: float = float(os.getenv('TRACE_SAMPLE_RATE', '1'))
+TRACE_BUFFER: int = int(os.getenv('TRACE_BUFFER', '200'))
+TRACE_FILE: str = os.getenv('TRACE_FILE', '')
+TRACE_MAX_SPANS: int = int(os.getenv('TRACE_MAX_SPANS', '2000'))
+TRACE_HEADER = 'X-Trace-Id'
+
+_VALID_ID = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+
+_current_trace: contextvars.ContextVar[Optional['_Trace']] = contextvars.ContextVar('trace', default=None)
+_current_span: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('span', default=None)
+_finished: Deque[Dict[str, Any]] = deque(maxlen=max(1, TRACE_BUFFER))
+_finished_lock = threading.Lock()
+_file_lock = threading.Lock()
+
+
+class _Trace:
+    """Spans de una traza en curso (pueden llegar desde varios hilos)."""
+
+    def __init__(self, trace_id: str, name: str) -> None:
+        self.trace_id = trace_id
+        self.name = name
+        self.started_at = datetime.now(timezone.utc).isoformat()
+        self.t0 = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self.dropped = 0
+        self.done = False
+        self.lock = threading.Lock()
+
+    def add(self, span_id: str, parent: Optional[str], name: str, started: float, ended: float, attrs: Dict[str, Any]) -> None:
+        entry = {
+            'id': span_id,
+            'parent': parent,
+            'name': name,
+            'start_ms': round((started - self.t0) * 1000, 3),
+            'duration_ms': round((ended - started) * 1000, 3),
+            'thread': threading.current_thread().name,
+        }
+        if attrs:
+            entry['attrs'] = attrs
+        with self.lock:
+            if self.done:
+                return  # El span terminó después que la traza (p. ej. una fuente lenta en segundo plano)
+            if len(self.spans) >= TRACE_MAX_SPANS:
+                self.dropped += 1
+                return
+            self.spans.append(entry)
+
+
+def _new_id(nbytes: int) -> str:
+    return uuid.uuid4().hex[:nbytes * 2]
+
+
+def active() -> bool:
+    """True si hay una traza abierta en este contexto."""
+    return _current_trace.get() is not None
+
+
+def current_trace_id() -> Optional[str]:
+    trace = _current_trace.get()
+    return trace.trace_id if trace is not None else None
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[None]:
+    """Span hijo del span actual; no hace nada fuera de una traza."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    span_id = _new_id(8)
+    parent = _current_span.get()
+    token = _current_span.set(span_id)
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        attrs['error'] = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        trace.add(span_id, parent, name, started, time.perf_counter(), attrs)
+
+
+def record(name: str, started: float, **attrs: Any) -> None:
+    """Registra como span una etapa ya medida (`started` de `time.perf_counter()`, termina ahora)."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(_new_id(8), _current_span.get(), name, started, time.perf_counter(), attrs)
+
+
+def begin(name: str, trace_id: Optional[str] = None, **attrs: Any) -> Optional[tuple]:
+    """Abre una traza nueva con su span raíz (para hooks separados de inicio y fin, como los de Flask).
+
+    Un `trace_id` válido recibido de un cliente se adopta y siempre se
+    muestrea. @returns Token para `end`, o None si la traza no se muestrea.
+    """
+    if not TRACING_ENABLED:
+        return None
+    if trace_id and _VALID_ID.match(trace_id):
+        trace = _Trace(trace_id, name)
+    elif random.random() < TRACE_SAMPLE_RATE:
+        trace = _Trace(_new_id(16), name)
+    else:
+        return None
+    root_id = _new_id(8)
+    return trace, root_id, attrs, _current_trace.set(trace), _current_span.set(root_id)
+
+
+def end(token: Optional[tuple], **attrs: Any) -> Optional[Dict[str, Any]]:
+    """Cierra la traza abierta por `begin` y la exporta. @returns La traza terminada."""
+    if token is None:
+        return None
+    trace, root_id, root_attrs, trace_token, span_token = token
+    ended = time.perf_counter()
+    try:
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+    except ValueError:
+        # Cerrada desde otro contexto (p. ej. al terminar una respuesta en streaming)
+        _current_span.set(None)
+        _current_trace.set(None)
+    root_attrs = {**root_attrs, **attrs}
+    with trace.lock:
+        trace.done = True
+        spans = list(trace.spans)
+    root = {
+        'id': root_id,
+        'parent': None,
+        'name': trace.name,
+        'start_ms': 0.0,
+        'duration_ms': round((ended - trace.t0) * 1000, 3),
+        'thread': threading.current_thread().name,
+    }
+    if root_attrs:
+        root['attrs'] = root_attrs
+    finished = {
+        'trace_id': trace.trace_id,
+        'name': trace.name,
+        'started_at': trace.started_at,
+        'duration_ms': root['duration_ms'],
+        'spans': [root] + sorted(spans, key=lambda s: s['start_ms']),
+    }
+    if trace.dropped:
+        finished['dropped_spans'] = trace.dropped
+    _export(finished)
+    return finished
+
+
+@contextmanager
+def trace(name: str, trace_id: Optional[str] = None, **attrs: Any) -> Iterator[None]:
+    """Span raíz de una traza nueva, o hijo si ya hay una abierta en este contexto."""
+    if _current_trace.get() is not None:
+        with span(name, **attrs):
+            yield
+        return
+    token = begin(name, trace_id, **attrs)
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        end(token, **({'error': error} if error else {}))
+
+
+def traced(name: str, root: bool = False) -> Callable[[Callable], Callable]:
+    """Decorador: ejecuta la función dentro de `span(name)` (o de `trace(name)` con `root=True`)."""
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with (trace(name) if root else span(name)):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def bind(fn: Callable) -> Callable:
+    """Envuelve `fn` para que corra con la traza actual al ejecutarse en otro hilo."""
+    if _current_trace.get() is None:
+        return fn
+    ctx = contextvars.copy_context()
+    return functools.partial(ctx.run, fn)
+
+
+def _export(finished: Dict[str, Any]) -> None:
+    with _finished_lock:
+        _finished.append(finished)
+    if not TRACE_FILE:
+        return
+    line = json.dumps(finished, ensure_ascii=False, default=str)
+    try:
+        with _file_lock, open(TRACE_FILE, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+    except OSError as e:
+        logger.warning('No se pudo escribir la traza en %s: %s', TRACE_FILE, e)
+
+
+def recent(limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Resumen de las trazas terminadas en este proceso, de la más reciente a la más antigua."""
+    with _finished_lock:
+        traces = list(_finished)
+    traces.reverse()
+    if limit:
+        traces = traces[:limit]
+    return [
+        {k: t[k] for k in ('trace_id', 'name', 'started_at', 'duration_ms')} | {'spans': len(t['spans'])}
+        for t in traces
+    ]
+
+
+def get(trace_id: str) -> Optional[Dict[str, Any]]:
+    with _finished_lock:
+        for t in reversed(_finished):
+            if t['trace_id'] == trace_id:
+                return t
+    return None
+
+
+def _self_times(spans: List[Dict[str, Any]]) -> Dict[str, float]:
+    """Tiempo propio de cada span: su duración menos la de sus hijos (de hilos paralelos puede exceder)."""
+    own = {s['id']: s['duration_ms'] for s in spans}
+    for s in spans:
+        if s['parent'] in own:
+            own[s['parent']] -= s['duration_ms']
+    return {k: max(0.0, v) for k, v in own.items()}
+
+
+def flame(finished: Dict[str, Any], width: int = 48) -> str:
+    """Vista de texto de una traza: árbol de spans con una barra proporcional a su inicio y duración."""
+    spans = finished['spans']
+    total = max(finished['duration_ms'], 1e-6)
+    children: Dict[Optional[str], List[Dict[str, Any]]] = {}
+    for s in spans:
+        children.setdefault(s['parent'], []).append(s)
+    own = _self_times(spans)
+    rows = []
+
+    def _walk(s: Dict[str, Any], depth: int) -> None:
+        label = '  ' * depth + s['name']
+        detail = s.get('attrs', {})
+        if 'sql' in detail:
+            label += f" [{detail['sql'][:40]}]"
+        start = int(s['start_ms'] / total * width)
+        length = max(1, round(s['duration_ms'] / total * width))
+        bar = ' ' * min(start, width - 1) + '█' * min(length, width - min(start, width - 1))
+        rows.append((label, s['duration_ms'], own[s['id']], bar))
+        for child in sorted(children.get(s['id'], []), key=lambda c: c['start_ms']):
+            _walk(child, depth + 1)
+
+    for root in children.get(None, []):
+        _walk(root, 0)
+    label_width = min(70, max(len(r[0]) for r in rows)) if rows else 10
+    lines = [f"{'span':<{label_width}} {'total ms':>10} {'propio ms':>10}  {finished['trace_id']}"]
+    for label, duration, self_ms, bar in rows:
+        lines.append(f"{label[:label_width]:<{label_width}} {duration:>10.1f} {self_ms:>10.1f} |{bar:<{width}}|")
+    return '\n'.join(lines)
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+def stage_summary(min_percentile: float = 0, name: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Tiempo propio por etapa en las trazas del buffer, de la que más pesa a la que menos.
+
+    @param min_percentile Sólo las trazas cuya duración está en ese
+        percentil o más (99 = las más lentas, para ver qué domina el p99).
+    @param name Sólo las trazas con ese span raíz (p. ej. 'GET /records').
+    """
+    with _finished_lock:
+        traces = [t for t in _finished if name is None or t['name'] == name]
+    if not traces:
+        return []
+    if min_percentile > 0:
+        cutoff = _percentile([t['duration_ms'] for t in traces], min_percentile)
+        traces = [t for t in traces if t['duration_ms'] >= cutoff]
+    stages: Dict[str, List[float]] = {}
+    total = 0.0
+    for t in traces:
+        total += t['duration_ms']
+        own = _self_times(t['spans'])
+        for s in t['spans']:
+            stages.setdefault(s['name'], []).append(own[s['id']])
+    summary = [
+        {
+            'stage': stage,
+            'count': len(values),
+            'self_ms_total': round(sum(values), 2),
+            'self_ms_p50': round(_percentile(values, 50), 2),
+            'self_ms_p99': round(_percentile(values, 99), 2),
+            'share_pct': round(100 * sum(values) / total, 1) if total else 0.0,
+        }
+        for stage, values in stages.items()
+    ]
+    summary.sort(key=lambda r: r['self_ms_total'], reverse=True)
+    return summary
@@ -0,0 +1,148 @@
+"""Validación y normalización por lotes de registros entrantes.
+
+`validate_records` convierte el lote completo en columnas tipadas con
+operaciones vectorizadas de pandas (fechas ISO 8601, booleanos, lat/lon
+numéricas en rango, `primary_type` conocido) y separa las filas válidas,
+ya normalizadas para `insert_crimes`, de un reporte de errores por fila.
+Así un registro malformado se descarta solo, en lugar de hacer fallar la
+transacción de todo el lote.
+
+numpy y pandas se importan en la primera validación, no al importar el
+módulo: la API lo importa y no debe cargarlos al arrancar cada worker.
+"""
+import os
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+from db_postgres import CRIME_COLUMNS
+
+# Tipos del portal de datos de Chicago y de los datos sintéticos de Arequipa
+# (claves de `CRIME_TYPES_AREQUIPA` en data.py)
+KNOWN_PRIMARY_TYPES: frozenset = frozenset({
+    'ARSON', 'ASSAULT', 'BATTERY', 'BURGLARY', 'CONCEALED CARRY LICENSE VIOLATION',
+    'CRIM SEXUAL ASSAULT', 'CRIMINAL SEXUAL ASSAULT', 'CRIMINAL DAMAGE', 'CRIMINAL TRESPASS',
+    'DECEPTIVE PRACTICE', 'DOMESTIC VIOLENCE', 'GAMBLING', 'HOMICIDE', 'HUMAN TRAFFICKING',
+    'INTERFERENCE WITH PUBLIC OFFICER', 'INTIMIDATION', 'KIDNAPPING', 'LIQUOR LAW VIOLATION',
+    'MOTOR VEHICLE THEFT', 'NARCOTICS', 'NON-CRIMINAL', 'NON - CRIMINAL',
+    'NON-CRIMINAL (SUBJECT SPECIFIED)', 'OBSCENITY', 'OFFENSE INVOLVING CHILDREN',
+    'OTHER NARCOTIC VIOLATION', 'OTHER OFFENSE', 'PROSTITUTION', 'PUBLIC INDECENCY',
+    'PUBLIC PEACE VIOLATION', 'RITUALISM', 'ROBBERY', 'SEX OFFENSE', 'STALKING', 'THEFT',
+    'WEAPONS VIOLATION',
+    'ROBO', 'ASALTO', 'HURTO', 'VANDALISMO', 'VIOLENCIA FAMILIAR', 'ESTAFA',
+}) | frozenset(
+    t.strip().upper() for t in os.getenv('EXTRA_PRIMARY_TYPES', '').split(',') if t.strip()
+)
+
+DATE_COLUMNS: Tuple[str, ...] = ('date', 'updated_on')
+BOOL_COLUMNS: Tuple[str, ...] = ('arrest', 'domestic')
+COORD_RANGES: Dict[str, Tuple[float, float]] = {'latitude': (-90.0, 90.0), 'longitude': (-180.0, 180.0)}
+
+_BOOL_VALUES: Dict[str, bool] = {
+    **{v: True for v in ('true', 't', '1', '1.0', 'yes', 'y', 'si', 'sí')},
+    **{v: False for v in ('false', 'f', '0', '0.0', 'no', 'n')},
+}
+
+
+def _present(s: 'pd.Series') -> 'pd.Series':
+    """Valores no nulos y no vacíos."""
+    return s.notna() & (s.astype(str).str.strip() != '')
+
+
+def _parse_dates(s: 'pd.Series') -> 'pd.Series':
+    import pandas as pd
+
+    try:
+        return pd.to_datetime(s, errors='coerce', format='ISO8601')
+    except (ValueError, TypeError):
+        # Mezcla de zonas horarias: se parsea valor a valor
+        return s.map(lambda v: pd.to_datetime(v, errors='coerce'))
+
+
+def _to_python_datetimes(parsed: 'pd.Series') -> 'pd.Series':
+    import pandas as pd
+
+    # dtype object: si no, pandas vuelve a convertirlos en Timestamp
+    return pd.Series(
+        [None if pd.isna(v) else v.to_pydatetime() for v in parsed],
+        index=parsed.index,
+        dtype=object,
+    )
+
+
+def validate_records(records: List[Any]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Valida y normaliza un lote de registros.
+
+    @param records Lista de diccionarios (JSON de la API o `to_dict(orient='records')`).
+    @returns Tupla `(validos, errores)`: los registros válidos normalizados
+        (fechas como `datetime`, booleanos, floats, `primary_type` en
+        mayúsculas) y, por cada fila rechazada, `{'index', 'id', 'errors'}`
+        con un mensaje por campo.
+    """
+    if not records:
+        return [], []
+    import numpy as np
+    import pandas as pd
+
+    problems: Dict[int, Dict[str, str]] = {}
+
+    def _flag(mask: Any, field: str, message: str) -> None:
+        for i in np.flatnonzero(np.asarray(mask, dtype=bool)):
+            problems.setdefault(int(i), {})[field] = message
+
+    is_dict = np.array([isinstance(r, dict) for r in records])
+    _flag(~is_dict, 'record', 'expected a JSON object')
+    df = pd.DataFrame.from_records(
+        [r if isinstance(r, dict) else {} for r in records],
+        columns=CRIME_COLUMNS,
+    ).astype(object)
+
+    ids = df['id']
+    _flag(is_dict & ~_present(ids).to_numpy(), 'id', 'missing id')
+    df['id'] = ids.where(ids.isna(), ids.astype(str).str.strip())
+
+    for col in DATE_COLUMNS:
+        parsed = _parse_dates(df[col])
+        _flag(_present(df[col]) & parsed.isna(), col, 'invalid ISO 8601 datetime')
+        df[col] = _to_python_datetimes(parsed)
+
+    for col in BOOL_COLUMNS:
+        raw = df[col]
+        coerced = raw.astype(str).str.strip().str.lower().map(_BOOL_VALUES)
+        _flag(_present(raw) & coerced.isna(), col, 'expected a boolean')
+        df[col] = coerced.where(coerced.notna(), None)
+
+    for col, (low, high) in COORD_RANGES.items():
+        raw = df[col]
+        num = pd.to_numeric(raw, errors='coerce')
+        _flag(_present(raw) & num.isna(), col, 'expected a number')
+        _flag(num.notna() & ~num.between(low, high), col, f'out of range [{low}, {high}]')
+        df[col] = num.astype(object).where(num.notna(), None)
+
+    year = pd.to_numeric(df['year'], errors='coerce')
+    _flag(_present(df['year']) & (year.isna() | (year % 1 != 0)), 'year', 'expected an integer')
+    df['year'] = pd.Series([None if pd.isna(v) else int(v) for v in year], index=df.index, dtype=object)
+
+    types = df['primary_type']
+    types = types.where(~_present(types), types.astype(str).str.strip().str.upper())
+    _flag(_present(types) & ~types.isin(KNOWN_PRIMARY_TYPES), 'primary_type', 'unknown primary_type')
+    df['primary_type'] = types.where(_present(types), None)
+
+    valid_mask = np.ones(len(df), dtype=bool)
+    valid_mask[list(problems)] = False
+    valid_df = df[valid_mask]
+    valid_df = valid_df.where(valid_df.notna(), None)
+    # Más rápido que to_dict(orient='records'), que convierte valor a valor
+    columns = [valid_df[c].tolist() for c in CRIME_COLUMNS]
+    valid = [dict(zip(CRIME_COLUMNS, row)) for row in zip(*columns)]
+
+    errors = [
+        {
+            'index': i,
+            'id': records[i].get('id') if isinstance(records[i], dict) else None,
+            'errors': problems[i],
+        }
+        for i in sorted(problems)
+    ]
+    return valid, errors
@@ -4,48 +4,160 @@
 
 @returns None. Muestra el gráfico directamente en Streamlit.
 """
+import os
+import numpy as np
 import streamlit as st
 import pandas as pd
-from typing import Any
-try:
-    import pydeck as pdk
-    PDK_AVAILABLE: bool = True
-except Exception:
-    PDK_AVAILABLE: bool = False
+from typing import Any, Callable, Optional, Tuple
 
+# Máximo de puntos enviados al navegador por mapa (nivel de detalle)
+MAP_POINT_BUDGET: int = int(os.getenv('MAP_POINT_BUDGET', '5000'))
+LOD_GRID_SIZE: int = 64
 
-def show_primary_type_bar(df: pd.DataFrame) -> None:
+_pdk: Any = None
+_pdk_checked: bool = False
+
+
+def _load_pydeck() -> Optional[Any]:
+    """Importa pydeck la primera vez que se dibuja un mapa (None si no está instalado)."""
+    global _pdk, _pdk_checked
+    if not _pdk_checked:
+        try:
+            import pydeck
+            _pdk = pydeck
+        except Exception:
+            _pdk = None
+        _pdk_checked = True
+    return _pdk
+
+
+def show_primary_type_bar(df: pd.DataFrame, data_version: Optional[str] = None) -> None:
     st.subheader('Conteo por Primary Type')
-    counts = df['primary_type'].fillna('UNKNOWN').value_counts().rename_axis('primary_type').reset_index(name='counts')
+    counts = cached_by_version(
+        'primary_type_counts',
+        data_version,
+        lambda: df['primary_type'].fillna('UNKNOWN').value_counts().rename_axis('primary_type').reset_index(name='counts'),
+    )
     st.bar_chart(counts.set_index('primary_type'))
 
 
+""""Reduce los puntos a un presupuesto fijo con muestreo estratificado por grilla.
+
+Divide la extensión visible de los datos en una grilla de `grid_size` x `grid_size`
+celdas y asigna a cada celda una cuota proporcional a su número de incidentes
+(mínimo 1), eligiendo los puntos al azar dentro de cada celda con semilla fija
+para que el resultado sea estable entre reruns. Cada punto conservado lleva una
+columna `weight` = incidentes de su celda / puntos conservados, de modo que las
+sumas ponderadas por celda (densidad de hotspots) se mantienen.
+
+@param mdf DataFrame con columnas 'latitude' y 'longitude' sin nulos.
+@param budget Número máximo de puntos a conservar.
+@param grid_size Celdas por lado de la grilla.
+
+@returns Tupla (DataFrame reducido con columna 'weight', cantidad de puntos omitidos).
+"""
+def reduce_points(mdf: pd.DataFrame, budget: int = MAP_POINT_BUDGET, grid_size: int = LOD_GRID_SIZE) -> Tuple[pd.DataFrame, int]:
+    n = len(mdf)
+    if n <= budget:
+        return mdf.assign(weight=1.0), 0
+
+    lat = mdf['latitude'].to_numpy(dtype=float)
+    lon = mdf['longitude'].to_numpy(dtype=float)
+    lat_span = max(lat.max() - lat.min(), 1e-9)
+    lon_span = max(lon.max() - lon.min(), 1e-9)
+    gy = np.minimum(((lat - lat.min()) / lat_span * grid_size).astype(np.int64), grid_size - 1)
+    gx = np.minimum(((lon - lon.min()) / lon_span * grid_size).astype(np.int64), grid_size - 1)
+    cell = gy * grid_size + gx
+
+    cells, inverse, counts = np.unique(cell, return_inverse=True, return_counts=True)
+    quota = np.maximum(1, np.floor(counts * (budget / n))).astype(np.int64)
+    # Las cuotas mínimas de 1 pueden pasarse del presupuesto: recortar las celdas más pobladas
+    excess = int(quota.sum()) - budget
+    if excess > 0:
+        order = np.argsort(-quota, kind='stable')
+        for idx in order:
+            if excess <= 0:
+                break
+            take = min(excess, int(quota[idx]) - 1)
+            quota[idx] -= take
+            excess -= take
+
+    # Rango aleatorio (estable) de cada punto dentro de su celda
+    rng = np.random.default_rng(0)
+    order = np.lexsort((rng.random(n), inverse))
+    sorted_cells = inverse[order]
+    starts = np.searchsorted(sorted_cells, np.arange(len(cells)))
+    rank = np.empty(n, dtype=np.int64)
+    rank[order] = np.arange(n) - starts[sorted_cells]
+
+    keep = rank < quota[inverse]
+    weights = counts[inverse[keep]] / quota[inverse[keep]]
+    reduced = mdf.loc[keep].assign(weight=weights.astype(float))
+    return reduced, n - int(keep.sum())
+
+
+def cached_by_version(kind: str, data_version: Optional[str], compute: Callable[[], Any]) -> Any:
+    """Calcula `compute()` una vez por tipo de gráfico y versión de datos (caché en la sesión).
+
+    Sin `data_version` no se cachea. Sólo se guarda la última versión de cada tipo.
+    """
+    if data_version is None:
+        return compute()
+    cache = st.session_state.setdefault('_viz_cache', {})
+    entry = cache.get(kind)
+    if entry is None or entry[0] != data_version:
+        entry = (data_version, compute())
+        cache[kind] = entry
+    return entry[1]
+
+
 """"Muestra un mapa con puntos y zonas de calor de los delitos registrados.
 
+Los puntos enviados al navegador se reducen a `MAP_POINT_BUDGET` con
+`reduce_points`; los hotspots se calculan siempre sobre todos los puntos.
+
 @param df DataFrame con coordenadas de delitos (columnas 'latitude' y 'longitude').
 @param heat_threshold Umbral mínimo de incidentes para considerar una zona como punto caliente.
+@param data_version Versión de los datos de `df`; si se indica, el conjunto reducido se cachea.
 
 @returns None. Muestra el mapa directamente en Streamlit.
 """
-def show_map_points_and_heat(df: pd.DataFrame, heat_threshold: int = 50) -> None:
+def show_map_points_and_heat(df: pd.DataFrame, heat_threshold: int = 50, data_version: Optional[str] = None) -> None:
     st.subheader('Mapa de puntos y calor')
-    mdf = df.dropna(subset=['latitude', 'longitude']).copy()
+    mdf = df.dropna(subset=['latitude', 'longitude'])
     if mdf.empty:
         st.info('No hay coordenadas válidas para mostrar')
         return
 
+    points, dropped = cached_by_version(
+        'lod',
+        f'{data_version}:{MAP_POINT_BUDGET}' if data_version is not None else None,
+        lambda: reduce_points(mdf),
+    )
+    if dropped:
+        st.caption(
+            f'Mostrando {len(points)} de {len(mdf)} puntos '
+            f'({dropped} omitidos por nivel de detalle; la densidad se conserva con pesos).'
+        )
+
     #  map
-    st.map(mdf.rename(columns={'latitude': 'lat', 'longitude': 'lon'})[['lat', 'lon']])
+    plot = points[['latitude', 'longitude', 'weight']].rename(columns={'latitude': 'lat', 'longitude': 'lon'})
+    st.map(plot[['lat', 'lon']])
 
     # agregación por hex para detectar hotspots
-    if PDK_AVAILABLE:
+    pdk = _load_pydeck()
+    if pdk is not None:
         try:
             # usa pydeck HexagonLayer
             view_state = pdk.ViewState(latitude=mdf['latitude'].mean(), longitude=mdf['longitude'].mean(), zoom=10, pitch=40)
             hex_layer = pdk.Layer(
                 "HexagonLayer",
-                data=mdf[['latitude', 'longitude']].rename(columns={'latitude': 'lat', 'longitude': 'lon'}),
+                data=plot,
                 get_position='[lon, lat]',
+                get_elevation_weight='weight',
+                get_color_weight='weight',
+                elevation_aggregation='SUM',
+                color_aggregation='SUM',
                 radius=200,
                 elevation_scale=50,
                 elevation_range=[0, 3000],
@@ -58,15 +170,19 @@ def show_map_points_and_heat(df: pd.DataFrame, heat_threshold: int = 50) -> None
         except Exception as e:
             st.write('No se pudo generar mapa avanzado con pydeck:', e)
     else:
-        st.info('pydeck no está disponible: mostrando mapa básico')
-        st.map(mdf.rename(columns={'latitude': 'lat', 'longitude': 'lon'})[['lat', 'lon']])
+        st.info('pydeck no está disponible: mostrando sólo el mapa básico')
 
-    try:
-        bins = mdf.copy()
-        bins['lat_bin'] = bins['latitude'].round(2)
-        bins['lon_bin'] = bins['longitude'].round(2)
+    def _hotspots() -> pd.DataFrame:
+        bins = pd.DataFrame({'lat_bin': mdf['latitude'].round(2), 'lon_bin': mdf['longitude'].round(2)})
         grouped = bins.groupby(['lat_bin', 'lon_bin']).size().reset_index(name='count')
-        hotspots = grouped[grouped['count'] > heat_threshold]
+        return grouped[grouped['count'] > heat_threshold]
+
+    try:
+        hotspots = cached_by_version(
+            'hotspots',
+            f'{data_version}:{heat_threshold}' if data_version is not None else None,
+            _hotspots,
+        )
         if not hotspots.empty:
             st.warning(f'Se detectaron {len(hotspots)} zonas con más de {heat_threshold} delitos (coarse bins).')
             st.dataframe(hotspots)
@@ -80,10 +196,14 @@ def show_map_points_and_heat(df: pd.DataFrame, heat_threshold: int = 50) -> None
 
 @returns None. Muestra el gráfico directamente en Streamlit.
 """
-def show_additional_charts(df: pd.DataFrame) -> None:
+def show_additional_charts(df: pd.DataFrame, data_version: Optional[str] = None) -> None:
     st.subheader('Top 10 ubicaciones')
     try:
-        top = df['location_description'].fillna('UNKNOWN').value_counts().head(10)
+        top = cached_by_version(
+            'top_locations',
+            data_version,
+            lambda: df['location_description'].fillna('UNKNOWN').value_counts().head(10),
+        )
         st.bar_chart(top)
     except Exception:
         st.write('No se pudo generar top ubicaciones')